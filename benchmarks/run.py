@@ -0,0 +1,248 @@
+"""
+Benchmark a webslit server on synthetic trees, with a local load generator; results are emitted as JSON:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --baseline before.json
+
+Measures listing latency (/_entry paging, cold and cached), worker spawn latency (to the first websocket frame),
+PTY-to-websocket throughput and the server's memory. A stub `slit` (see benchmarks/stubs) stands in for the real one.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from urllib.parse import urlencode
+
+from tornado.ioloop import IOLoop
+from tornado.httpclient import AsyncHTTPClient
+from tornado.websocket import websocket_connect
+from tornado import gen
+
+from .trees import make_tree, get_spec
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+STARTUP_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return dict(
+        n=len(samples), min=samples[0], median=statistics.median(samples),
+        p95=samples[min(len(samples) - 1, int(len(samples) * 0.95))], max=samples[-1])
+
+
+def get_memory(pid):
+    memory = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                memory[key] = int(value.split()[0]) * 1024
+    return memory
+
+
+class Server():
+
+    def __init__(self, files, port, work_dir):
+        self.port = port
+        self.base = f"http://127.0.0.1:{port}"
+        env = dict(
+            os.environ,
+            PATH=f"{os.path.join(HERE, 'stubs')}:{os.environ['PATH']}",
+            WEBSLIT_CACHE_DIR=os.path.join(work_dir, "cache"))
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.join(REPO, "run.py"), f"--files={files}", f"--port={port}",
+             "--address=127.0.0.1", "--xsrf=False", "--logging=warning"],
+            env=env, cwd=REPO)
+
+    async def wait_ready(self):
+        client = AsyncHTTPClient()
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                await client.fetch(f"{self.base}/_active_sessions")
+                return
+            except Exception:
+                if time.monotonic() > deadline or self.proc.poll() is not None:
+                    raise RuntimeError("webslit did not start")
+                await gen.sleep(0.1)
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class LoadGenerator():
+
+    def __init__(self, server, concurrency):
+        self.server = server
+        self.concurrency = concurrency
+        self.client = AsyncHTTPClient(max_clients=max(10, concurrency * 2))
+
+    async def entry(self, path, offset=0):
+        query = urlencode(dict(path=path, offset=offset))
+        response = await self.client.fetch(f"{self.server.base}/_entry?{query}", request_timeout=600)
+        return json.loads(response.body)
+
+    async def list_dir(self, path):
+        """
+        Page through a listing, as the explorer does; returns (first page, complete, entries) latencies
+        """
+        start = time.perf_counter()
+        result = await self.entry(path)
+        first = time.perf_counter() - start
+        entries = len(result["entries"])
+        while result.get("incomplete"):
+            await gen.sleep(0.05)
+            result = await self.entry(path, entries)
+            if result.get("reset"):
+                entries = 0
+            entries += len(result["entries"])
+        return first, time.perf_counter() - start, entries
+
+    async def open_file(self, path):
+        """
+        Spawn a worker on the file and read its websocket to the end; returns (spawn latency, duration, bytes)
+        """
+        start = time.perf_counter()
+        result = await self.entry(path)
+        if not result.get("worker_id"):
+            raise RuntimeError(f"No worker for {path}: {result.get('error') or result}")
+        ws = await websocket_connect(f"ws://127.0.0.1:{self.server.port}/_ws?id={result['worker_id']}")
+        first = None
+        received = 0
+        while True:
+            msg = await ws.read_message()
+            if msg is None:
+                break
+            if first is None:
+                first = time.perf_counter() - start
+            received += len(msg)
+        return first, time.perf_counter() - start, received
+
+    async def run_concurrently(self, func, args_list):
+        results = []
+
+        async def run(args):
+            results.append(await func(*args))
+
+        for i in range(0, len(args_list), self.concurrency):
+            await gen.multi([run(args) for args in args_list[i:i + self.concurrency]])
+        return results
+
+
+async def benchmark_listings(load, spec, repeat):
+    results = {}
+    targets = [("flat", "/flat/")]
+    if spec["nested"]:
+        targets += [("nested", "/nested/"), ("nested_leaf", "/nested/d000/")]
+    for name, path in targets:
+        cold = await load.list_dir(path)  # nothing cached yet
+        cached = await load.run_concurrently(load.list_dir, [(path,)] * repeat)
+        results[name] = dict(
+            entries=cold[2],
+            cold_first_page=cold[0], cold_complete=cold[1],
+            cached_first_page=summarize([r[0] for r in cached]),
+            cached_complete=summarize([r[1] for r in cached]))
+    return results
+
+
+async def benchmark_spawns(load, repeat):
+    results = {}
+    for name in ("app.log", "app.log.gz", "app.log.zst"):
+        try:
+            runs = await load.run_concurrently(load.open_file, [(f"/logs/{name}",)] * repeat)
+        except RuntimeError as exc:
+            logging.warning(f"Skipping {name}: {exc}")
+            continue
+        results[name] = dict(
+            first_frame=summarize([r[0] for r in runs]),
+            duration=summarize([r[1] for r in runs]),
+            bytes=runs[0][2],
+            throughput_mb_s=summarize([r[2] / r[1] / 1024 / 1024 for r in runs]))
+    return results
+
+
+def compare(results, baseline, prefix=""):
+    # the relative change of every number that's in both, i.e. 'listings.flat.cold_complete: +12.5%'
+    for key, value in results.items():
+        old = baseline.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            yield from compare(value, old, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            yield f"{prefix}{key}", old, value, (value - old) / old * 100
+
+
+async def run(args):
+    spec = get_spec(quick=args.quick, log_mb=args.log_mb)
+    files = make_tree(os.path.join(args.work_dir, "tree"), spec)
+    server = Server(files, args.port or free_port(), args.work_dir)
+    try:
+        await server.wait_ready()
+        idle_memory = get_memory(server.proc.pid)
+        load = LoadGenerator(server, args.concurrency)
+        listings = await benchmark_listings(load, spec, args.repeat)
+        spawns = await benchmark_spawns(load, args.repeat)
+        memory = dict(idle=idle_memory, loaded=get_memory(server.proc.pid))
+    finally:
+        server.stop()
+
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO, stdout=subprocess.PIPE, universal_newlines=True)
+    return dict(
+        meta=dict(
+            commit=commit.stdout.strip(), python=platform.python_version(), host=platform.node(),
+            time=time.strftime("%Y-%m-%dT%H:%M:%S"), spec=spec, concurrency=args.concurrency, repeat=args.repeat),
+        listings=listings, spawns=spawns, memory=memory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--work-dir", default="/tmp/webslit-benchmarks", help="Where the trees (and caches) go")
+    parser.add_argument("--quick", action="store_true", help="Skip the 1M-entry tree")
+    parser.add_argument("--log-mb", type=int, default=64, help="Size of the generated logs")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=0, help="Default: any free port")
+    parser.add_argument("--output", help="Write the results here (default: stdout)")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    args = parser.parse_args(argv)
+
+    results = IOLoop.current().run_sync(lambda: run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, old, new, change in compare(results, baseline):
+            if key.startswith("meta."):
+                continue
+            print(f"{key:60} {old:12.4g} -> {new:12.4g} ({change:+.1f}%)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Synthetic file trees for the benchmarks - generated once under the work directory, and reused for as long as
+their spec is unchanged:
+
+    flat/                   10k files in a single directory
+    nested/dNNN/            1M files, 1000 directories of 1000 (skipped with --quick)
+    logs/                   timestamped logs - plain, gzip'd and zstd'd
+    .meteorite files        at the root and along the nested directories
+"""
+import os
+import json
+import gzip
+import shutil
+import logging
+import subprocess
+
+
+SPEC_FILE = ".benchmark-tree"
+LOG_LINE = "2020-01-31 {h:02}:{m:02}:{s:02}.{ms:03} {level} [worker-{w}] request {i} handled in {ms}ms\n"
+LEVELS = ["INFO"] * 17 + ["WARNING"] * 2 + ["ERROR"]
+
+
+def get_spec(quick=False, log_mb=64):
+    return dict(flat=10_000, nested=0 if quick else 1000, nested_files=1000, log_mb=log_mb, version=1)
+
+
+def write_meteorite(path, **meta):
+    with open(os.path.join(path, ".meteorite"), "w") as f:
+        json.dump(meta, f)
+
+
+def make_files(path, count, prefix="file"):
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        open(os.path.join(path, f"{prefix}-{i:07}.txt"), "w").close()
+
+
+def make_log(path, size):
+    written = i = 0
+    with open(path, "w") as f:
+        while written < size:
+            t = i // 10
+            line = LOG_LINE.format(
+                h=t // 3600 % 24, m=t // 60 % 60, s=t % 60, ms=i % 1000,
+                level=LEVELS[i % len(LEVELS)], w=i % 8, i=i)
+            f.write(line)
+            written += len(line)
+            i += 1
+
+
+def make_tree(root, spec):
+    try:
+        with open(os.path.join(root, SPEC_FILE)) as f:
+            if json.load(f) == spec:
+                return root
+    except (OSError, ValueError):
+        pass
+
+    logging.warning(f"Generating benchmark tree at {root}: {spec}")
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    write_meteorite(root, title="webslit benchmarks")
+
+    make_files(os.path.join(root, "flat"), spec["flat"])
+
+    nested = os.path.join(root, "nested")
+    os.makedirs(nested)
+    write_meteorite(nested, finished_at="2020-01-31T14:32:05")
+    for d in range(spec["nested"]):
+        path = os.path.join(nested, f"d{d:03}")
+        make_files(path, spec["nested_files"])
+        write_meteorite(path, index=d)
+
+    logs = os.path.join(root, "logs")
+    os.makedirs(logs)
+    log = os.path.join(logs, "app.log")
+    make_log(log, spec["log_mb"] * 1024 * 1024)
+    with open(log, "rb") as src, gzip.open(f"{log}.gz", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+    if shutil.which("zstd"):
+        subprocess.run(["zstd", "-q", "-f", log, "-o", f"{log}.zst"], check=True)
+
+    with open(os.path.join(root, SPEC_FILE), "w") as f:
+        json.dump(spec, f)
+    return root
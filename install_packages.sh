@@ -14,7 +14,8 @@ apt-get -y install apt-transport-https \
      pv nano \
      tshark tcpdump \
      zstd psmisc file \
-     software-properties-common
+     software-properties-common \
+     gcc libcurl4-openssl-dev libssl-dev
 
 apt-get clean
 
@@ -0,0 +1,58 @@
+import pytest
+
+from webslit import analyzer, utils
+from webslit.analyzer import Analyzer
+
+
+class FakeExecutor():
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, func, *args):
+        self.tasks.append((func, args))
+
+    def run(self):
+        for func, args in self.tasks:
+            func(*args)
+        self.tasks = []
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+    return FakeExecutor()
+
+
+@pytest.fixture
+def subject(executor):
+    subject = Analyzer()
+    subject.executor = executor
+    return subject
+
+
+def test_analyzed_in_the_background(tmp_path, executor, subject):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"2020-01-31 14:00:00 INFO up\n2020-01-31 14:00:01 ERROR down\n")
+    assert subject.get(path) is None
+    assert subject.get(path) is None  # still queued - and not queued again
+    assert len(executor.tasks) == 1
+
+    executor.run()
+    analysis = subject.get(path)
+    assert (analysis['lines'], analysis['errors'], analysis['info']) == (2, 1, 1)
+    assert [offset for offset, ts in analysis['jumps']] == [28]  # of the ERROR line
+    assert not executor.tasks
+
+
+def test_failed_analysis_is_not_retried(tmp_path, executor, subject, monkeypatch):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"2020-01-31 14:00:00 INFO up\n")
+
+    def fail(path):
+        raise ValueError("unreadable")
+    monkeypatch.setattr(analyzer, "analyze", fail)
+    subject.get(path)
+    executor.run()
+    assert subject.get(path) is False
+    assert not executor.tasks
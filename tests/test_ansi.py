@@ -0,0 +1,66 @@
+import pytest
+
+from webslit.ansi import strip_ansi, visible_len, visible_slice, AnsiStripper, strip_ansi_stream, ansistr, colorize
+
+RED = "\x1b[31mred\x1b[0m plain \x1b[1;32;40mgreen\x1b[m"
+
+
+def test_strip_ansi():
+    assert strip_ansi(RED) == "red plain green"
+    assert strip_ansi(RED.encode()) == b"red plain green"
+    assert strip_ansi("\x1b[2J\x1b[10;20Hmoved\x1b[?25l") == "moved"
+    assert strip_ansi("\x9b31mcsi") == "csi"
+
+
+def test_strip_ansi_keeps_utf8():
+    # 'Û' is '\xc3\x9b' in utf-8 - which isn't a CSI, in bytes
+    assert strip_ansi("Û\x1b[0m".encode()) == "Û".encode()
+
+
+def test_visible_len():
+    assert visible_len(RED) == len("red plain green")
+    assert visible_len(RED.encode()) == len("red plain green")
+    assert visible_len("") == 0
+
+
+@pytest.mark.parametrize("start, stop", [(0, None), (1, 5), (2, 3), (4, 9), (-5, None), (3, -3), (10, 100), (5, 2)])
+def test_visible_slice(start, stop):
+    sliced = visible_slice(RED, start, stop)
+    assert strip_ansi(sliced) == "red plain green"[start:stop]
+    assert visible_slice(RED.encode(), start, stop) == sliced.encode()
+
+
+def test_visible_slice_keeps_colors():
+    assert visible_slice(RED, 1, 5) == "\x1b[31med\x1b[0m p\x1b[1;32;40m\x1b[m"
+
+
+def test_ansistr():
+    s = ansistr(colorize("hello", "red") + " world")
+    assert len(s) == 11
+    assert strip_ansi(s[6]) == "w"
+    assert strip_ansi(s[-1]) == "d"
+    assert strip_ansi(str(s[1:4])) == "ell"
+    assert len(s + "!") == 12
+    with pytest.raises(IndexError):
+        s[11]
+
+
+def test_stripper_split_escape():
+    data = RED.encode() * 3
+    for i in range(len(data)):
+        stripper = AnsiStripper()
+        out = stripper.feed(data[:i]) + stripper.feed(data[i:]) + stripper.flush()
+        assert out == b"red plain green" * 3, i
+
+
+def test_stripper_byte_by_byte():
+    data = RED.encode()
+    assert b"".join(strip_ansi_stream(data[i:i + 1] for i in range(len(data)))) == b"red plain green"
+
+
+def test_stripper_unterminated():
+    # what never turned out to be an escape sequence is let through
+    stripper = AnsiStripper()
+    assert stripper.feed(b"text\x1b[12") == b"text"
+    assert stripper.flush() == b"\x1b[12"
+    assert stripper.feed(b"\x1b" + b"x" * 100) == b"\x1b" + b"x" * 100
@@ -0,0 +1,140 @@
+import json
+import queue
+import asyncio
+from http.server import BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from tornado.ioloop import IOLoop
+from tornado.gen import with_timeout
+
+from webslit import docker_registry
+from webslit.docker_registry import ContainerRegistry
+
+TIMEOUT = 5  # seconds
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    # just enough of the docker API for the registry: the version, container listings, and the events stream
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        docker = self.server
+        if url.path.endswith("/version"):
+            self.send_json(dict(ApiVersion="1.41", Version="20.10.0"))
+        elif url.path.endswith("/containers/json"):
+            filters = json.loads(parse_qs(url.query).get("filters", ["{}"])[0])
+            ids = filters.get("id")
+            self.send_json([
+                info for cid, info in docker.containers.items()
+                if not ids or any(cid.startswith(i) for i in ids)])
+        elif url.path.endswith("/events"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                event = docker.events.get()
+                if event is None:
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.close_connection = True
+                    return
+                data = json.dumps(event).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+        else:
+            self.send_error(404)
+
+
+class FakeDocker(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.containers = {}
+        self.events = queue.Queue()
+        super().__init__(path, FakeDockerHandler)
+
+    def start(self, cid, name):
+        self.containers[cid] = dict(Id=cid, Names=[f"/{name}"], Image="busybox", Created=1580000000, State="running")
+        self.events.put(dict(status="start", id=cid, Type="container"))
+
+    def die(self, cid):
+        del self.containers[cid]
+        self.events.put(dict(Action="die", Actor=dict(ID=cid), Type="container"))
+
+
+@pytest.fixture
+def docker(tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_registry, "RETRY_INTERVAL", 0.5)
+    server = FakeDocker(str(tmp_path / "docker.sock"))
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()  # the registry's thread stays on the events stream, which is never ended
+
+
+def names(registry):
+    return sorted(c.name for c in registry.get_containers())
+
+
+async def changed(registry):
+    await with_timeout(IOLoop.current().time() + TIMEOUT, registry.changed.wait())
+
+
+def run(test, docker):
+    async def main():
+        registry = ContainerRegistry(IOLoop.current(), f"unix://{docker.server_address}")
+        await with_timeout(IOLoop.current().time() + TIMEOUT, registry.ready.wait())
+        await test(registry, docker)
+    asyncio.run(main())
+
+
+def test_snapshot_and_events(docker):
+    async def test(registry, docker):
+        assert names(registry) == ["web"]
+        assert registry.error is None
+
+        docker.start("b" * 64, "db")
+        await changed(registry)
+        assert names(registry) == ["db", "web"]
+        assert {c.id: c.image for c in registry.get_containers()}["b" * 64] == "busybox"
+
+        version = registry.version
+        docker.events.put(dict(status="exec_start", id="b" * 64, Type="container"))  # not one that matters
+        docker.die("a" * 64)
+        await changed(registry)
+        assert names(registry) == ["db"]
+        assert registry.version == version + 1
+
+    docker.containers["a" * 64] = dict(Id="a" * 64, Names=["/web"], Image="nginx", Created=1580000000)
+    run(test, docker)
+
+
+def test_reconnects(docker):
+    async def test(registry, docker):
+        # the daemon goes away, and a container starts meanwhile
+        docker.containers["c" * 64] = dict(Id="c" * 64, Names=[], Image="redis", Created=1580000000)
+        docker.events.put(None)
+        await changed(registry)
+        assert registry.error == "docker events stream ended"
+        assert names(registry) == []
+
+        await changed(registry)  # back, with a new snapshot
+        assert registry.error is None
+        assert names(registry) == ["c" * 12]
+
+    run(test, docker)
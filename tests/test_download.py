@@ -0,0 +1,145 @@
+import os
+import gzip
+import asyncio
+
+import pytest
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+from tornado.testing import bind_unused_port
+
+from webslit import handler
+from webslit.handler import DownloadHandler, COMPRESS_MIN_SIZE
+from webslit.file_handlers import StaticFileHandler
+
+if "html" not in {t.name for t in StaticFileHandler.TYPES}:
+    StaticFileHandler.register(["html"])
+
+REPORT = b"<html>" + b"a report " * COMPRESS_MIN_SIZE + b"</html>"
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(name, data, mtime=None):
+        path = tmp_path / name
+        path.write_bytes(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+    write("data.bin", bytes(range(256)) * 4)
+    return write
+
+
+@pytest.fixture
+def get(tmp_path):
+    def get(name, **headers):
+        return asyncio.run(fetch(name, headers))
+
+    async def fetch(name, headers):
+        app = tornado.web.Application([(r"/static-files/(.*)", DownloadHandler, dict(path=str(tmp_path)))])
+        sock, port = bind_unused_port()
+        server = HTTPServer(app)
+        server.add_sockets([sock])
+        client = AsyncHTTPClient(force_instance=True)
+        try:
+            return await client.fetch(
+                f"http://127.0.0.1:{port}/static-files/{name}", headers=headers, decompress_response=False,
+                raise_error=False)
+        finally:
+            client.close()
+            server.stop()
+    return get
+
+
+def test_whole(tmp_path, write, get):
+    response = get("data.bin")
+    assert response.code == 200
+    assert response.body == bytes(range(256)) * 4
+    assert response.headers["Accept-Ranges"] == "bytes"
+    st = os.stat(tmp_path / "data.bin")
+    assert response.headers["Etag"] == f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def test_streamed_in_chunks(write, get, monkeypatch):
+    monkeypatch.setattr(handler, "DOWNLOAD_CHUNK", 100)
+    response = get("data.bin", Range="bytes=10-")
+    assert response.body == (bytes(range(256)) * 4)[10:]
+
+
+def test_etag(write, get):
+    etag = get("data.bin").headers["Etag"]
+    assert get("data.bin", **{"If-None-Match": etag}).code == 304
+    write("data.bin", b"changed", mtime=1234567890)
+    response = get("data.bin", **{"If-None-Match": etag})
+    assert response.code == 200
+    assert response.headers["Etag"] != etag
+
+
+def test_range(write, get):
+    response = get("data.bin", Range="bytes=2-5")
+    assert response.code == 206
+    assert response.body == bytes([2, 3, 4, 5])
+    assert response.headers["Content-Range"] == "bytes 2-5/1024"
+    assert response.headers["Content-Length"] == "4"
+
+
+def test_suffix_range(write, get):
+    response = get("data.bin", Range="bytes=-3")
+    assert response.code == 206
+    assert response.body == bytes([253, 254, 255])
+    assert response.headers["Content-Range"] == "bytes 1021-1023/1024"
+
+
+def test_whole_range(write, get):
+    response = get("data.bin", Range="bytes=0-")
+    assert response.code == 200
+    assert len(response.body) == 1024
+
+
+def test_unsatisfiable_range(write, get):
+    response = get("data.bin", Range="bytes=2000-")
+    assert response.code == 416
+    assert response.headers["Content-Range"] == "bytes */1024"
+
+
+def test_precompressed_sibling(write, get):
+    write("report.html", REPORT, mtime=1000)
+    write("report.html.gz", gzip.compress(REPORT), mtime=2000)
+    write("report.html.br", b"brotli, supposedly", mtime=2000)
+    response = get("report.html", **{"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.headers["Content-Type"].startswith("text/html")
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.body == b"brotli, supposedly"
+
+    response = get("report.html", **{"Accept-Encoding": "gzip;q=1.0"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.body) == REPORT
+
+    response = get("report.html")
+    assert "Content-Encoding" not in response.headers
+    assert response.body == REPORT
+
+
+def test_stale_sibling_is_ignored(write, get):
+    write("report.html", REPORT, mtime=2000)
+    write("report.html.gz", gzip.compress(b"an older report"), mtime=1000)
+    response = get("report.html", **{"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"  # compressed on the fly, instead
+    assert gzip.decompress(response.body) == REPORT
+
+
+def test_etag_by_encoding(write, get):
+    write("report.html", REPORT)
+    gzipped = get("report.html", **{"Accept-Encoding": "gzip"})
+    plain = get("report.html")
+    assert gzipped.headers["Etag"] != plain.headers["Etag"]
+    headers = {"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["Etag"]}
+    assert get("report.html", **headers).code == 304
+
+
+def test_small_report_is_not_compressed(write, get):
+    write("tiny.html", b"<html></html>")
+    response = get("tiny.html", **{"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.body == b"<html></html>"
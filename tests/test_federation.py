@@ -0,0 +1,26 @@
+import asyncio
+import logging
+
+from webslit.federation import Federation, parse_siblings
+
+
+def test_parse_siblings():
+    siblings = parse_siblings("node2:8888, https://node3/,")
+    assert [(s.name, s.url) for s in siblings] == [("node2:8888", "http://node2:8888"), ("node3", "https://node3")]
+
+
+def test_no_client_without_siblings(caplog):
+    with caplog.at_level(logging.WARNING):
+        federation = Federation([])
+    assert not federation
+    assert federation.client is None
+    assert not caplog.records
+
+
+def test_client_for_siblings():
+    async def main():
+        federation = Federation(parse_siblings("node2:8888"))
+        assert federation
+        assert federation.client is not None
+        federation.client.close()
+    asyncio.run(main())  # the client belongs to a loop
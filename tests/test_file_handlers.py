@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import pytest
+from plumbum import local
+
+from webslit.file_handlers import get_handler, SearchHandler, TcpDumpFileHandler, FileHandler, DirectoryHandler
+
+
+@pytest.fixture
+def handler(tmp_path):
+    return SimpleNamespace(
+        root=local.path(str(tmp_path)),
+        is_power_user=False,
+        get_argument=lambda name, default=None: default,
+        get_cookie=lambda name, default=None: default)
+
+
+def test_search_for_a_capture(tmp_path, handler):
+    (tmp_path / "dump.pcap").write_bytes(b"")
+    assert isinstance(get_handler(handler.root["__search__/dump.pcap"], handler), SearchHandler)
+    assert isinstance(get_handler(handler.root["__search__/.tcpdump"], handler), SearchHandler)
+
+
+def test_captures(tmp_path, handler):
+    (tmp_path / "dump.pcap").write_bytes(b"")
+    (tmp_path / "dump.tcpdump.gz").write_bytes(b"")
+    (tmp_path / "old.pcap").mkdir()
+    (tmp_path / "app.log").write_bytes(b"")
+    assert type(get_handler(handler.root["dump.pcap"], handler)) is TcpDumpFileHandler
+    assert type(get_handler(handler.root["dump.tcpdump.gz"], handler)) is TcpDumpFileHandler
+    assert type(get_handler(handler.root["old.pcap"], handler)) is DirectoryHandler
+    assert type(get_handler(handler.root["app.log"], handler)) is FileHandler
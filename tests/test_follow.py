@@ -0,0 +1,103 @@
+import os
+import gzip
+
+import pytest
+
+from webslit import follow
+from webslit.follow import follow_lines
+
+
+@pytest.fixture(autouse=True)
+def recheck(monkeypatch):
+    monkeypatch.setattr(follow, "RECHECK_INTERVAL", 0.05)
+
+
+def caught_up(lines):
+    # the lines up to where the follower waits for more
+    ret = []
+    for line in lines:
+        if line is None:
+            return ret
+        ret.append(line)
+
+
+def test_appended(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"a\nb\n")
+    lines = follow_lines(path, idle=True)
+    assert caught_up(lines) == [b"a\n", b"b\n"]
+    with open(path, "ab") as f:
+        f.write(b"c\nhalf")
+    assert caught_up(lines) == [b"c\n"]
+    with open(path, "ab") as f:
+        f.write(b" a line\n")
+    assert caught_up(lines) == [b"half a line\n"]
+    lines.close()
+
+
+def test_rotation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"a\n")
+    lines = follow_lines(path, idle=True)
+    assert caught_up(lines) == [b"a\n"]
+    ino = os.stat(path).st_ino
+
+    # written to just before it's rotated - then a new file takes its place
+    with open(path, "ab") as f:
+        f.write(b"b\nunterminated")
+    os.rename(path, tmp_path / "app.log.1")
+    path.write_bytes(b"c\n")
+    assert os.stat(path).st_ino != ino
+    assert caught_up(lines) == [b"b\n", b"unterminated\n", b"c\n"]
+
+    with open(path, "ab") as f:
+        f.write(b"d\n")
+    assert caught_up(lines) == [b"d\n"]
+    lines.close()
+
+
+def test_rotated_away_and_created_later(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"a\n")
+    lines = follow_lines(path, idle=True)
+    assert caught_up(lines) == [b"a\n"]
+    os.rename(path, tmp_path / "app.log.1")
+    assert caught_up(lines) == []
+    path.write_bytes(b"b\n")
+    assert caught_up(lines) == [b"b\n"]
+    lines.close()
+
+
+def test_truncation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"first\nsecond\n")
+    lines = follow_lines(path, idle=True)
+    assert caught_up(lines) == [b"first\n", b"second\n"]
+    ino = os.stat(path).st_ino
+
+    # i.e. logrotate's 'copytruncate' - the same file, started over
+    with open(path, "wb") as f:
+        f.write(b"third\n")
+    assert os.stat(path).st_ino == ino
+    assert caught_up(lines) == [b"third\n"]
+    lines.close()
+
+
+def test_compressed_then_live(tmp_path):
+    (tmp_path / "app.log.1.gz").write_bytes(gzip.compress(b"old\n"))
+    (tmp_path / "app.log").write_bytes(b"new\n")
+    lines = follow_lines(tmp_path / "app.log.1.gz", idle=True)
+    assert caught_up(lines) == [b"old\n", b"new\n"]
+    lines.close()
+
+
+def test_without_inotify(tmp_path, monkeypatch):
+    monkeypatch.setattr(follow, "get_notifier", follow.Sleeper)
+    path = tmp_path / "app.log"
+    path.write_bytes(b"a\n")
+    lines = follow_lines(path, idle=True)
+    assert caught_up(lines) == [b"a\n"]
+    os.rename(path, tmp_path / "app.log.1")
+    path.write_bytes(b"b\n")
+    assert caught_up(lines) == [b"b\n"]
+    lines.close()
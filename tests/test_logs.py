@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+
+from webslit import logs
+from webslit.logs import LazyQueueHandler, RateLimitFilter, parse_rates
+
+
+def make_record(msg, *args, level=logging.INFO, module="worker"):
+    record = logging.LogRecord("root", level, f"/src/{module}.py", 1, msg, args, None)
+    return record
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(logs.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_immutable_args_are_formatted_later():
+    record = LazyQueueHandler(None).prepare(make_record("%s from %s", 12, "pid"))
+    assert record.args == (12, "pid")
+    assert record.getMessage() == "12 from pid"
+
+
+def test_mutable_args_are_formatted_now():
+    items = [1]
+    record = LazyQueueHandler(None).prepare(make_record("items: %s", items))
+    items.append(2)
+    assert record.args is None
+    assert record.getMessage() == "items: [1]"
+
+
+def test_mutable_mapping_values_are_formatted_now():
+    items = [1]
+    record = LazyQueueHandler(None).prepare(make_record("items: %(items)s", dict(items=items)))
+    items.append(2)
+    assert record.getMessage() == "items: [1]"
+
+
+def test_non_string_messages_are_formatted_now():
+    record = LazyQueueHandler(None).prepare(make_record(["a"]))
+    assert record.msg == "['a']"
+
+
+def test_parse_rates():
+    assert parse_rates("") == {}
+    assert parse_rates("worker=20,*=200") == {"worker": 20, "*": 200}
+    assert parse_rates("50") == {"*": 50}
+
+
+def test_rate_limit(clock):
+    limit = RateLimitFilter({"worker": 2})
+    passed = [limit.filter(make_record("x")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limit.filter(make_record("x", module="handler"))  # not limited
+    assert limit.filter(make_record("x", level=logging.WARNING))  # warnings always pass
+
+    clock[0] += 1
+    record = make_record("x")
+    assert limit.filter(record)
+    assert record.getMessage() == "x (and 3 more dropped)"
+
+
+def test_default_rate(clock):
+    limit = RateLimitFilter({"worker": 1, "*": 2})
+    assert [limit.filter(make_record("x", module="handler")) for _ in range(3)] == [True, True, False]
@@ -0,0 +1,75 @@
+import struct
+from concurrent.futures import Future
+
+import pytest
+
+from webslit import pcapindex, utils
+from webslit.scheduler import BACKGROUND
+from webslit.pcapindex import get_pcap_index, UnsupportedCapture
+
+
+class FakeScheduler():
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit_task(self, cls, func):
+        future = Future()
+        self.tasks.append((cls, func, future))
+        return future
+
+    def run(self):
+        for cls, func, future in self.tasks:
+            try:
+                future.set_result(func())
+            except Exception as exc:
+                future.set_exception(exc)
+        self.tasks = []
+
+
+@pytest.fixture(autouse=True)
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+    # a tcpdump that summarizes any capture as two packets
+    monkeypatch.setattr(pcapindex, "TCPDUMP", ["sh", "-c", "cat > /dev/null; printf '1 first\\n2 second\\n'"])
+    fake = FakeScheduler()
+    monkeypatch.setattr(pcapindex, "scheduler", fake)
+    pcapindex._get_pcap_index.cache_clear()
+    return fake
+
+
+def make_capture(path):
+    packets = [b"\x00" * 60, b"\x01" * 42]
+    data = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    for i, packet in enumerate(packets):
+        data += struct.pack("<IIII", 1580000000 + i, 0, len(packet), len(packet)) + packet
+    path.write_bytes(data)
+    return data
+
+
+def test_indexed_in_the_background(tmp_path, scheduler):
+    path = tmp_path / "eth0.pcap"
+    data = make_capture(path)
+    assert get_pcap_index(path) is None
+    assert get_pcap_index(path) is None  # still queued - and not queued again
+    (cls, _, _), = scheduler.tasks
+    assert cls == BACKGROUND
+
+    scheduler.run()
+    index = get_pcap_index(path)
+    assert index.count == 2
+    assert index.summaries(0, 10) == ["1 first", "2 second"]
+    assert b"".join(index.packets(1, 2)) == data[:24] + data[24 + 16 + 60:]
+    assert get_pcap_index(path) is index
+    assert not scheduler.tasks
+
+
+def test_unsupported_capture(tmp_path, scheduler):
+    path = tmp_path / "eth0.pcapng"
+    path.write_bytes(b"\x0a\x0d\x0d\x0a" + b"\x00" * 100)
+    assert get_pcap_index(path) is None
+    scheduler.run()
+    with pytest.raises(UnsupportedCapture):
+        get_pcap_index(path)
+    assert get_pcap_index(path) is None  # tried again
+    assert len(scheduler.tasks) == 1
@@ -0,0 +1,135 @@
+import pytest
+from tornado.options import options
+
+import webslit.settings  # noqa - defines the options
+from webslit import prefetch, utils
+from webslit.prefetch import Prefetch, Prefetcher, MB, HEAD_BYTES, TAIL_BYTES, BUDGET_WINDOW
+
+
+class FakeScheduler():
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit_task(self, cls, func, abandoned=None):
+        self.tasks.append((func.__self__, abandoned))
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    fake = FakeScheduler()
+    monkeypatch.setattr(prefetch, "scheduler", fake)
+    return fake
+
+
+@pytest.fixture
+def budget():
+    saved = options.prefetch_budget
+    options.prefetch_budget = 4
+    yield 4
+    options.prefetch_budget = saved
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prefetch.time, "monotonic", lambda: now[0])
+    return now
+
+
+def finish(task, size):
+    task.bytes = size
+    task.done = True
+
+
+def test_repeated_hint_is_not_prefetched_again(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    assert prefetcher.hint("ip", "/a")
+    assert prefetcher.hint("ip", "/a")
+    assert len(scheduler.tasks) == 1
+
+
+def test_superseded_hint_is_cancelled(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    prefetcher.hint("ip", "/a")
+    prefetcher.hint("ip", "/b")
+    (first, abandoned), (second, _) = scheduler.tasks
+    assert first.cancelled and abandoned()
+    assert not second.cancelled
+
+
+def test_other_clients_dont_supersede(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    prefetcher.hint("ip1", "/a")
+    prefetcher.hint("ip2", "/b")
+    assert not any(task.cancelled for task, _ in scheduler.tasks)
+
+
+def test_done_prefetch_isnt_cancelled(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    prefetcher.hint("ip", "/a")
+    finish(scheduler.tasks[0][0], MB)
+    prefetcher.hint("ip", "/b")
+    assert not scheduler.tasks[0][0].cancelled
+
+
+def test_wasted_prefetches_exhaust_the_budget(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    prefetcher.hint("ip", "/a")
+    finish(scheduler.tasks[-1][0], budget * MB)
+    assert not prefetcher.hint("ip", "/b")  # /a wasted the whole budget
+    assert prefetcher.hint("other", "/b")  # ...of this client only
+
+    clock[0] += BUDGET_WINDOW
+    assert prefetcher.hint("ip", "/b")
+
+
+def test_opened_prefetches_dont_count(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    for path in ("/a", "/b", "/c"):
+        assert prefetcher.hint("ip", path)
+        finish(scheduler.tasks[-1][0], budget * MB)
+        prefetcher.opened("ip", [path])
+    assert prefetcher.hint("ip", "/d")
+
+
+def test_opened_after_ttl_counts_as_wasted(scheduler, budget, clock):
+    prefetcher = Prefetcher()
+    prefetcher.hint("ip", "/a")
+    finish(scheduler.tasks[-1][0], budget * MB)
+    clock[0] += prefetch.HINT_TTL + 1
+    prefetcher.opened("ip", ["/a"])
+    assert not prefetcher.hint("ip", "/b")
+
+
+def test_disabled(scheduler, budget, clock):
+    options.prefetch_budget = 0
+    assert not Prefetcher().hint("ip", "/a")
+    assert not scheduler.tasks
+
+
+@pytest.mark.parametrize("local", [True, False])
+def test_warm_reads_head_and_tail(tmp_path, monkeypatch, local):
+    monkeypatch.setattr(prefetch, "is_local", lambda path: local)
+    path = tmp_path / "big.log"
+    path.write_bytes(b"x" * (HEAD_BYTES + TAIL_BYTES + MB))
+    task = Prefetch(str(path))
+    task.run()
+    assert task.done
+    assert task.bytes == HEAD_BYTES + TAIL_BYTES
+
+
+def test_warm_reads_only_the_head_of_compressed_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "is_local", lambda path: False)
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "big.log.gz"
+    path.write_bytes(b"x" * (HEAD_BYTES + TAIL_BYTES + MB))
+    task = Prefetch(str(path))
+    task.run()
+    assert task.bytes == HEAD_BYTES
+
+
+def test_warm_missing_file(tmp_path):
+    task = Prefetch(str(tmp_path / "nope"))
+    task.run()
+    assert task.done and task.bytes == 0
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+from tornado.options import options
+
+import webslit.settings  # noqa - defines the options
+from webslit.reaper import choose, MB, PRESSURE_MIN_IDLE
+
+NOW = 100000.0
+
+
+@pytest.fixture
+def reaper_options():
+    names = ("reap_idle", "memory_budget", "memory_pressure")
+    saved = {name: getattr(options, name) for name in names}
+    options.reap_idle = options.memory_budget = 0
+    options.memory_pressure = 0.0
+    yield options
+    for name, value in saved.items():
+        setattr(options, name, value)
+
+
+def make_workers(*idle_seconds):
+    return [SimpleNamespace(id=str(i), last_activity=NOW - idle) for i, idle in enumerate(idle_seconds)]
+
+
+def chosen(workers, usage, pressure=None):
+    return [(worker.id, kind) for worker, kind, _ in choose(workers, usage, NOW, pressure)]
+
+
+def test_nothing_by_default(reaper_options):
+    workers = make_workers(10 ** 6, 10)
+    assert chosen(workers, {"0": 10 ** 4 * MB, "1": MB}, pressure=99) == []
+
+
+def test_idle(reaper_options):
+    reaper_options.reap_idle = 3600
+    workers = make_workers(10, 7200, 3600, 3601)
+    assert chosen(workers, {}) == [("1", "idle"), ("3", "idle")]
+
+
+def test_budget_evicts_the_idlest_first(reaper_options):
+    reaper_options.memory_budget = 100
+    workers = make_workers(10, 500, 50, 5000)
+    usage = {"0": 40 * MB, "1": 30 * MB, "2": 30 * MB, "3": 20 * MB}  # 120MB in all
+    assert chosen(workers, usage) == [("3", "budget")]
+
+    usage.update({"0": 60 * MB, "3": 5 * MB})  # 125MB - closing the idlest isn't enough
+    assert chosen(workers, usage) == [("3", "budget"), ("1", "budget")]
+
+
+def test_under_budget(reaper_options):
+    reaper_options.memory_budget = 100
+    workers = make_workers(10, 10 ** 6)
+    assert chosen(workers, {"0": 50 * MB, "1": 50 * MB}) == []
+
+
+def test_pressure_closes_one_idle_session(reaper_options):
+    reaper_options.memory_pressure = 10.0
+    workers = make_workers(PRESSURE_MIN_IDLE + 1, PRESSURE_MIN_IDLE * 3, 10)
+    assert chosen(workers, {}, pressure=25.0) == [("1", "pressure")]
+    assert chosen(workers, {}, pressure=5.0) == []
+    assert chosen(workers, {}, pressure=None) == []  # PSI unsupported
+
+
+def test_pressure_spares_active_sessions(reaper_options):
+    reaper_options.memory_pressure = 10.0
+    workers = make_workers(10, PRESSURE_MIN_IDLE - 1)
+    assert chosen(workers, {}, pressure=50.0) == []
+
+
+def test_idle_ones_count_towards_the_budget(reaper_options):
+    reaper_options.reap_idle = 3600
+    reaper_options.memory_budget = 100
+    workers = make_workers(10, 7200, 60)
+    usage = {"0": 50 * MB, "1": 60 * MB, "2": 30 * MB}  # closing the idle one brings us under budget
+    assert chosen(workers, usage) == [("1", "idle")]
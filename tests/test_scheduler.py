@@ -0,0 +1,97 @@
+import time
+import threading
+
+from webslit.scheduler import Scheduler, INTERACTIVE, BACKGROUND, HOUSEKEEPING
+
+
+def make_scheduler(max_workers=10, interactive=10, background=2, housekeeping=1):
+    return Scheduler(max_workers, {INTERACTIVE: interactive, BACKGROUND: background, HOUSEKEEPING: housekeeping})
+
+
+class Concurrency():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = self.peak = 0
+
+    def __call__(self, seconds):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+
+
+def test_burst_runs_concurrently_with_an_idle_thread():
+    scheduler = make_scheduler()
+    scheduler.submit_task(INTERACTIVE, time.sleep, (0,)).result()  # leaves a warm, idle thread
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    futures = [scheduler.submit_task(INTERACTIVE, time.sleep, (0.3,)) for _ in range(4)]
+    for future in futures:
+        future.result()
+    assert time.monotonic() - started < 0.55
+    assert len(scheduler._threads) == 4
+
+
+def test_class_cap():
+    scheduler = make_scheduler(background=2)
+    concurrency = Concurrency()
+    futures = [scheduler.submit_task(BACKGROUND, concurrency, (0.1,)) for _ in range(6)]
+    for future in futures:
+        future.result()
+    assert concurrency.peak == 2
+
+
+def test_capped_class_doesnt_hold_back_others():
+    scheduler = make_scheduler(background=1)
+    background = [scheduler.submit_task(BACKGROUND, time.sleep, (0.3,)) for _ in range(3)]
+    started = time.monotonic()
+    scheduler.submit_task(INTERACTIVE, time.sleep, (0,)).result()
+    assert time.monotonic() - started < 0.2
+    for future in background:
+        future.result()
+
+
+def test_priority():
+    scheduler = make_scheduler(max_workers=1)
+    release = threading.Event()
+    order = []
+    scheduler.submit_task(INTERACTIVE, release.wait)
+    time.sleep(0.05)
+    futures = [
+        scheduler.submit_task(HOUSEKEEPING, order.append, ("housekeeping",)),
+        scheduler.submit_task(BACKGROUND, order.append, ("background",)),
+        scheduler.submit_task(INTERACTIVE, order.append, ("interactive",)),
+    ]
+    release.set()
+    for future in futures:
+        future.result()
+    assert order == ["interactive", "background", "housekeeping"]
+
+
+def test_abandoned_tasks_are_dropped():
+    scheduler = make_scheduler(max_workers=1)
+    release = threading.Event()
+    ran = []
+    scheduler.submit_task(INTERACTIVE, release.wait)
+    time.sleep(0.05)
+    future = scheduler.submit_task(INTERACTIVE, ran.append, (1,), abandoned=lambda: True)
+    release.set()
+    time.sleep(0.1)
+    assert future.cancelled()
+    assert not ran
+
+
+def test_default_executor():
+    import asyncio
+    scheduler = make_scheduler()
+    loop = asyncio.new_event_loop()
+    try:
+        loop.set_default_executor(scheduler.executor(INTERACTIVE))
+        name = loop.run_until_complete(loop.run_in_executor(None, lambda: threading.current_thread().name))
+    finally:
+        loop.close()
+    assert name.startswith("scheduler-")
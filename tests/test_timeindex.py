@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+
+from webslit import utils
+from webslit.timeindex import TimeIndex, SCAN_BYTES
+from webslit.timestamps import TimestampDetector
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+def make_log(path, count=20000):
+    # every 10th line has no timestamp; the file is large enough for the binary search to engage
+    lines = []
+    for i in range(count):
+        if i % 10 == 9:
+            lines.append(b"    a continuation line\n")
+        else:
+            lines.append(f"2020-01-31 {10 + i // 3600:02}:{i // 60 % 60:02}:{i % 60:02} line {i}\n".encode())
+    data = b"".join(lines)
+    assert len(data) > 4 * SCAN_BYTES
+    if path.suffix == ".gz":
+        path.write_bytes(gzip.compress(data))
+    else:
+        path.write_bytes(data)
+    return data
+
+
+def expected_offset(data, ts):
+    detect = TimestampDetector()
+    pos = 0
+    for line in data.splitlines(keepends=True):
+        line_ts = detect(line)
+        if line_ts is not None and line_ts >= ts:
+            return pos
+        pos += len(line)
+    return None
+
+
+@pytest.mark.parametrize("suffix", [".log", ".log.gz"])
+def test_seek(tmp_path, suffix):
+    path = tmp_path / f"app{suffix}"
+    data = make_log(path)
+    index = TimeIndex(path, step=4096)
+    first = index.first_timestamp()
+    for offset in (0, 1, 8, 9, 10, 999, 4321, 15000, 19990, 19998):
+        ts = first + offset
+        assert index.seek(ts) == expected_offset(data, ts), offset
+
+
+@pytest.mark.parametrize("suffix", [".log", ".log.gz"])
+def test_seek_bounds(tmp_path, suffix):
+    path = tmp_path / f"app{suffix}"
+    data = make_log(path)
+    index = TimeIndex(path, step=4096)
+    first = index.first_timestamp()
+    assert index.seek(first - 3600) == 0
+    assert index.seek(first + 30000) is None
+    assert data[index.seek(first + 5):].startswith(b"2020-01-31 10:00:05 line 5\n")
+
+
+def test_compressed_index_is_cached(tmp_path, monkeypatch):
+    path = tmp_path / "app.log.gz"
+    make_log(path)
+    built = TimeIndex(path, step=4096)
+
+    def rebuild(self):
+        raise AssertionError("rebuilt")
+    monkeypatch.setattr(TimeIndex, "_build", rebuild)
+    loaded = TimeIndex(path, step=4096)
+    assert list(loaded.offsets) == list(built.offsets)
+    assert list(loaded.timestamps) == list(built.timestamps)
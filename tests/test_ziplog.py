@@ -0,0 +1,81 @@
+import gzip
+from io import BytesIO
+
+import pytest
+
+from webslit import utils
+from webslit.timestamps import TimestampDetector
+from webslit.ziplog import zip_logs, resolve_window
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_DIR", str(tmp_path / "cache"))
+
+
+def write_log(path, seconds, continuation=False):
+    lines = []
+    for s in seconds:
+        lines.append(f"2020-01-31 14:{s // 60:02}:{s % 60:02},000 {path.stem} at {s}\n")
+        if continuation:
+            lines.append(f"  continuing {s}\n")
+    data = "".join(lines).encode()
+    if path.suffix == ".gz":
+        data = gzip.compress(data)
+    path.write_bytes(data)
+    return f"file:{path}"
+
+
+def zipped(specs, **kwargs):
+    out = BytesIO()
+    zip_logs(specs, out, **kwargs)
+    return out.getvalue().decode().splitlines()
+
+
+def test_merge_order(tmp_path):
+    a = write_log(tmp_path / "a.log", [0, 3, 4, 9])
+    b = write_log(tmp_path / "b.log.gz", [1, 2, 5, 9])
+    lines = zipped([a, b])
+    assert lines == [
+        "00> 2020-01-31 14:00:00,000 a at 0",
+        "01> 2020-01-31 14:00:01,000 b.log at 1",
+        "01> 2020-01-31 14:00:02,000 b.log at 2",
+        "00> 2020-01-31 14:00:03,000 a at 3",
+        "00> 2020-01-31 14:00:04,000 a at 4",
+        "01> 2020-01-31 14:00:05,000 b.log at 5",
+        "00> 2020-01-31 14:00:09,000 a at 9",  # ties go by input
+        "01> 2020-01-31 14:00:09,000 b.log at 9",
+    ]
+
+
+def test_continuation_lines_stay_with_their_record(tmp_path):
+    a = write_log(tmp_path / "a.log", [0, 2], continuation=True)
+    b = write_log(tmp_path / "b.log", [1])
+    assert [line[:4] + line.split()[-1] for line in zipped([a, b])] == [
+        "00> 0", "00> 0", "01> 1", "00> 2", "00> 2"]
+
+
+def test_many_inputs(tmp_path):
+    specs = [write_log(tmp_path / f"{i}.log", range(i, 600, 7)) for i in range(7)]
+    detect = TimestampDetector()
+    stamps = [detect(line[4:].encode()) for line in zipped(specs, read_ahead=1)]
+    assert len(stamps) == 600
+    assert stamps == sorted(stamps)
+
+
+@pytest.mark.parametrize("suffix", [".log", ".log.gz"])
+def test_window(tmp_path, suffix):
+    a = write_log(tmp_path / f"a{suffix}", range(0, 3600, 2), continuation=True)
+    b = write_log(tmp_path / f"b{suffix}", range(1, 3600, 2))
+    start, end = resolve_window([a, b], "14:10:00", "14:15:00")
+    lines = zipped([a, b], start=start, end=end)
+    seconds = [int(line.split()[-1]) for line in lines]
+    assert seconds[0] == 600 and seconds[-1] == 900  # inclusive, with 900's continuation line
+    assert sorted(set(seconds)) == list(range(600, 901))
+    assert len(lines) == 301 + 151  # a's records have two lines each
+
+
+def test_window_past_the_end(tmp_path):
+    a = write_log(tmp_path / "a.log", range(0, 60))
+    start, end = resolve_window([a], "15:00:00", "15:05:00")
+    assert zipped([a], start=start, end=end) == []
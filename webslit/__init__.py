@@ -1,4 +1,8 @@
-with open("version.info") as f:
-    __version__ = f.read().strip()
+try:
+    with open("version.info") as f:
+        __version__ = f.read().strip()
+except FileNotFoundError:
+    # not in our container (or running a helper from another directory, i.e. webslit.ziplog)
+    from ._version import __version__
 
 MAJOR, MINOR, COMMIT = __version__.split(".")
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import logging
+from threading import Lock
+from collections import OrderedDict
+
+from tornado.options import options
+
+from .compression import open_stream
+from .timestamps import TimestampDetector
+from .utils import get_cache_path
+from .scheduler import scheduler, BACKGROUND
+
+
+MAX_BUCKETS = 1024  # while scanning; buckets widen as the log's time span grows
+SPARKLINE_BUCKETS = 24
+MAX_JUMPS = 1000
+MAX_PENDING = 256
+CACHE_SIZE = 4096
+
+SEVERITY_SCAN = 120
+severity = re.compile(rb"\b(ERROR|FATAL|CRITICAL|WARN|WARNING|INFO)\b|^([EWI])\|")
+SEVERITIES = {
+    b"ERROR": 1, b"FATAL": 1, b"CRITICAL": 1, b"E": 1,
+    b"WARN": 2, b"WARNING": 2, b"W": 2,
+    b"INFO": 3, b"I": 3,
+}
+analyzable = re.compile(r"^([^.]+|.*\.(log|txt|out|err))([.-]\d+)*(\.(gz|bz2|xz|zst))?$")
+
+
+class Histogram():
+    """
+    Line counts per time bucket, split by severity: [lines, errors, warnings, info]
+    """
+
+    def __init__(self):
+        self.start = None
+        self.width = 1.0
+        self.buckets = {}
+
+    def add(self, ts, level):
+        if self.start is None:
+            self.start = ts
+        idx = int((ts - self.start) // self.width)
+        while idx >= MAX_BUCKETS:
+            self._widen()
+            idx = int((ts - self.start) // self.width)
+        idx = max(idx, 0)  # out-of-order lines, before the first one
+        counts = self.buckets.get(idx)
+        if counts is None:
+            counts = self.buckets[idx] = [0, 0, 0, 0]
+        counts[0] += 1
+        if level:
+            counts[level] += 1
+
+    def _widen(self):
+        self.width *= 2
+        buckets = {}
+        for idx, counts in self.buckets.items():
+            merged = buckets.setdefault(idx // 2, [0, 0, 0, 0])
+            for i, c in enumerate(counts):
+                merged[i] += c
+        self.buckets = buckets
+
+    def to_list(self):
+        if not self.buckets:
+            return []
+        return [self.buckets.get(i, [0, 0, 0, 0]) for i in range(max(self.buckets) + 1)]
+
+
+def analyze(path):
+    detect = TimestampDetector()
+    histogram = Histogram()
+    jumps = []
+    totals = [0, 0, 0, 0]
+    ts = None
+    pos = 0
+    with open_stream(path) as f:
+        for line in f:
+            line_ts = detect(line)
+            if line_ts is not None:
+                ts = line_ts
+            m = severity.search(line, 0, SEVERITY_SCAN)
+            level = SEVERITIES[m.group(1) or m.group(2)] if m else 0
+            totals[0] += 1
+            if level:
+                totals[level] += 1
+            if ts is not None:
+                histogram.add(ts, level)
+            if level == 1 and len(jumps) < MAX_JUMPS:
+                jumps.append((pos, ts))
+            pos += len(line)
+
+    return dict(
+        start=histogram.start, width=histogram.width, buckets=histogram.to_list(),
+        lines=totals[0], errors=totals[1], warnings=totals[2], info=totals[3],
+        jumps=jumps, truncated_jumps=totals[1] > len(jumps))
+
+
+def to_sparkline(result, size=SPARKLINE_BUCKETS):
+    """
+    Downsample the histogram for showing in a listing: (start, width, [lines...], [errors...])
+    """
+    buckets = result['buckets']
+    if not buckets:
+        return None
+    factor = max(1, -(-len(buckets) // size))
+    lines, errors = [], []
+    for i in range(0, len(buckets), factor):
+        chunk = buckets[i:i + factor]
+        lines.append(sum(b[0] for b in chunk))
+        errors.append(sum(b[1] for b in chunk))
+    return dict(start=result['start'], width=result['width'] * factor, lines=lines, errors=errors)
+
+
+class Analyzer():
+
+    def __init__(self):
+        self._lock = Lock()
+        self._cache = OrderedDict()
+        self._pending = set()
+        self.executor = scheduler.executor(BACKGROUND)
+
+    def _load(self, path, key):
+        try:
+            with open(get_cache_path("analyzer", path, ".json")) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cached['result'] if cached.get('key') == list(key) else None
+
+    def _save(self, path, key, result):
+        try:
+            with open(get_cache_path("analyzer", path, ".json"), "w") as f:
+                json.dump(dict(key=key, result=result), f)
+        except OSError:
+            pass
+
+    def _lookup(self, path, key):
+        # call with the lock held
+        cached = self._cache.get(path)
+        if cached and cached[0] == key:
+            self._cache.move_to_end(path)
+            return cached[1]
+        return None
+
+    def get(self, path, st=None):
+        """
+        The analysis of the file if we have it, otherwise None (and it's queued for analysis) - or False if it failed
+        """
+        path = str(path)
+        st = st or os.stat(path)
+        key = (st.st_size, st.st_mtime)
+        with self._lock:
+            result = self._lookup(path, key)
+            if result is not None:
+                return result
+            if path in self._pending or len(self._pending) >= MAX_PENDING:
+                return None
+            self._pending.add(path)
+        self.executor.submit(self._analyze, path, key)
+        return None
+
+    def _analyze(self, path, key):
+        try:
+            result = self._load(path, key)
+            if result is None:
+                logging.debug(f"analyzing {path}")
+                result = analyze(path)
+                self._save(path, key, result)
+        except Exception as exc:
+            logging.warning(f"Could not analyze {path}: {exc}")
+            result = False  # rather than trying again, until the file changes
+        with self._lock:
+            self._pending.discard(path)
+            self._cache[path] = (key, result)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def applies_to(self, name):
+        return options.analyze and analyzable.search(name) is not None
+
+
+analyzer = Analyzer()
@@ -10,7 +10,6 @@ if sys.platform == "darwin":
     # On Mac, partition to ansi escape characters and regular characters.
     # For the regular characters write at once, for escape one by one.
     def partition_ansi(s):
-        ansi_escape = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')
         spans = (m.span() for m in ansi_escape.finditer(s))
         last_end = end = 0
         for start, end in spans:
@@ -115,32 +114,132 @@ def highlight(string, background):
     return bkcmd + string.replace(stopcmd, stopcmd + bkcmd) + stopcmd
 
 ANSI_COLOR_REGEX = "\x1b\[(\d+)?(;\d+)*;?m"
+ANSI_ESCAPE_REGEX = r"(?:\x9B|\x1B\[)[0-?]*[ -/]*[@-~]"
+
+ansi_color = re.compile(ANSI_COLOR_REGEX)
+ansi_escape = re.compile(ANSI_ESCAPE_REGEX)
+# no '\x9B' for bytes - in utf-8 it's a continuation byte of perfectly innocent characters
+ansi_escape_bytes = re.compile(rb"\x1B\[[0-?]*[ -/]*[@-~]")
+# an escape sequence cut short by the end of a chunk
+partial_escape_bytes = re.compile(rb"\x1B(?:\[[0-?]*[ -/]*)?$")
+
+MAX_ESCAPE = 64  # anything longer is not an escape sequence we'd hold back for
+
+
+def _is_bytes(s):
+    return isinstance(s, (bytes, bytearray, memoryview))
+
+
+def _escapes(s):
+    return ansi_escape_bytes if _is_bytes(s) else ansi_escape
+
 
 def decolorize(string):
-    return re.sub(ANSI_COLOR_REGEX, "", string)
+    return ansi_color.sub("", string)
+
+
+def strip_ansi(s):
+    """
+    Remove all (CSI) escape sequences - colors, cursor movement, etc. Works on str and bytes alike.
+    """
+    return _escapes(s).sub(b"" if _is_bytes(s) else "", s)
+
+
+def escape_spans(s):
+    return [m.span() for m in _escapes(s).finditer(s)]
+
+
+def visible_len(s, spans=None):
+    if spans is None:
+        spans = escape_spans(s)
+    return len(s) - sum(end - start for start, end in spans)
+
+
+def visible_slice(s, start, stop=None, spans=None):
+    """
+    Slice `s` by its visible characters, keeping all escape sequences so the result is colored the same
+    """
+    if spans is None:
+        spans = escape_spans(s)
+    size = visible_len(s, spans)
+    start, stop, _ = slice(start, stop).indices(size)
+    parts = []
+    pos = 0  # position in s
+    seen = 0  # visible characters before pos
+    for esc_start, esc_end in spans + [(len(s), len(s))]:
+        text = esc_start - pos
+        lo, hi = max(start - seen, 0), min(stop - seen, text)
+        if lo < hi:
+            parts.append(s[pos + lo:pos + hi])
+        seen += text
+        parts.append(s[esc_start:esc_end])
+        pos = esc_end
+    return (b"" if _is_bytes(s) else "").join(parts)
+
+
+class AnsiStripper():
+    """
+    Strip escape sequences from a stream of byte chunks, minding sequences split between chunks:
+
+        stripper = AnsiStripper()
+        for chunk in chunks:
+            out.write(stripper.feed(chunk))
+        out.write(stripper.flush())
+    """
+
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, chunk):
+        if self.pending:
+            chunk = self.pending + chunk
+            self.pending = b""
+        if b"\x1b" not in chunk:
+            return chunk
+        m = partial_escape_bytes.search(chunk, max(len(chunk) - MAX_ESCAPE, 0))
+        if m:
+            chunk, self.pending = chunk[:m.start()], chunk[m.start():]
+        return ansi_escape_bytes.sub(b"", chunk)
+
+    def flush(self):
+        pending, self.pending = self.pending, b""
+        return pending
+
+
+def strip_ansi_stream(chunks):
+    stripper = AnsiStripper()
+    for chunk in chunks:
+        chunk = stripper.feed(chunk)
+        if chunk:
+            yield chunk
+    rest = stripper.flush()
+    if rest:
+        yield rest
+
 
 class ansistr(str):
+    # keeps only the spans of the escape sequences, so it's as cheap on long strings as it is on short ones
+
     def __init__(self, s):
         if not isinstance(s, str):
             s = str(s)
         self.__str = s
-        self.__parts = [m.span() for m in re.finditer("(%s)|(.)" % ANSI_COLOR_REGEX, s)]
-        self.__len = sum(1 if p[1]-p[0]==1 else 0 for p in self.__parts)
+        self.__spans = escape_spans(s)
+        self.__len = visible_len(s, self.__spans)
 
     def __len__(self):
         return self.__len
 
-    def __getslice__(self, i, j):
-        parts = []
-        count = 0
-        for start, end in self.__parts:
-            if end - start == 1:
-                count += 1
-                if i <= count < j:
-                    parts.append(self.__str[start:end])
-            else:
-                parts.append(self.__str[start:end])
-        return ansistr("".join(parts))
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step not in (None, 1):
+                raise ValueError("ansistr slicing does not support steps")
+            return ansistr(visible_slice(self.__str, i.start, i.stop, self.__spans))
+        if i < 0:
+            i += self.__len
+        if not 0 <= i < self.__len:
+            raise IndexError("ansistr index out of range")
+        return visible_slice(self.__str, i, i + 1, self.__spans)
 
     def __add__(self, s):
         return ansistr(self.__str + s)
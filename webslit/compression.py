@@ -0,0 +1,68 @@
+import os
+import gzip
+import bz2
+import lzma
+import subprocess
+
+
+DECOMPRESSORS = {
+    ".gz": "gzip -dc",
+    ".bz2": "bzip2 -dc",
+    ".xz": "xz -dc",
+    ".zst": "zstdcat",
+}
+
+
+def get_suffix(path):
+    return os.path.splitext(str(path))[1]
+
+
+def is_compressed(path):
+    return get_suffix(path) in DECOMPRESSORS
+
+
+def get_cat_cmd(path):
+    return DECOMPRESSORS.get(get_suffix(path), "cat")
+
+
+class PipeReader():
+
+    def __init__(self, argv, stderr=subprocess.DEVNULL):
+        self.proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=stderr)
+        self.stdout = self.proc.stdout
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+    def __iter__(self):
+        return iter(self.stdout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.stdout.close()
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+def open_stream(path):
+    """
+    Open a (possibly compressed) file for reading its decompressed content as bytes
+    """
+    path = str(path)
+    suffix = get_suffix(path)
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    elif suffix == ".bz2":
+        return bz2.open(path, "rb")
+    elif suffix == ".xz":
+        return lzma.open(path, "rb")
+    elif suffix == ".zst":
+        return PipeReader(["zstdcat", "-q", path])
+    else:
+        return open(path, "rb")
@@ -0,0 +1,120 @@
+"""
+The running containers, kept current from the docker events stream - so listing them costs no subprocess,
+and changes can be pushed to whoever's watching (see `/_containers` in handler.py)
+"""
+import time
+import logging
+from threading import Thread, Lock
+
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+from tornado.options import options
+from easypy.bunch import Bunch
+
+
+RETRY_INTERVAL = 10  # seconds, before reconnecting to a docker daemon we've lost
+INTERESTING_EVENTS = {"start", "die", "destroy", "rename", "pause", "unpause"}
+
+
+def format_age(seconds):
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= size:
+            n = int(seconds // size)
+            return f"{n} {unit}{'s' if n > 1 else ''}"
+    return "Less than a minute"
+
+
+class ContainerRegistry():
+
+    def __init__(self, loop, base_url=None):
+        self.loop = loop
+        self.base_url = base_url
+        self.containers = {}
+        self.version = 0
+        self.error = None
+        self.ready = Event()  # set once we've had our first look at the containers (or failed to)
+        self.changed = Event()
+        self._lock = Lock()
+        self._thread = Thread(target=self._run, name="docker-events", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.containers)} containers, version={self.version})"
+
+    def get_containers(self):
+        with self._lock:
+            return list(self.containers.values())
+
+    def _connect(self):
+        import docker
+        if self.base_url:
+            return docker.APIClient(base_url=self.base_url)
+        return docker.from_env().api
+
+    def _run(self):
+        while True:
+            try:
+                api = self._connect()
+                # subscribe first, so nothing that happens while we take the snapshot gets lost
+                events = api.events(decode=True, filters=dict(type="container"))
+                self._snapshot(api)
+                for event in events:
+                    if event.get("status", event.get("Action")) in INTERESTING_EVENTS:
+                        self._refresh(api, event.get("id") or event["Actor"]["ID"])
+                raise ConnectionError("docker events stream ended")
+            except Exception as exc:
+                logging.warning(f"Lost track of docker containers ({exc}), retrying in {RETRY_INTERVAL}s")
+                self.error = str(exc)
+                self._publish()
+                time.sleep(RETRY_INTERVAL)
+
+    def _to_container(self, info):
+        return Bunch(
+            id=info["Id"],
+            name=info["Names"][0].lstrip("/") if info.get("Names") else info["Id"][:12],
+            image=info["Image"],
+            created=info["Created"],
+            state=info.get("State", "running"),
+        )
+
+    def _snapshot(self, api):
+        containers = {info["Id"]: self._to_container(info) for info in api.containers()}
+        with self._lock:
+            self.containers = containers
+        self.error = None
+        logging.info(f"{self}: took a snapshot")
+        self._publish()
+
+    def _refresh(self, api, cid):
+        found = api.containers(filters=dict(id=cid))
+        with self._lock:
+            if found:
+                self.containers[cid] = self._to_container(found[0])
+            else:
+                self.containers.pop(cid, None)
+        logging.debug(f"{self}: refreshed {cid[:12]}")
+        self._publish()
+
+    def _publish(self):
+        self.loop.add_callback(self._notify)
+
+    def _notify(self):
+        # on the IOLoop, where tornado's Events may be touched
+        self.version += 1
+        self.ready.set()
+        changed, self.changed = self.changed, Event()
+        changed.set()
+
+
+_registry = None
+
+
+def get_registry():
+    """
+    The registry, started on first use - must be called from the IOLoop
+    """
+    global _registry
+    if _registry is None:
+        _registry = ContainerRegistry(IOLoop.current(), options.docker_url or None)
+    return _registry
+
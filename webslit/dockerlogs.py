@@ -0,0 +1,121 @@
+"""
+Stream a container's logs straight from the docker API (no docker CLI), each line led by docker's timestamp:
+
+    python -m webslit.dockerlogs 3f2a1b9c --since 14:30 --follow
+
+The daemon is found as docker's own CLI finds it (i.e. DOCKER_HOST).
+Several containers are merged by timestamp with ziplog: `python -m webslit.ziplog -i docker:3f2a1b9c -i docker:77e0c1d2`
+"""
+import os
+import sys
+import argparse
+from queue import Queue, Empty
+from threading import Thread
+
+from .timestamps import resolve_time
+
+
+READ_AHEAD = 1024  # lines
+IDLE = 0.2  # seconds without new lines before we let the consumer know we've caught up
+EOF = object()
+
+
+def get_api():
+    import docker
+    return docker.from_env().api
+
+
+def iter_lines(stream):
+    pending = b""
+    for chunk in stream:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending + b"\n"
+
+
+class ReadAhead():
+    """
+    Reads a container's log lines in a thread, up to `size` lines ahead of the consumer.
+    When following, iteration yields None whenever no lines came for a while (see `idle` in follow.py).
+    """
+
+    def __init__(self, cid, since=None, until=None, follow=False, size=READ_AHEAD):
+        self.cid = cid
+        self.follow = follow
+        kwargs = dict(stream=True, follow=follow, timestamps=True)
+        if since is not None:
+            kwargs.update(since=since)
+        if until is not None:
+            kwargs.update(until=until)
+        self.stream = get_api().logs(cid, **kwargs)
+        self._closed = False
+        self._queue = Queue(maxsize=size)
+        self._thread = Thread(target=self._read, name=f"dockerlogs-{cid[:12]}", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.cid[:12]})"
+
+    def _read(self):
+        try:
+            for line in iter_lines(self.stream):
+                if self._closed:
+                    break
+                self._queue.put(line)
+        except Exception as exc:
+            if not self._closed:
+                self._queue.put(f"failure reading logs of {self.cid}: {exc}\n".encode())
+        finally:
+            self._queue.put(EOF)
+
+    def __iter__(self):
+        while True:
+            try:
+                line = self._queue.get(timeout=IDLE if self.follow else None)
+            except Empty:
+                yield None
+                continue
+            if line is EOF:
+                return
+            yield line
+
+    def close(self):
+        self._closed = True
+        self.stream.close()  # unblocks the reading thread
+
+
+def open_logs(cid, start=None, end=None, follow=False):
+    return ReadAhead(cid, since=start, until=end, follow=follow)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="dockerlogs", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("cid", help="Container ID (or name)")
+    parser.add_argument("--since", help="Skip lines before this time (a bare time-of-day is taken to be today)")
+    parser.add_argument("--until", help="Stop at this time")
+    parser.add_argument("--follow", action="store_true", help="Keep streaming new lines")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer
+    logs = open_logs(
+        args.cid, follow=args.follow,
+        start=resolve_time(args.since) if args.since else None,
+        end=resolve_time(args.until) if args.until else None)
+    try:
+        for line in logs:
+            if line is None:
+                out.flush()
+            else:
+                out.write(line)
+        out.flush()
+    except (BrokenPipeError, KeyboardInterrupt):
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    finally:
+        logs.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Listings federated over the `--siblings` servers: a directory's listing is fanned out to each sibling's `/_entry`,
+and what they have there is merged into ours - each entry tagged by its node, and linking to it.
+
+Files are opened where they're best placed: a file on a network mount here is opened by a sibling that has it on a
+local disk (or else by the least loaded one that has it), so decompressing and paging through it happens next to
+the data; the browser is handed that sibling's websocket and worker id.
+
+Siblings are asked in parallel over a single pooled HTTP client (curl's, which keeps connections alive),
+each with its own timeout, so a slow sibling costs no more than that; complete listings are cached briefly.
+Siblings known to be down (see health.py) aren't asked at all.
+"""
+import os
+import time
+import json
+import logging
+from collections import OrderedDict
+from urllib.parse import urlencode, urlparse
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.options import options
+from tornado.process import cpu_count
+from easypy.bunch import Bunch
+
+from .worker import CLIENTS
+from .health import probes
+
+
+MAX_CLIENTS = 64  # concurrent requests, over all siblings
+CONNECT_TIMEOUT = 1  # seconds
+POLL_INTERVAL = 0.1  # seconds, between pages of an incomplete listing
+CACHE_TTL = 30  # seconds, of complete listings
+ERROR_TTL = 5  # seconds, before asking a failing sibling again
+CACHE_SIZE = 1024  # listings
+PLACEMENT_TIMEOUT = 0.5  # seconds, for a sibling to tell whether it has a file
+MOUNTS_TTL = 60  # seconds
+WORKER_LOAD = 0.1  # the load of a single worker, relative to that of a busy cpu
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "ceph", "glusterfs", "lustre", "afs", "davfs",
+    "fuse.sshfs", "fuse.glusterfs", "fuse.s3fs", "fuse.rclone"}
+
+
+class Sibling(Bunch):
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name})"
+
+
+def parse_siblings(spec):
+    """
+    'node2:8888,https://node3' -> the siblings, named by their host:port
+    """
+    siblings = []
+    for s in spec.split(","):
+        s = s.strip().rstrip("/")
+        if not s:
+            continue
+        if "://" not in s:
+            s = f"http://{s}"
+        url = urlparse(s)
+        siblings.append(Sibling(name=url.netloc, url=f"{url.scheme}://{url.netloc}"))
+    return siblings
+
+
+def get_client():
+    # tornado's own client opens a connection per request; curl's keeps them alive
+    try:
+        from tornado.curl_httpclient import CurlAsyncHTTPClient
+    except ImportError:
+        logging.warning("pycurl is not installed - siblings are asked without keep-alive")
+        return AsyncHTTPClient(force_instance=True, max_clients=MAX_CLIENTS)
+    return CurlAsyncHTTPClient(force_instance=True, max_clients=MAX_CLIENTS)
+
+
+def is_unreachable(exc):
+    # as opposed to the sibling answering with an error
+    return not isinstance(exc, HTTPError) or exc.code == 599
+
+
+def tag_entry(sibling, entry):
+    path = "/" + (entry.get("path") or "/".join(entry["base"] + [entry["name"]])).lstrip("/")
+    return dict(
+        entry,
+        node=sibling.name,
+        node_url=sibling.url,
+        href=f"{sibling.url}/#{path}",
+        badges=[sibling.name] + list(entry.get("badges") or ()),
+        keywords=list(entry.get("keywords") or [entry["name"]]) + [sibling.name],
+    )
+
+
+_mounts = (0, [])
+
+
+def get_mounts():
+    # [(mount point, fs type)], the most specific first
+    global _mounts
+    expiration, mounts = _mounts
+    if expiration < time.monotonic():
+        mounts = []
+        try:
+            with open("/proc/self/mounts") as f:
+                for line in f:
+                    _, mountpoint, fstype, *_ = line.split()
+                    mounts.append((mountpoint.replace("\\040", " "), fstype))
+        except OSError:
+            pass
+        mounts.sort(key=lambda m: len(m[0]), reverse=True)
+        _mounts = (time.monotonic() + MOUNTS_TTL, mounts)
+    return mounts
+
+
+def is_local(path):
+    path = os.path.realpath(path)
+    for mountpoint, fstype in get_mounts():
+        if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+            return fstype not in NETWORK_FILESYSTEMS
+    return True
+
+
+def get_load():
+    return dict(loadavg=os.getloadavg()[0], cpus=cpu_count(), workers=sum(len(w) for w in CLIENTS.values()))
+
+
+def load_score(load):
+    return load["loadavg"] / load["cpus"] + WORKER_LOAD * load["workers"]
+
+
+def get_placement_info(fullpath):
+    """
+    Whether we have this file, on a local disk - and how busy we are (see `/_placement` in handler.py)
+    """
+    exists = os.path.isfile(fullpath)
+    return dict(exists=exists, local=exists and is_local(fullpath), load=get_load())
+
+
+class Federation():
+
+    def __init__(self, siblings):
+        self.siblings = siblings
+        self.client = get_client() if siblings else None  # no siblings to ask
+        self._cache = OrderedDict()  # {(sibling name, path): (expiration, listing)}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({', '.join(s.name for s in self.siblings)})"
+
+    def __bool__(self):
+        return bool(self.siblings)
+
+    @property
+    def names(self):
+        return {s.name for s in self.siblings}
+
+    async def list(self, path, exclude=()):
+        """
+        The merged listings of `path` on all siblings (but those named in `exclude`, i.e. ourselves)
+        """
+        siblings = [s for s in self.siblings if s.name not in exclude]
+        listings = await gen.multi([self._get_listing(s, path) for s in siblings])
+        nodes = []
+        entries = []
+        for sibling, listing in zip(siblings, listings):
+            nodes.append(dict(
+                node=sibling.name, url=sibling.url, error=listing.error,
+                incomplete=listing.incomplete, count=len(listing.entries)))
+            entries.extend(listing.entries)
+        return dict(path=path, nodes=nodes, entries=entries, incomplete=any(n["incomplete"] for n in nodes))
+
+    async def _get_listing(self, sibling, path):
+        key = (sibling.name, path)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        listing = await self._fetch_listing(sibling, path)
+        if listing.error:
+            ttl = ERROR_TTL
+        elif not listing.incomplete:
+            ttl = CACHE_TTL
+        else:
+            return listing
+        self._cache[key] = (time.monotonic() + ttl, listing)
+        self._cache.move_to_end(key)
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return listing
+
+    async def _fetch_listing(self, sibling, path):
+        # pages through the sibling's listing until it's complete, or we're out of time
+        deadline = time.monotonic() + options.sibling_timeout
+        entries = []
+        listing = Bunch(entries=[], incomplete=False, error=None)
+        if probes.is_up(sibling.url) is False:
+            listing.error = f"Unreachable: {probes.probes[sibling.url].error}"
+            return listing
+        try:
+            while True:
+                result = await self._fetch(sibling, path, len(entries), deadline)
+                if result.get("error"):
+                    listing.error = str(result["error"])
+                    break
+                if result.get("reset"):
+                    entries = []
+                entries.extend(result.get("entries") or ())
+                listing.incomplete = bool(result.get("incomplete"))
+                if not listing.incomplete or time.monotonic() + POLL_INTERVAL >= deadline:
+                    break
+                await gen.sleep(POLL_INTERVAL)
+        except Exception as exc:
+            logging.warning(f"{sibling}: failed listing {path}: {exc}")
+            listing.error = str(exc)
+            if is_unreachable(exc):
+                probes.report(sibling.url, False, str(exc))
+
+        listing.entries = [
+            tag_entry(sibling, e) for e in entries
+            if e["name"] != ".." and not e.get("power_only") and "m" not in e.get("flags", "")]
+        return listing
+
+    async def _fetch(self, sibling, path, offset, deadline):
+        query = urlencode(dict(path=path, offset=offset, list_only="yes"))
+        response = await self.client.fetch(
+            f"{sibling.url}/_entry?{query}",
+            connect_timeout=CONNECT_TIMEOUT,
+            request_timeout=max(deadline - time.monotonic(), CONNECT_TIMEOUT))
+        return json.loads(response.body)
+
+    async def place(self, path, here, exclude=()):
+        """
+        The sibling that should open `path`, given our own placement info (`here`) - or None, for opening it ourselves
+        """
+        if here["local"]:
+            return None
+        siblings = [s for s in self.siblings if s.name not in exclude]
+        infos = await gen.multi([self._get_placement_info(s, path) for s in siblings])
+        # those that have it locally first, then the least loaded; ourselves on a tie
+        candidates = [
+            (not info["local"], load_score(info["load"]), i, sibling)
+            for i, (sibling, info) in enumerate(zip(siblings, infos)) if info and info["exists"]]
+        if here["exists"]:
+            candidates.append((True, load_score(here["load"]), -1, None))
+        if not candidates:
+            return None
+        return min(candidates)[-1]
+
+    async def _get_placement_info(self, sibling, path):
+        if probes.is_up(sibling.url) is False:
+            return None
+        try:
+            response = await self.client.fetch(
+                f"{sibling.url}/_placement?{urlencode(dict(path=path))}",
+                connect_timeout=PLACEMENT_TIMEOUT, request_timeout=PLACEMENT_TIMEOUT)
+            return json.loads(response.body)
+        except Exception as exc:
+            logging.warning(f"{sibling}: failed placing {path}: {exc}")
+            if is_unreachable(exc):
+                probes.report(sibling.url, False, str(exc))
+            return None
+
+    async def open_on(self, sibling, arguments, client_addr):
+        """
+        Have the sibling spawn the worker (for our client, whose address we forward), and return its `/_entry` result,
+        along with where the client should connect to it
+        """
+        ip, port = client_addr
+        query = urlencode(dict(arguments, placed="yes"), doseq=True)
+        response = await self.client.fetch(
+            f"{sibling.url}/_entry?{query}",
+            headers={"X-Real-Ip": ip, "X-Real-Port": str(port)},
+            connect_timeout=CONNECT_TIMEOUT, request_timeout=options.sibling_timeout)
+        result = json.loads(response.body)
+        scheme = "wss" if sibling.url.startswith("https:") else "ws"
+        return dict(result, node=sibling.name, ws_url=f"{scheme}://{sibling.name}")
+
+
+_federation = None
+
+
+def get_federation():
+    global _federation
+    if _federation is None:
+        _federation = Federation(parse_siblings(options.siblings))
+    return _federation
@@ -1,15 +1,17 @@
 import os
+import sys
+import time
+import shlex
 import logging
-import yaml
 import json
 import random
 from base64 import b64decode
+from datetime import timedelta
 
-from datetime import datetime
 from functools import partial, wraps
+from concurrent.futures import wait, FIRST_COMPLETED
 
 from tornado.options import options
-from tornado.concurrent import run_on_executor
 from tornado.gen import coroutine
 from tornado.locks import Event
 from tornado.util import TimeoutError
@@ -17,17 +19,44 @@ import tornado.web
 
 from plumbum import local
 from easypy.bunch import Bunch
-from easypy.timing import Timer
 from easypy.units import MINUTE
 
 from .utils import to_data_size
+from .settings import base_dir
+from .compression import get_cat_cmd
+from .analyzer import analyzer, to_sparkline
+from .docker_registry import get_registry, format_age
+from .metrics import SCANDIR_SECONDS, STAT_SECONDS
+from . import profiler
+from .scheduler import scheduler, INTERACTIVE
 from .worker import Worker, CLIENTS, recycle_worker
 
 
 WEB_SOCKET_EXPIRATION = 10  # how long before we recycle the worker if no one connected
+CONTAINERS_TIMEOUT = 5  # how long a listing waits for the first look at the docker containers
 
 
-load_yaml = partial(yaml.load, Loader=yaml.SafeLoader)
+def load_yaml(f):
+    import yaml  # deferred (as it's slow to import) until there's a .meteorite to read
+    return yaml.load(f, Loader=yaml.SafeLoader)
+
+
+def Timer(**kwargs):
+    from easypy.timing import Timer  # deferred, as it's slow to import (see startup.py)
+    return Timer(**kwargs)
+
+
+def get_helper_env():
+    # for running our own helpers (see `webslit_cmd`) in the worker
+    env = dict(PYTHONPATH=base_dir, PATH=os.environ.get("PATH", os.defpath))
+    if options.docker_url:
+        env.update(DOCKER_HOST=options.docker_url)
+    return env
+
+
+def webslit_cmd(module, *args):
+    # our own helpers (ziplog.py, timeindex.py...) run under the worker's bash, see PYTHONPATH in `get_argv`
+    return " ".join([sys.executable, "-m", f"webslit.{module}", *map(shlex.quote, map(str, args))])
 
 
 class Argv(tuple):
@@ -42,11 +71,14 @@ class BaseHandler():
     name = None
     static = False
     power_only = False
+    placeable = False  # may be opened on a sibling server (see federation.py)
     follow = False
 
     def __init__(self, fullpath, handler):
         self.fullpath = fullpath
         self.handler = handler
+        if handler.get_argument("follow", "") == "yes":
+            self.follow = True
 
     @property
     def files(self):
@@ -62,13 +94,18 @@ class BaseHandler():
     def get_cmd(self):
         raise NotImplementedError
 
+    def get_source(self):
+        # how the native ziplog (see ziplog.py) reads this handler's content when zipped
+        return f"cmd:{self.get_cmd()}"
+
     def get_argv(self):
         cmd = self.get_cmd()
         follow = "--follow" if self.follow else ""
         return Argv([
             "bash", "-o", "pipefail", "-ce",
             f"(({cmd}) 2>/dev/null || echo 'failure reading {self.fullpath}')"
-            f" | slit {follow} --always-term || (echo 'press <enter> to close'; read)"])
+            f" | slit {follow} --always-term || (echo 'press <enter> to close'; read)"],
+            **get_helper_env())
 
     def get_result(self, cwd):
         ip, port = self.handler.get_client_addr()
@@ -103,6 +140,7 @@ class ZipLogHandler(BaseHandler):
     def __init__(self, fhandlers, handler):
         self.fhandlers = fhandlers
         self.handler = handler
+        self.follow = handler.get_argument("follow", "") == "yes"
 
     @property
     def files(self):
@@ -112,12 +150,18 @@ class ZipLogHandler(BaseHandler):
         listing = " ".join(
             f"echo '{p:02X}> {fh.fullpath}';"
             for p, fh in enumerate(self.fhandlers))
-        inputs = " ".join(
-            f"'{p:02X}> '=<(({fh.get_cmd()}) 2>&1)"
-            for p, fh in enumerate(self.fhandlers))
-        script = f"({listing} echo; (RUST_BACKTRACE=full ziplog -f {inputs}) 2>&1) | slit --always-term"
-        logging.info(script)
-        return Argv(["bash", "-o", "pipefail", "-ce", script])
+        inputs = [arg for fh in self.fhandlers for arg in ("-i", fh.get_source())]
+        for arg in ("start", "end"):
+            value = self.handler.get_argument(arg, None)
+            if value:
+                inputs += [f"--{arg}", value]
+        follow = ""
+        if self.follow:
+            inputs.append("--follow")
+            follow = "--follow"
+        script = f"({listing} echo; {webslit_cmd('ziplog', *inputs)} 2>&1) | slit {follow} --always-term"
+        logging.debug(script)
+        return Argv(["bash", "-o", "pipefail", "-ce", script], **get_helper_env())
 
     def __repr__(self):
         description = " + ".join(self.files)
@@ -130,14 +174,29 @@ class ZipLogHandler(BaseHandler):
 class FileHandler(BaseHandler):
 
     zippable = True
+    placeable = True
+
+    def __init__(self, fullpath, handler):
+        super().__init__(fullpath, handler)
+        self.at = handler.get_argument("at", None)
+        self.byte = int(handler.get_argument("byte", "0"))
 
     @classmethod
     def applies_to(cls, fullpath, handler):
         return fullpath.is_file()
 
     def get_cmd(self):
-        cmd = "gzip -dc" if self.fullpath.suffix == ".gz" else "cat"
-        return f"{cmd} {self.fullpath}; echo"
+        if self.follow:
+            return webslit_cmd("follow", self.fullpath)
+        elif self.at:
+            return webslit_cmd("timeindex", "cat", "--start", self.at, self.fullpath)
+        elif self.byte:
+            # i.e. jumping to an error found by the analyzer (see analyzer.py)
+            return f"{get_cat_cmd(self.fullpath)} {self.fullpath} | tail -c +{self.byte + 1}; echo"
+        return f"{get_cat_cmd(self.fullpath)} {self.fullpath}; echo"
+
+    def get_source(self):
+        return f"file:{self.fullpath}"
 
 
 class BashHandler(FileHandler):
@@ -145,6 +204,7 @@ class BashHandler(FileHandler):
     name = "bash"
     symbol = "__bash__"
     zippable = False
+    placeable = False
     power_only = True
 
     @classmethod
@@ -165,8 +225,16 @@ class DockerHandler(FileHandler):
     name = "docker"
     symbol = "__docker__"
     zippable = False
+    placeable = False
     power_only = True
 
+    def __init__(self, fullpath, handler):
+        super().__init__(fullpath, handler)
+        cid, _, mode = fullpath.name.partition(" ")
+        self.cid = cid
+        self.attach = mode == "attach" or handler.get_argument("attach", "") == "yes"
+        self.zippable = fullpath.parent.name == self.symbol and not self.attach
+
     @classmethod
     def applies_to(cls, fullpath, handler):
         return cls.symbol in {fullpath.parent.name, fullpath.name}
@@ -174,35 +242,58 @@ class DockerHandler(FileHandler):
     @classmethod
     def generate_entries(cls, fullpath, handler, meta):
         if fullpath == handler.root:
-            yield dict(name=cls.symbol, is_dir=True, info="Attach to running docker containers")
+            yield dict(name=cls.symbol, is_dir=True, info="Logs of (or attach to) running docker containers")
 
+    @coroutine
     def get_result(self, cwd):
         if self.fullpath.parent.name == self.symbol:
             return super().get_result(self.handler.root)
-        else:
-            return dict(entries=list(self._get_entries()), meta={})
-
-    def _get_entries(self):
-        spec = "{{.ID}};{{.Names}};{{.Image}};{{.RunningFor}};{{.CreatedAt}}"
-        for out, err in local.cmd.docker["ps", "--format", spec].popen():
-            if out:
-                cid, name, image, age, created = out.split(";")
-                created = datetime.strptime(created.rsplit(maxsplit=1)[0], "%Y-%m-%d %H:%M:%S %z").timestamp()
-                image = image.rsplit(":", 1)[-1]
-                fullpath = self.fullpath[cid]
-                yield Bunch(
-                    name=name,
-                    badges=[image],
-                    info=age,
-                    flags="m",
-                    priority=(-created),
-                    base=self.fullpath.relative_to(self.handler.root).parts,
-                    path=f"/{fullpath.relative_to(self.handler.root)}",
-                )
+
+        registry = get_registry()
+        try:
+            yield registry.ready.wait(timedelta(seconds=CONTAINERS_TIMEOUT))
+        except TimeoutError:
+            pass
+        if registry.error:
+            return dict(entries=[], meta={}, error=f"Cannot list docker containers: {registry.error}")
+        return dict(
+            entries=list(self.get_container_entries(self.fullpath, self.handler)), meta={},
+            containers_version=registry.version)
+
+    @classmethod
+    def get_container_entries(cls, fullpath, handler):
+        now = time.time()
+        for container in get_registry().get_containers():
+            yield Bunch(
+                name=container.name,
+                badges=[container.image.rsplit(":", 1)[-1]],
+                info=format_age(now - container.created),
+                flags="mz",
+                priority=(-container.created),
+                base=fullpath.relative_to(handler.root).parts,
+                path=f"/{fullpath[container.id].relative_to(handler.root)}",
+            )
+
+    def get_cmd(self):
+        # streamed from the docker API (see dockerlogs.py)
+        args = [self.cid]
+        since = self.at or self.handler.get_argument("start", None)
+        until = self.handler.get_argument("end", None)
+        if since:
+            args += ["--since", since]
+        if until:
+            args += ["--until", until]
+        if self.follow:
+            args.append("--follow")
+        return webslit_cmd("dockerlogs", *args)
+
+    def get_source(self):
+        return f"docker:{self.cid}"
 
     def get_argv(self):
-        cid = self.fullpath.name.partition(" ")[0]
-        return Argv(["docker", "attach", cid])
+        if self.attach:
+            return Argv(["docker", "attach", self.cid])
+        return super().get_argv()
 
 
 class StaticFileHandler(FileHandler):
@@ -230,8 +321,10 @@ class TcpDumpFileHandler(FileHandler):
 
     @classmethod
     def applies_to(cls, fullpath, handler):
+        if not super().applies_to(fullpath, handler):
+            return False  # i.e. searching for '*.pcap' (see SearchHandler)
         for sfx in fullpath.suffixes:
-            if sfx in cls.tcpdump_suffixes:
+            if sfx.lstrip(".") in cls.tcpdump_suffixes:
                 return True
         return False
 
@@ -257,11 +350,11 @@ class TcpDumpFileHandler(FileHandler):
         else:
             return Argv(["termshark", "-ta", self.fullpath], **env)
 
+    get_source = BaseHandler.get_source
+
     def get_cmd(self):
-        if self.fullpath.suffix == ".zst":
-            return f"zstdcat {self.fullpath} | tcpdump -tttt -r -"
-        else:
-            return f"tcpdump -tttt -r {self.fullpath}"
+        # summarized once, then served from the cached index (see pcapindex.py)
+        return webslit_cmd("pcapindex", "show", self.fullpath)
 
 
 class PathInfo(Bunch):
@@ -325,8 +418,14 @@ class PathInfo(Bunch):
                             break
                     self.info = f"{i} entries"
                 else:
-                    self.info = to_data_size(fullpath.stat().st_size) or "?"
+                    st = fullpath.stat()
+                    self.info = to_data_size(st.st_size) or "?"
                     self.flags += "l"
+                    if "z" in self.flags and analyzer.applies_to(self.name):
+                        analysis = analyzer.get(fullpath, st)  # if not ready - will be on the next listing
+                        if analysis:
+                            self.sparkline = to_sparkline(analysis)
+                            self.errors = analysis['errors']
             except FileNotFoundError as exc:
                 if self.is_symlink:
                     self.info = f" ⇏ {os.readlink(str(fullpath))}"
@@ -353,10 +452,9 @@ class PagingHandlerMixin():
 
     @classmethod
     def fetcher(cls, func):
-        @run_on_executor(executor="executor")
-        @wraps(func)
-        def inner(self, *args, **kwargs):
+        def run(self, *args, **kwargs):
             expiration = self.expiration
+            profiler.set_tag(f"listing:{self.fullpath}")
             try:
                 return func(self, *args, **kwargs)
             except cls.Aborted:
@@ -365,10 +463,16 @@ class PagingHandlerMixin():
                 logging.exception(f"Exception from {func}")
                 self.error = str(exc)
                 self.set_done(expiration * 2)
+            finally:
+                profiler.clear_tag()
+
+        @wraps(func)
+        def inner(self, *args, **kwargs):
+            # outlives the request that started it, for as long as someone's paging through it (see `is_abandoned`)
+            return scheduler.submit_task(INTERACTIVE, run, (self,) + args, kwargs, abandoned=self.is_abandoned)
         return inner
 
     def __init__(self, fullpath, handler):
-        self.executor = handler.executor
         self.entries = []
         self.meta = {}
         self.error = False
@@ -405,7 +509,7 @@ class PagingHandlerMixin():
         offset = int(self.handler.get_argument("offset", "0"))
         reset = False
         if handler and not handler.is_expired:
-            logging.info(f"found {handler} with {handler._timeout.remain if handler._timeout else 'incomplete'}")
+            logging.debug("found %s with %s", handler, handler._timeout.remain if handler._timeout else "incomplete")
         else:
             reset = offset != 0  # the client must reset its list
             logging.info(f"starting to fetch for {self}")
@@ -419,6 +523,7 @@ class PagingHandlerMixin():
                 pass
 
         handler._heartbeat.reset()
+        self.handler.entry_cache = "miss" if handler is self else "hit"
 
         return dict(
             entries=handler.entries[offset:],
@@ -428,11 +533,16 @@ class PagingHandlerMixin():
             error=handler.error,
         )
 
+    def is_abandoned(self):
+        if not self._heartbeat.expired:
+            return False
+        logging.info(f"no heartbeats - aborting fetching on {self}")
+        self._timeout = Timer(expiration=0)
+        self._event.set()
+        return True
+
     def check_abort(self):
-        if self._heartbeat.expired:
-            logging.info(f"no heartbeats - aborting fetching on {self}")
-            self._timeout = Timer(expiration=0)
-            self._event.set()
+        if self.is_abandoned():
             raise self.Aborted()
 
     def set_done(self, expiration=None):
@@ -491,6 +601,8 @@ class DirectoryHandler(PagingHandlerMixin, BaseHandler):
                     d.update(power_only=True)
                 entries.append(self.PathInfo(fullbase=fullpath, fh=fh, priority=priority, **d))
 
+        started = time.perf_counter()
+        stat_time = 0
         for n, d in enumerate(os.scandir(fullpath), 1):
             if n % 500 == 0:
                 logging.info(f"{fullpath}: {n:4} items... ({d.path})")
@@ -499,13 +611,17 @@ class DirectoryHandler(PagingHandlerMixin, BaseHandler):
                 entries.append(self.PathInfo("classified.txt", fullpath, False, False))
 
             is_dir = d.is_dir(follow_symlinks=True)
+            t = time.perf_counter()
             entry = self.PathInfo(d.name, fullpath, is_dir, d.is_symlink())
             entry.fetch_info(self)
+            stat_time += time.perf_counter() - t
             # self._tasks += 1
             # self.executor.submit(entry.fetch_info, self)
             entries.append(entry)
             self.check_abort()
 
+        SCANDIR_SECONDS.observe(time.perf_counter() - started - stat_time)
+        STAT_SECONDS.observe(stat_time)
         self.set_done()
 
     def _fetch_meta(self):
@@ -534,6 +650,84 @@ class DirectoryHandler(PagingHandlerMixin, BaseHandler):
             super().set_done()
 
 
+class SearchHandler(PagingHandlerMixin, BaseHandler):
+
+    name = "search"
+    symbol = "__search__"
+    zippable = False
+    pending = {}
+    lru = []
+    expiration = MINUTE
+    keepalive_timeout = MINUTE
+    max_in_flight = 64
+
+    def __init__(self, fullpath, handler):
+        super().__init__(fullpath, handler)
+        self.PathInfo = partial(PathInfo, handler=handler)
+        self.root = handler.root
+        parts = list(fullpath.relative_to(self.root).parts)
+        idx = parts.index(self.symbol)
+        self.base = self.root.join(*parts[:idx])
+        self.pattern = "/".join(parts[idx + 1:])
+
+    @classmethod
+    def applies_to(cls, fullpath, handler):
+        return cls.symbol in fullpath.relative_to(handler.root).parts
+
+    @classmethod
+    def generate_entries(cls, fullpath, handler, meta):
+        if cls.symbol not in fullpath.relative_to(handler.root).parts:
+            yield dict(name=cls.symbol, is_dir=True, info="Search within files (type a pattern, then hit Ctrl+Enter)")
+
+    def start_fetching(self):
+        self._search()
+
+    @PagingHandlerMixin.fetcher
+    def _search(self):
+        if not self.pattern:
+            raise ValueError("No search pattern - type it into the filter box, then hit Ctrl+Enter")
+
+        from .search import get_search_pool, count_hits
+
+        pool = get_search_pool()
+        needle = self.pattern.encode("utf-8")
+        in_flight = set()
+        self.meta.update(searched=0, matched=0)
+
+        def collect(futures):
+            for future in futures:
+                path, hits = future.result()
+                self.meta['searched'] += 1
+                if hits <= 0:
+                    continue
+                self.meta['matched'] += 1
+                fullpath = local.path(path)
+                entry = self.PathInfo(fullpath.name, fullpath.parent, priority=-hits, info=f"{hits} hits")
+                self.entries.append(entry)
+
+        try:
+            for dirpath, dirnames, filenames in os.walk(self.base):
+                self.check_abort()
+                dirnames.sort()
+                for name in sorted(filenames):
+                    in_flight.add(pool.submit(count_hits, os.path.join(dirpath, name), needle))
+                    while len(in_flight) >= self.max_in_flight:
+                        done, in_flight = wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+                        collect(done)
+                        self.check_abort()
+
+            while in_flight:
+                done, in_flight = wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+                collect(done)
+                self.check_abort()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+        logging.info(f"{self}: {self.meta['matched']}/{self.meta['searched']} files matched {self.pattern!r}")
+        self.set_done()
+
+
 class GolHandler(BaseHandler):
 
     zippable = False
@@ -555,6 +749,7 @@ HANDLERS = [
     FileHandler,
     BashHandler,
     DockerHandler,
+    SearchHandler,
 ]
 
 
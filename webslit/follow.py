@@ -0,0 +1,207 @@
+"""
+Print a log file and keep printing whatever is appended to it, surviving rotation and truncation:
+
+    python -m webslit.follow /logs/app.log
+
+A compressed file (i.e. a rotated 'app.log.1.gz') is printed first, then its live counterpart ('app.log') is followed.
+"""
+import os
+import re
+import sys
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+import argparse
+
+from .compression import open_stream, is_compressed, get_suffix
+
+
+CHUNK_SIZE = 64 * 1024
+RECHECK_INTERVAL = 5  # seconds; inotify can miss changes made over network filesystems
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+
+rotation_suffix = re.compile(r"[.-]\d+$")
+
+
+class Inotify():
+    """
+    Just enough of inotify(7) to sleep until something happens to the files we watch -
+    we don't parse the events, since we re-examine the files after any of them anyway
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout):
+        if not self._poll.poll(timeout * 1000):
+            return False
+        while True:
+            try:
+                if not os.read(self.fd, 64 * 1024):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Sleeper():
+    # where inotify isn't available
+
+    def add_watch(self, path, mask):
+        return None
+
+    def rm_watch(self, wd):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, 1))
+        return False
+
+    def close(self):
+        pass
+
+
+def get_notifier():
+    try:
+        return Inotify()
+    except (OSError, AttributeError):
+        return Sleeper()
+
+
+def follow(path, idle=False):
+    """
+    Yield the lines of the file, then wait for more, forever.
+    If `idle` is set, yield None whenever we've caught up with the file and are about to wait.
+    """
+    path = os.path.abspath(str(path))
+    notifier = get_notifier()
+    notifier.add_watch(os.path.dirname(path), DIR_EVENTS)
+    f = wd = ino = None
+    pending = b""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    pass
+                else:
+                    ino = os.fstat(f.fileno()).st_ino
+                    try:
+                        wd = notifier.add_watch(path, FILE_EVENTS)
+                    except OSError as exc:
+                        if exc.errno != errno.ENOENT:
+                            raise
+
+            if f is not None:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    *lines, pending = (pending + data).split(b"\n")
+                    for line in lines:
+                        yield line + b"\n"
+
+                if os.fstat(f.fileno()).st_size < f.tell():
+                    # truncated (i.e. 'copytruncate' rotation) - start over
+                    f.seek(0)
+                    pending = b""
+                    continue
+
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current != ino:
+                    # rotated - we've read the old file to its end, so move on to the new one
+                    f.close()
+                    f = None
+                    if wd is not None:
+                        notifier.rm_watch(wd)
+                        wd = None
+                    if pending:
+                        yield pending + b"\n"
+                        pending = b""
+                    continue
+
+            if idle:
+                yield None
+            notifier.wait(RECHECK_INTERVAL)
+    finally:
+        if f is not None:
+            f.close()
+        notifier.close()
+
+
+def find_live_file(path):
+    """
+    The file being written to, for a rotated (compressed) log: 'app.log.1.gz' -> 'app.log'
+    """
+    base = str(path)[:-len(get_suffix(path))]
+    for candidate in (base, rotation_suffix.sub("", base)):
+        if candidate != str(path) and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def follow_lines(path, idle=False):
+    if not is_compressed(path):
+        yield from follow(path, idle=idle)
+        return
+
+    with open_stream(path) as f:
+        yield from f
+    live = find_live_file(path)
+    if live:
+        yield from follow(live, idle=idle)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="follow", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer
+    try:
+        for line in follow_lines(args.path, idle=True):
+            if line is None:
+                out.flush()
+            else:
+                out.write(line)
+    except (BrokenPipeError, KeyboardInterrupt):
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
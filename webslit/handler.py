@@ -1,23 +1,38 @@
+import os
+import time
+import gzip
+import hashlib
 import json
+import mimetypes
 import logging
 import struct
-from datetime import datetime
+from datetime import datetime, timedelta
 import weakref
 import tornado.web
 
 from plumbum import local
 from easypy.bunch import Bunch
 
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, OrderedDict
+from threading import Lock
+from tornado import httputil, iostream
+from tornado.concurrent import run_on_executor
 from tornado.ioloop import IOLoop
 from tornado.options import options
-from tornado.process import cpu_count
 from tornado.gen import coroutine
-from tornado.httpclient import AsyncHTTPClient
+from tornado.util import TimeoutError
 from webslit.utils import (is_valid_port, to_int, UnicodeType, is_same_primary_domain)
 from webslit.worker import CLIENTS
-from webslit.file_handlers import StaticFileHandler, get_handler
+from webslit.file_handlers import StaticFileHandler, DirectoryHandler, SearchHandler, get_handler
+from webslit import metrics, profiler
+from webslit.docker_registry import get_registry
+from webslit.timeindex import get_index
+from webslit.pcapindex import get_pcap_index, UnsupportedCapture
+from webslit.analyzer import analyzer
+from webslit.federation import get_federation, get_placement_info
+from webslit.health import probes
+from webslit.scheduler import scheduler, INTERACTIVE
+from webslit.prefetch import prefetcher
 from . import MAJOR, MINOR, COMMIT, __version__
 
 try:
@@ -32,6 +47,14 @@ except ImportError:
 
 
 DEFAULT_PORT = 22
+MAX_PCAP_PAGE = 100000  # packets
+DOWNLOAD_CHUNK = 1024 * 1024
+LONG_POLL_TIMEOUT = 30  # seconds
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MAX_SIZE = 256 * 1024 * 1024
+COMPRESSED_CACHE_SIZE = 256 * 1024 * 1024  # bytes, of compressed content
+RENDERED_CACHE_SIZE = 64  # pages (i.e. hosts we're reached by, times vue modes)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]  # in order of preference, with the suffix of pre-compressed siblings
 
 swallow_http_errors = True
 redirecting = None
@@ -78,14 +101,18 @@ class MixinHandler(object):
 
         parsed_origin = urlparse(origin)
         netloc = parsed_origin.netloc.lower()
-        logging.debug(f'netloc: {netloc}')
+        logging.debug('netloc: %s', netloc)
 
         host = self.request.headers.get('Host')
-        logging.debug(f'host: {host}')
+        logging.debug('host: %s', host)
 
         if netloc == host:
             return True
 
+        if netloc in get_federation().names:
+            # a sibling's page, connecting to a worker it had us spawn (see federation.py)
+            return True
+
         if self.origin_policy == 'same':
             return False
         elif self.origin_policy == 'primary':
@@ -167,16 +194,29 @@ class ChecksOrigin:
 
 class VueHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
 
-    executor = ThreadPoolExecutor(max_workers=cpu_count() * 5)
-
     def initialize(self, loop, root):
         super().initialize(loop)
         self.root = local.path(root)
-        self.methods = dict(active_sessions=self.get_active_sessions, entry=self.get_entry, ziplog=self.get_entry)
+        self.gone = False
+        # for this request's blocking work, which isn't run if the client's gone by then (see scheduler.py)
+        self.executor = scheduler.executor(INTERACTIVE, abandoned=lambda: self.gone)
+        self.methods = dict(
+            active_sessions=self.get_active_sessions, entry=self.get_entry, ziplog=self.get_entry,
+            seek=self.get_seek, pcap=self.get_pcap, histogram=self.get_histogram,
+            containers=self.get_containers, metrics=self.get_metrics, profile=self.get_profile,
+            siblings=self.get_siblings, placement=self.get_placement, prefetch=self.get_prefetch)
         self.is_power_user = self.get_cookie("power") == "yes"
-        self.is_debug = self.get_cookie("debug") == "yes"
-        if self.is_debug:
-            breakpoint()
+        self.entry_cache = "none"  # set by paging handlers (see PagingHandlerMixin.get_result)
+
+    def prepare(self):
+        profiler.set_tag(f"path:{self.request.path}")
+
+    def on_finish(self):
+        profiler.clear_tag()
+
+    def on_connection_close(self):
+        self.gone = True
+        super().on_connection_close()
 
     @coroutine
     def get(self, view):
@@ -200,8 +240,33 @@ class VueHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
             for w in WsockHandler.ACTIVE),
             key=lambda d: d['age']))
 
+    def get_metrics(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        return metrics.render()
+
+    @coroutine
+    def get_profile(self):
+        # a flamegraph-ready profile of the whole server over the next few seconds (see profiler.py)
+        if not self.is_power_user:
+            raise tornado.web.HTTPError(403)
+        seconds = min(float(self.get_argument("seconds", "10")), profiler.MAX_SECONDS)
+        sampler = profiler.Sampler(tags=self.get_argument("tags", "yes") == "yes")
+        try:
+            sampler.start()
+        except profiler.Busy as exc:
+            raise tornado.web.HTTPError(409, str(exc))
+        logging.info(f"profiling for {seconds}s")
+        try:
+            yield tornado.gen.sleep(seconds)
+        finally:
+            sampler.stop()
+        self.set_header("Content-Type", "text/plain")
+        self.set_header("X-Profile-Samples", sampler.count)
+        return sampler.collapsed()
+
     @coroutine
     def get_entry(self):
+        started = time.perf_counter()
         path = self.get_argument("path", "/")
         fullpath = self.root[path.strip("/")]
 
@@ -217,6 +282,7 @@ class VueHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
             breadcrumbs_tail=None,
             path=path,
             has_power=self.is_power_user,
+            has_siblings=bool(get_federation()),
         )
 
         breadcrumbs = []
@@ -262,15 +328,299 @@ class VueHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
                 pass
             elif fh.static:
                 result.redirect = f"/{fh.fullpath.relative_to(self.root)}"
+            elif self.get_argument("list_only", "") == "yes" and not isinstance(fh, (DirectoryHandler, SearchHandler)):
+                # a sibling asking for a listing (see federation.py) - don't spawn anything
+                result.error = f"Not a directory: {path}"
             else:
-                ret = yield tornado.gen.maybe_future(fh.get_result(cwd=cwd))
+                prefetcher.opened(self.get_client_addr()[0], [str(f) for f in files])
+                ret = None
+                sibling = yield self.place(fh)
+                if sibling:
+                    try:
+                        ret = yield get_federation().open_on(
+                            sibling, {k: [v.decode() for v in vs] for k, vs in self.request.query_arguments.items()},
+                            self.get_client_addr())
+                    except Exception as exc:
+                        logging.warning(f"Failed opening {fh.fullpath} on {sibling}, opening it here: {exc}")
+                if not ret:
+                    ret = yield tornado.gen.maybe_future(fh.get_result(cwd=cwd))
                 result.update(ret)
 
+        metrics.ENTRY_LATENCY.observe(time.perf_counter() - started, cache=self.entry_cache)
         return result.to_dict()
 
+    @coroutine
+    def place(self, fh):
+        # the sibling to open this on, if it's better placed to than we are (see federation.py)
+        federation = get_federation()
+        if not federation or not fh.placeable or self.get_argument("placed", "") == "yes":
+            return None
+        here = get_placement_info(str(fh.fullpath))
+        sibling = yield federation.place(self.get_argument("path", "/"), here, exclude=[self.request.host])
+        return sibling
+
+    def get_prefetch(self):
+        # the client's cursor rests on this file - warm it up for when it's opened (see prefetch.py)
+        path = self.get_argument("path")
+        fullpath = str(self.root[path.strip("/")])
+        return dict(path=path, prefetching=prefetcher.hint(self.get_client_addr()[0], fullpath))
+
+    def get_placement(self):
+        path = self.get_argument("path", "/")
+        return get_placement_info(str(self.root[path.strip("/")]))
+
+    @coroutine
+    def get_siblings(self):
+        # the listings of this directory on the sibling servers, merged (see federation.py)
+        path = self.get_argument("path", "/")
+        ret = yield get_federation().list(path, exclude=[self.request.host])
+        return ret
+
+    @run_on_executor
+    def get_seek(self):
+        path = self.get_argument("path")
+        at = self.get_argument("at")
+        try:
+            index = get_index(self.root[path.strip("/")])
+            ts = index.resolve(at)
+            offset = index.seek(ts)
+        except (OSError, ValueError) as exc:
+            return dict(path=path, at=at, error=str(exc))
+        return dict(path=path, at=at, timestamp=ts, offset=offset, error=False)
+
+    @run_on_executor
+    def get_histogram(self):
+        path = self.get_argument("path")
+        try:
+            analysis = analyzer.get(self.root[path.strip("/")])
+        except OSError as exc:
+            return dict(path=path, error=str(exc))
+        if analysis is None:
+            # being analyzed in the background - the client asks again in a while
+            return dict(path=path, error=False, pending=True)
+        if not analysis:
+            return dict(path=path, error=f"Could not analyze {path}")
+        return dict(analysis, path=path, error=False)
+
+    @coroutine
+    def get_containers(self):
+        # long-polls for changes in the running containers, for refreshing the __docker__ listing
+        if not self.is_power_user:
+            raise tornado.web.HTTPError(403)
+        registry = get_registry()
+        version = int(self.get_argument("version", "0"))
+        if registry.version == version:
+            try:
+                yield registry.changed.wait(timedelta(seconds=LONG_POLL_TIMEOUT))
+            except TimeoutError:
+                pass
+        return dict(version=registry.version, changed=registry.version != version, error=registry.error)
+
+    @coroutine
+    def get_pcap(self):
+        path = self.get_argument("path")
+        start = int(self.get_argument("start", "0"))
+        stop = start + min(int(self.get_argument("count", "1000")), MAX_PCAP_PAGE)
+        as_pcap = self.get_argument("format", "json") == "pcap"
+        fullpath = self.root[path.strip("/")]
+        try:
+            index = yield self.executor.submit(get_pcap_index, fullpath)
+        except (OSError, UnsupportedCapture) as exc:
+            return dict(path=path, error=str(exc))
+        if index is None:
+            # being indexed in the background - the client asks again in a while
+            return dict(path=path, error=False, indexing=True)
+        if not as_pcap:
+            summaries = yield self.executor.submit(index.summaries, start, stop)
+            return dict(path=path, error=False, count=index.count, start=start, summaries=summaries)
+
+        # streamed, rather than gathered in memory - a page may be up to MAX_PCAP_PAGE packets
+        self.set_header("Content-Type", "application/vnd.tcpdump.pcap")
+        self.set_header("Content-Disposition", f'attachment; filename="{fullpath.stem}-{start}-{stop}.pcap"')
+        chunks = index.packets(start, stop)
+        try:
+            while True:
+                chunk = yield self.executor.submit(next, chunks, None)
+                if chunk is None:
+                    break
+                self.write(chunk)
+                yield self.flush()
+        finally:
+            chunks.close()
+
+
+class DownloadHandler(tornado.web.StaticFileHandler):
+    """
+    Serves files for download; unlike tornado's StaticFileHandler, the ETag comes from the file's stat
+    instead of an md5 of its whole content, and the content is read off the IOLoop
+    """
+
+    executor = scheduler.executor(INTERACTIVE)
+
+    # static reports (see StaticFileHandler in file_handlers.py) compressed on the fly
+    compressed = OrderedDict()
+    compressed_size = 0
+    compressed_lock = Lock()
+
+    encoding = None
+    compress = False
+
+    def compute_etag(self):
+        st = self._stat()
+        encoding = f"-{self.encoding}" if self.encoding else ""
+        return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}{encoding}"'
+
+    def get_content_type(self):
+        if self.encoding and not self.compress:
+            # the pre-compressed sibling - what's inside it is what counts
+            mime_type, _ = mimetypes.guess_type(self.absolute_path[:-len(dict(ENCODINGS)[self.encoding])])
+            return mime_type or "application/octet-stream"
+        return super().get_content_type()
+
+    def is_report(self):
+        return any(self.absolute_path.endswith(f".{t.name}") for t in StaticFileHandler.TYPES)
+
+    def negotiate_encoding(self):
+        accepted = {e.partition(";")[0].strip() for e in self.request.headers.get("Accept-Encoding", "").split(",")}
+        st = os.stat(self.absolute_path)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                sibling = os.stat(self.absolute_path + suffix)
+            except OSError:
+                continue
+            if sibling.st_mtime >= st.st_mtime:  # not left behind by a newer report
+                self.absolute_path += suffix
+                self.encoding = encoding
+                return
+        if "gzip" in accepted and COMPRESS_MIN_SIZE <= st.st_size <= COMPRESS_MAX_SIZE:
+            self.encoding = "gzip"
+            self.compress = True
+
+    @classmethod
+    def get_compressed(cls, path, st):
+        key = (path, st.st_ino, st.st_size, st.st_mtime_ns)
+        with cls.compressed_lock:
+            data = cls.compressed.get(key)
+            if data is not None:
+                cls.compressed.move_to_end(key)
+                return data
+        with open(path, "rb") as f:
+            data = gzip.compress(f.read(), compresslevel=6, mtime=0)
+        with cls.compressed_lock:
+            if key not in cls.compressed:
+                cls.compressed[key] = data
+                cls.compressed_size += len(data)
+            while cls.compressed_size > COMPRESSED_CACHE_SIZE and len(cls.compressed) > 1:
+                _, evicted = cls.compressed.popitem(last=False)
+                cls.compressed_size -= len(evicted)
+        return data
+
+    async def get(self, path, include_body=True):
+        # as in tornado 6.0.3, except for streaming the content (see `stream_content`)
+        self.path = self.parse_url_path(path)
+        del path
+        absolute_path = self.get_absolute_path(self.root, self.path)
+        self.absolute_path = self.validate_absolute_path(self.root, absolute_path)
+        if self.absolute_path is None:
+            return
+
+        if self.is_report():
+            self.set_header("Vary", "Accept-Encoding")
+            self.negotiate_encoding()
+            if self.encoding:
+                self.set_header("Content-Encoding", self.encoding)
+
+        self.modified = self.get_modified_time()
+        self.set_headers()
+
+        if self.should_return_304():
+            self.set_status(304)
+            return
+
+        if self.compress:
+            data = await IOLoop.current().run_in_executor(
+                self.executor, self.get_compressed, self.absolute_path, self._stat())
+            self.clear_header("Accept-Ranges")  # we send it whole
+            self.set_header("Content-Length", len(data))
+            if include_body:
+                self.write(data)
+            return
+
+        request_range = None
+        range_header = self.request.headers.get("Range")
+        if range_header:
+            request_range = httputil._parse_request_range(range_header)
+
+        size = self.get_content_size()
+        if request_range:
+            start, end = request_range
+            if start is not None and start < 0:
+                start = max(start + size, 0)
+            if (start is not None and (start >= size or (end is not None and start >= end))) or end == 0:
+                self.set_status(416)  # Range Not Satisfiable
+                self.set_header("Content-Type", "text/plain")
+                self.set_header("Content-Range", f"bytes */{size}")
+                return
+            if end is not None and end > size:
+                end = size
+            if size != (end or size) - (start or 0):
+                self.set_status(206)  # Partial Content
+                self.set_header("Content-Range", httputil._get_content_range(start, end, size))
+        else:
+            start = end = None
+
+        start = start or 0
+        end = size if end is None else end
+        self.set_header("Content-Length", end - start)
+
+        if include_body:
+            await self.stream_content(start, end)
+        else:
+            assert self.request.method == "HEAD"
+
+    async def stream_content(self, start, end):
+        # not sendfile(2), since the IOStream owns the socket - large preads in our own threads will do
+        loop = IOLoop.current()
+        fd = await loop.run_in_executor(self.executor, os.open, self.absolute_path, os.O_RDONLY)
+        try:
+            pos = start
+            while pos < end:
+                chunk = await loop.run_in_executor(self.executor, os.pread, fd, min(DOWNLOAD_CHUNK, end - pos), pos)
+                if not chunk:
+                    break  # truncated under our feet
+                pos += len(chunk)
+                try:
+                    self.write(chunk)
+                    await self.flush()
+                except iostream.StreamClosedError:
+                    return
+        finally:
+            os.close(fd)
+
+
+class ReportRedirectHandler(tornado.web.RequestHandler):
+    """
+    Redirects to the report's download url, versioned by its mtime - so browsers can cache it for good
+    (see `get_cache_time` in tornado's StaticFileHandler)
+    """
+
+    def initialize(self, root):
+        self.root = root
+
+    def get(self, path, *args):
+        try:
+            version = f"?v={os.stat(f'{self.root}/{path}').st_mtime_ns:x}"
+        except OSError:
+            version = ""  # let DownloadHandler deal with it
+        self.redirect(f"/static-files/{path}{version}")
+
 
 class IndexHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
 
+    rendered = OrderedDict()  # {(template, inputs): (html, etag)}
+
     def initialize(self, loop):
         super().initialize(loop)
         assert self.xsrf_token  # force a cookie to be set
@@ -310,18 +660,14 @@ class IndexHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
             preference = "80"
 
         if port != preference:
-            logging.info("%r, %r -> %r", host, port, preference)
-            url = f"http://{host}:{preference}/"
-            try:
-                resp = yield AsyncHTTPClient().fetch(url)
-                resp.rethrow()
-            except Exception:
-                logging.exception(f"Failed to reach {url}")
-            else:
-                return self.redirect(url)
+            # never waits on probing it - we don't redirect until we know it's up (see health.py)
+            url = f"http://{host}:{preference}"
+            if probes.is_up(url):
+                logging.info("%r, %r -> %r", host, port, preference)
+                return self.redirect(f"{url}/")
 
         vue_mode = self.get_cookie("vue", "dev")
-        return super().render(
+        html, etag = self.get_rendered(
             'index.html', debug=self.debug,
             vue_mode=vue_mode, sentry_url=options.sentry_url,
             static_files=[t.name for t in StaticFileHandler.TYPES],
@@ -329,6 +675,27 @@ class IndexHandler(ChecksOrigin, MixinHandler, tornado.web.RequestHandler):
             thishost=thishost, environment=options.sentry_environment,
             release=__version__, major=MAJOR, minor=MINOR, commit=COMMIT,
         )
+        # revalidated on every load - cheap, as the page only changes with the above
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Vary", "Cookie")
+        self.set_header("Etag", etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return self.finish()
+        return self.finish(html)
+
+    def get_rendered(self, template_name, **kwargs):
+        # the page, rendered once for each distinct set of inputs (but always, in debug mode - templates may change)
+        key = (template_name, json.dumps(kwargs, sort_keys=True))
+        cached = self.rendered.get(key)
+        if cached and not self.debug:
+            self.rendered.move_to_end(key)
+            return cached
+        html = self.render_string(template_name, **kwargs)
+        cached = self.rendered[key] = (html, f'"{hashlib.sha1(html).hexdigest()}"')
+        while len(self.rendered) > RENDERED_CACHE_SIZE:
+            self.rendered.popitem(last=False)
+        return cached
 
 
 class WsockHandler(MixinHandler, tornado.websocket.WebSocketHandler):
@@ -367,7 +734,7 @@ class WsockHandler(MixinHandler, tornado.websocket.WebSocketHandler):
                 self.close(reason='Websocket authentication failed.')
 
     def on_message(self, message):
-        logging.debug(f'{len(message)} from {self.src_addr}')
+        logging.debug('%s from %s', len(message), self.src_addr)
         try:
             msg = json.loads(message)
         except JSONDecodeError:
@@ -380,6 +747,7 @@ class WsockHandler(MixinHandler, tornado.websocket.WebSocketHandler):
         worker = self.worker_ref()
         if not worker:
             return
+        worker.last_activity = time.monotonic()
 
         resize = msg.get('resize')
         if resize and len(resize) == 2:
@@ -394,6 +762,12 @@ class WsockHandler(MixinHandler, tornado.websocket.WebSocketHandler):
             worker.data_to_dst.append(data)
             worker.on_write()
 
+    def write_buffer_size(self):
+        try:
+            return len(self.ws_connection.stream._write_buffer)
+        except (AttributeError, TypeError):
+            return 0  # closed, or closing
+
     def on_close(self):
         logging.info('Disconnected from {}:{}'.format(*self.src_addr))
 
@@ -405,3 +779,12 @@ class WsockHandler(MixinHandler, tornado.websocket.WebSocketHandler):
         worker = self.worker_ref() if self.worker_ref else None
         if worker:
             worker.close(reason=self.close_reason)
+
+
+metrics.Gauge(
+    "pending_cache_entries", "Listings held in the paging handlers' caches", ["handler"],
+    callback=lambda: {("directory",): len(DirectoryHandler.pending), ("search",): len(SearchHandler.pending)})
+metrics.Gauge("active_sessions", "Connected websockets", callback=lambda: len(WsockHandler.ACTIVE))
+metrics.Gauge(
+    "ws_write_buffer_total_bytes", "Bytes pending in all websockets' write buffers",
+    callback=lambda: sum(h.write_buffer_size() for h in WsockHandler.ACTIVE))
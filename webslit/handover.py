@@ -0,0 +1,170 @@
+"""
+Zero-downtime restarts: a new server takes over from the running one - its listening sockets, and its workers' PTYs
+along with what we know of them (see `CLIENTS`) - passed over a Unix socket with SCM_RIGHTS. The sessions survive:
+their websockets are closed with a 'handover' reason, and the browser reconnects to the same worker on the new server.
+
+    python run.py --handover_socket=/run/webslit.sock ...   # the running server waits there for a successor
+    python run.py --handover_socket=/run/webslit.sock ...   # ...which takes over from it once started
+
+The workers' processes remain children of the old server, and are reaped by init once it exits - so the server
+mustn't be PID 1 itself (i.e. `docker run --init`, and `docker exec` the successor).
+"""
+import json
+import socket
+import struct
+import logging
+from array import array
+from itertools import count
+
+from tornado.netutil import bind_unix_socket, add_accept_handler
+
+from .worker import Worker, WORKERS, CLIENTS, recycle_worker
+
+
+TIMEOUT = 10  # seconds, for the whole exchange
+RECONNECT_TIMEOUT = 30  # seconds for clients to come back to their workers, before they're recycled
+EXIT_DELAY = 1  # seconds, for the websockets' close frames to go out
+MAX_FDS = 200  # per message (the kernel takes up to 253)
+HEADER = struct.Struct("!I")
+
+
+def send_json(sock, obj):
+    data = json.dumps(obj).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed during handover")
+        data += chunk
+    return data
+
+
+def recv_json(sock):
+    size, = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    return json.loads(recv_exactly(sock, size))
+
+
+def send_fds(sock, fds):
+    # a byte of payload for each batch, to carry the batch's descriptors
+    for i in range(0, len(fds), MAX_FDS):
+        sock.sendmsg([b"F"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", fds[i:i + MAX_FDS]))])
+
+
+def recv_fds(sock, total):
+    fds = array("i")
+    while len(fds) < total:
+        batch = min(MAX_FDS, total - len(fds))
+        msg, ancdata, flags, _ = sock.recvmsg(1, socket.CMSG_SPACE(batch * fds.itemsize))
+        if not msg:
+            raise ConnectionError("Connection closed during handover")
+        if flags & socket.MSG_CTRUNC:
+            raise OSError("File descriptors were lost during handover")
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return list(fds)
+
+
+class HandoverServer():
+    """
+    Waits for a successor at `path`, and hands it everything it needs: `listeners` are [(server, sockets, is_ssl)]
+    """
+
+    def __init__(self, path, listeners, loop):
+        self.path = path
+        self.listeners = listeners
+        self.loop = loop
+        self.socket = bind_unix_socket(path, mode=0o600)
+        self._stop_accepting = add_accept_handler(self.socket, self._on_connection)
+        logging.info(f"Waiting for a successor at {path}")
+
+    def _on_connection(self, connection, address):
+        self.loop.spawn_callback(self._hand_over, connection)
+
+    async def _hand_over(self, connection):
+        # what we hand over is gathered here, on the IOLoop - but the exchange itself waits on our successor (that
+        # acknowledges only once it's serving), so it's done on a thread, leaving the sessions be meanwhile
+        sockets = [(sock, is_ssl) for _, socks, is_ssl in self.listeners for sock in socks]
+        workers = [w for w in WORKERS.values() if not w.closed]
+        state = dict(
+            sockets=[dict(ssl=is_ssl) for _, is_ssl in sockets],
+            workers=[w.get_state() for w in workers])
+        fds = [sock.fileno() for sock, _ in sockets] + [w.fd for w in workers]
+        try:
+            await self.loop.run_in_executor(None, self._exchange, connection, state, fds)
+        except Exception:
+            logging.exception("Handover failed - carrying on")
+            return
+        finally:
+            connection.close()
+
+        logging.warning(f"Handed over {len(sockets)} sockets and {len(workers)} workers to our successor, exiting")
+        # the path is our successor's now - so we let go of our socket, but don't remove it
+        self._stop_accepting()
+        self.socket.close()
+        for server, _, _ in self.listeners:
+            server.stop()
+        for worker in workers:
+            worker.detach(reason="handover")
+        self.loop.call_later(EXIT_DELAY, self.loop.stop)
+
+    @staticmethod
+    def _exchange(connection, state, fds):
+        connection.setblocking(True)
+        connection.settimeout(TIMEOUT)
+        send_json(connection, state)
+        send_fds(connection, fds)
+        if recv_json(connection) != "ok":
+            raise ConnectionError("Our successor did not take over")
+
+
+def take_over(path, loop):
+    """
+    Take over from the server waiting at `path`, if there is one: adopts its workers, and returns its listening
+    sockets as {is_ssl: [sockets]}, along with the connection to it - to `acknowledge` once we're serving on them,
+    which is when it stops. Returns ({}, None) if there's no one there
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return {}, None
+
+    try:
+        connection.settimeout(TIMEOUT)
+        state = recv_json(connection)
+        n_sockets = len(state["sockets"])
+        fds = recv_fds(connection, n_sockets + len(state["workers"]))
+    except BaseException:
+        connection.close()
+        raise
+
+    sockets = {}
+    for info, fd in zip(state["sockets"], fds[:n_sockets]):
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(False)
+        sockets.setdefault(info["ssl"], []).append(sock)
+
+    ids = [-1]
+    for info, fd in zip(state["workers"], fds[n_sockets:]):
+        worker = Worker.adopt(info, fd, loop)
+        CLIENTS.setdefault(worker.src_addr[0], {})[worker.id] = worker
+        loop.call_later(RECONNECT_TIMEOUT, recycle_worker, worker)
+        ids.append(int(worker.id))
+    Worker.indexer = count(max(ids) + 1)  # so new workers' ids don't clash with the adopted ones
+
+    logging.warning(f"Took over {n_sockets} sockets and {len(state['workers'])} workers from {path}")
+    return sockets, connection
+
+
+def acknowledge(connection):
+    """
+    Tell our predecessor we're serving on its sockets - so it can stop
+    """
+    with connection:
+        send_json(connection, "ok")
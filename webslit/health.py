@@ -0,0 +1,96 @@
+"""
+Reachability of other servers (our preferred port, the siblings), probed in the background and cached -
+so asking whether one is up never waits on the network:
+
+    probes.is_up("http://node2:8888")  # True/False - or None, if we don't know yet (it's being probed)
+
+A server that's down is probed again sooner than one that's up, and those nobody asks about are forgotten.
+"""
+import time
+import logging
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.httpclient import AsyncHTTPClient
+
+
+PROBE_TIMEOUT = 2  # seconds
+UP_TTL = 30  # seconds, before re-probing a server that was up
+DOWN_TTL = 5  # seconds, before re-probing a server that was down
+REFRESH_INTERVAL = 5  # seconds
+IDLE_TIMEOUT = 600  # seconds, before forgetting a server nobody asked about
+
+
+class Probe():
+
+    def __init__(self, url):
+        self.url = url
+        self.up = None
+        self.error = None
+        self.expiration = 0
+        self.last_used = time.monotonic()
+        self.probing = False
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.url}, up={self.up})"
+
+    def set(self, up, error=None):
+        if up != self.up:
+            logging.info(f"{self.url} is {'up' if up else 'down'}{f' ({error})' if error else ''}")
+        self.up = up
+        self.error = error
+        self.expiration = time.monotonic() + (UP_TTL if up else DOWN_TTL)
+
+
+class HealthProbes():
+
+    def __init__(self):
+        self.probes = {}  # {base url: Probe}
+        self._refresher = None
+
+    def is_up(self, url):
+        probe = self.probes.get(url)
+        if probe is None:
+            probe = self.probes[url] = Probe(url)
+        probe.last_used = time.monotonic()
+        if probe.expiration < probe.last_used:
+            self._probe(probe)
+        return probe.up
+
+    def report(self, url, up, error=None):
+        """
+        What we learned of a server by talking to it anyway (i.e. it failed a request)
+        """
+        probe = self.probes.get(url)
+        if probe is not None:
+            probe.set(up, error)
+
+    def _probe(self, probe):
+        if self._refresher is None:
+            self._refresher = PeriodicCallback(self._refresh, REFRESH_INTERVAL * 1000)
+            self._refresher.start()
+        if not probe.probing:
+            probe.probing = True
+            IOLoop.current().spawn_callback(self._fetch, probe)
+
+    async def _fetch(self, probe):
+        try:
+            await AsyncHTTPClient().fetch(
+                f"{probe.url}/", method="HEAD", connect_timeout=PROBE_TIMEOUT, request_timeout=PROBE_TIMEOUT)
+        except Exception as exc:
+            probe.set(False, str(exc))
+        else:
+            probe.set(True)
+        finally:
+            probe.probing = False
+
+    def _refresh(self):
+        # keep what's being asked about fresh, so it's known by the time it's asked again
+        now = time.monotonic()
+        for url, probe in list(self.probes.items()):
+            if probe.last_used + IDLE_TIMEOUT < now:
+                del self.probes[url]
+            elif probe.expiration < now:
+                self._probe(probe)
+
+
+probes = HealthProbes()
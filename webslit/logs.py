@@ -0,0 +1,158 @@
+"""
+Logging off the IOLoop: records are handed to a queue, and formatted and written by a background thread - so a busy
+session never waits on the terminal or the disk. Below WARNING, each module (i.e. 'worker', 'handler') may be rate
+limited (--log_rate), and records may be written as JSON lines (--log_json) for log collectors:
+
+    python run.py --log_rate=worker=20,*=200 --log_json
+"""
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from functools import lru_cache
+from collections.abc import Mapping
+from logging.handlers import QueueHandler, QueueListener
+
+from .metrics import Counter
+
+
+FORMAT = "|".join((
+    "%(color)s%(levelname)1.1s",
+    "%(asctime)s.%(msecs)03.0f",
+    "%(thread)X",
+    "%(src)-30s%(end_color)s",
+    "%(message)s"
+))
+IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+DROPPED = Counter("log_records_dropped_total", "Log records dropped by the rate limit", ["module"])
+
+
+@lru_cache(maxsize=1024)
+def shorten(pathname):
+    if "site-packages" in pathname:
+        return "*" + pathname.split("site-packages")[-1]
+    if "python3.7" in pathname:
+        return "*" + pathname.split("python3.7")[-1]
+    return pathname
+
+
+class Formatter():
+    """
+    Stands in for tornado's format string, adding our `src`
+    """
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+
+    def __mod__(self, d):
+        return self.fmt % dict(d, src=f"{shorten(d['pathname'])}:{d['lineno']}")
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = dict(
+            time=record.created,
+            level=record.levelname,
+            thread=record.thread,
+            src=f"{shorten(record.pathname)}:{record.lineno}",
+            message=record.getMessage())
+        if record.exc_info:
+            entry.update(exc=self.formatException(record.exc_info))
+        return json.dumps(entry)
+
+
+def parse_rates(spec):
+    """
+    'worker=20,*=200' -> {'worker': 20, '*': 200} (records per second)
+    """
+    rates = {}
+    for part in filter(None, spec.split(",")):
+        module, _, rate = part.rpartition("=")
+        rates[module.strip() or "*"] = int(rate)
+    return rates
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    At most `rates[module]` records per second from each module - warnings and above always pass
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._windows = {}  # {module: (second, records)}
+        self._dropped = {}  # {module: records dropped since the last one that passed}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.module, self.rates.get("*"))
+        if not rate:
+            return True
+        second = int(time.monotonic())
+        with self._lock:
+            window, records = self._windows.get(record.module, (second, 0))
+            if window != second:
+                records = 0
+            if records >= rate:
+                self._windows[record.module] = (second, records)
+                self._dropped[record.module] = self._dropped.get(record.module, 0) + 1
+                DROPPED.inc(module=record.module)
+                return False
+            self._windows[record.module] = (second, records + 1)
+            dropped = self._dropped.pop(record.module, 0)
+        if dropped:
+            record.msg = f"{record.msg} (and {dropped} more dropped)"
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Unlike `QueueHandler`, leaves formatting to the listener's thread - unless the arguments might change by then
+    """
+
+    def prepare(self, record):
+        # a single mapping argument (for '%(name)s' formatting) is what `record.args` is then
+        args = record.args.values() if isinstance(record.args, Mapping) else record.args or ()
+        if not isinstance(record.msg, str) or not all(isinstance(arg, IMMUTABLE) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(options):
+    """
+    Moves the handlers set up by tornado (`--logging` and friends) behind a queue
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers:
+        return
+
+    stderr_handler = handlers[-1]
+    stderr_handler.setLevel(logging.INFO)
+
+    for h in handlers:
+        if options.log_json:
+            h.setFormatter(JsonFormatter())
+        else:
+            h.formatter._fmt = Formatter(FORMAT)
+
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    rates = parse_rates(options.log_rate)
+    if rates:
+        queue_handler.addFilter(RateLimitFilter(rates))
+
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
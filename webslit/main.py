@@ -1,20 +1,26 @@
 import os
+import sys
 import logging
-import tornado.web
-import tornado.ioloop
-from tornado.process import cpu_count
-import concurrent.futures
-
-from sentry_sdk.integrations.tornado import TornadoIntegration
-import sentry_sdk
-
-from tornado.options import options
-from webslit import handler, __version__
-from webslit.handler import IndexHandler, VueHandler, WsockHandler, NotFoundHandler
-from webslit.settings import get_app_settings, get_server_settings, get_ssl_context
-from webslit.file_handlers import StaticFileHandler
-
-from webslit.scrubbers import start_scrubbers
+from webslit import startup  # first, so the rest of startup is timed (see --startup_profile)
+
+with startup.phase("import tornado"):
+    import tornado.web
+    import tornado.ioloop
+    from tornado.options import options
+    from tornado.httpserver import HTTPServer
+    from tornado.netutil import bind_sockets
+
+with startup.phase("import webslit"):
+    from webslit import handler, __version__
+    from webslit.handler import (
+        IndexHandler, VueHandler, WsockHandler, NotFoundHandler, DownloadHandler, ReportRedirectHandler)
+    from webslit.settings import get_app_settings, get_server_settings, get_ssl_context
+    from webslit.file_handlers import StaticFileHandler
+    from webslit.scrubbers import start_scrubbers
+    from webslit import reaper
+    from webslit.handover import HandoverServer, take_over, acknowledge
+    from webslit.logs import setup_logging
+    from webslit.scheduler import scheduler, INTERACTIVE
 
 
 def make_handlers(loop, options):
@@ -25,8 +31,8 @@ def make_handlers(loop, options):
     static_types_re = "|".join(static_types)
 
     handlers = [
-        (r"/static-files/(.*)", tornado.web.StaticFileHandler, dict(path=options.files)),
-        (rf"/(.*\.({static_types_re}))", tornado.web.RedirectHandler, dict(url="/static-files/{0}")),
+        (r"/static-files/(.*)", DownloadHandler, dict(path=options.files)),
+        (rf"/(.*\.({static_types_re}))", ReportRedirectHandler, dict(root=options.files)),
         (r'/_ws', WsockHandler, dict(loop=loop)),
         (r"/_(\w+)", VueHandler, handler_params),
         (r'/(.*)?', IndexHandler, dict(loop=loop)),
@@ -34,79 +40,92 @@ def make_handlers(loop, options):
     return handlers
 
 
-def app_listen(app, port, address, server_settings):
-    app.listen(port, address, **server_settings)
+def app_listen(app, port, address, server_settings, sockets=None):
+    # returns (server, sockets) - the sockets are bound here, unless taken over from our predecessor
+    server = HTTPServer(app, **server_settings)
+    if sockets is None:
+        sockets = bind_sockets(port, address)
+    server.add_sockets(sockets)
     if not server_settings.get('ssl_options'):
         server_type = 'http'
     else:
         server_type = 'https'
         handler.redirecting = True if options.redirect else False
     logging.info(
-        f'Listening on {address}:{port} ({server_type})'
+        f'Listening on {", ".join(str(s.getsockname()[:2]) for s in sockets)} ({server_type})'
     )
-
-
-class Formatter():
-
-    def __init__(self, fmt):
-        self.fmt = fmt
-
-    def __mod__(self, d):
-        src = d["pathname"]
-        if "site-packages" in src:
-            src = "*" + d["pathname"].split("site-packages")[-1]
-        if "python3.7" in src:
-            src = "*" + d["pathname"].split("python3.7")[-1]
-        src = f"{src}:{d['lineno']}"
-        d = dict(d, src=src)
-        return self.fmt % d
+    return server, sockets
 
 
 def main():
-    options.parse_command_line()
-
-    handlers = logging.getLogger().handlers
-
-    stderr_handler = handlers[-1]
-    stderr_handler.setLevel(logging.INFO)
+    with startup.phase("parse options"):
+        options.parse_command_line()
 
-    for h in handlers:
-        h.formatter._fmt = Formatter("|".join((
-            "%(color)s%(levelname)1.1s",
-            "%(asctime)s.%(msecs)03.0f",
-            "%(thread)X",
-            "%(src)-30s%(end_color)s",
-            "%(message)s"
-        )))
+    setup_logging(options)
 
     if options.sentry_url:
-        sentry_sdk.init(
-            options.sentry_url,
-            release=__version__,
-            environment=options.sentry_environment,
-            integrations=[TornadoIntegration()]
-        )
+        with startup.phase("sentry"):
+            # not even imported unless it's used (its tornado integration is slow to import)
+            import sentry_sdk
+            from sentry_sdk.integrations.tornado import TornadoIntegration
+            sentry_sdk.init(
+                options.sentry_url,
+                release=__version__,
+                environment=options.sentry_environment,
+                integrations=[TornadoIntegration()]
+            )
 
     os.umask(0000)  # especially so that downloads are read-writeable for non-root (since we are root)
 
     logging.info(f"WebSlit {__version__}")
 
-    loop = tornado.ioloop.IOLoop.current()
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_count() * 5)
-    loop.set_default_executor(executor)
-
-    settings = get_app_settings(options)
-    handlers = make_handlers(loop, options)
-    app = tornado.web.Application(handlers, default_handler_class=NotFoundHandler, **settings)
-
-    ssl_ctx = get_ssl_context(options)
-    server_settings = get_server_settings(options)
-    app_listen(app, options.port, options.address, server_settings)
-    if ssl_ctx:
-        server_settings.update(ssl_options=ssl_ctx)
-        app_listen(app, options.sslport, options.ssladdress, server_settings)
-
-    start_scrubbers()
+    with startup.phase("application"):
+        loop = tornado.ioloop.IOLoop.current()
+        # blocking work goes to the scheduler (see scheduler.py), even when no executor is given
+        loop.set_default_executor(scheduler.executor(INTERACTIVE))
+
+        settings = get_app_settings(options)
+        handlers = make_handlers(loop, options)
+        app = tornado.web.Application(handlers, default_handler_class=NotFoundHandler, **settings)
+
+    handover_socket = options.handover_socket
+    if handover_socket and options.startup_profile:
+        # we exit before serving - taking over would end the live server's sessions with nothing to serve them
+        logging.warning("Not handing over with --startup_profile - leaving the server there as it is")
+        handover_socket = None
+
+    taken_over, predecessor = {}, None
+    if handover_socket:
+        with startup.phase("take over"):
+            taken_over, predecessor = take_over(handover_socket, loop)
+
+    with startup.phase("listen"):
+        ssl_ctx = get_ssl_context(options)
+        server_settings = get_server_settings(options)
+        listeners = [(*app_listen(app, options.port, options.address, server_settings, taken_over.get(False)), False)]
+        if ssl_ctx:
+            server_settings.update(ssl_options=ssl_ctx)
+            listeners.append((
+                *app_listen(app, options.sslport, options.ssladdress, server_settings, taken_over.get(True)), True))
+        elif taken_over.get(True):
+            logging.warning("Closing the https sockets we took over - no certificate to serve them with")
+            for sock in taken_over[True]:
+                sock.close()
+
+    if predecessor:
+        acknowledge(predecessor)  # only now that we're serving does our predecessor stop - till then, it carries on
+    if handover_socket:
+        HandoverServer(handover_socket, listeners, loop)
+
+    with startup.phase("scrubbers"):
+        if options.reap_idle or options.memory_budget or options.memory_pressure:
+            reaper.register()
+        start_scrubbers()
+
+    logging.info(f"Ready in {startup.elapsed():.3f}s")
+    if options.startup_profile:
+        print(startup.report(), file=sys.stderr)
+        return
     loop.start()
 
 
@@ -0,0 +1,149 @@
+"""
+Just enough of Prometheus' metric types to expose our hot paths on `/_metrics`, in its text format.
+Updating a metric is a dict lookup and an addition under a lock; gauges with callbacks cost nothing until scraped.
+"""
+import time
+import bisect
+import logging
+from threading import Lock
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(4 ** i for i in range(13))  # 1 byte to 16MB
+
+REGISTRY = []
+
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(f'{k}="{v}"' for k, v in pairs)
+
+
+class Metric():
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = f"webslit_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name})"
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, {}, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labels, key, **extra)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Either set explicitly, or computed when scraped by `callback` - returning a value,
+    or a dict of {label-values-tuple: value}
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if not self.callback:
+            return super().samples()
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key, {}, value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # per-bucket (non-cumulative) counts, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[idx] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                samples.append((f"{self.name}_bucket", key, dict(le=bound), total))
+            samples.append((f"{self.name}_count", key, {}, total))
+            samples.append((f"{self.name}_sum", key, {}, counts[-1]))
+        return samples
+
+
+def render():
+    parts = []
+    for metric in REGISTRY:
+        try:
+            parts.append(metric.render())
+        except Exception:
+            logging.exception(f"Error rendering {metric}")
+    return "\n".join(parts) + "\n"
+
+
+ENTRY_LATENCY = Histogram("entry_seconds", "Latency of /_entry requests", ["cache"])
+SCANDIR_SECONDS = Histogram("scandir_seconds", "Time spent in scandir, per directory listing")
+STAT_SECONDS = Histogram("stat_seconds", "Time spent on stat-ing entries, per directory listing")
+SPAWN_TO_FIRST_BYTE = Histogram("spawn_first_byte_seconds", "Time from spawning a worker to its first output")
+PTY_BYTES = Counter("pty_bytes_total", "Bytes read from (out) and written to (in) worker PTYs", ["direction"])
+PTY_FRAMES = Counter("pty_frames_total", "Reads from (out) and writes to (in) worker PTYs", ["direction"])
+WS_WRITE_BUFFER = Histogram(
+    "ws_write_buffer_bytes", "Bytes pending in the websocket's write buffer, after queueing PTY output",
+    buckets=SIZE_BUCKETS)
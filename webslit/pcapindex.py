@@ -0,0 +1,335 @@
+"""
+Index a packet capture once, so its packet summaries (and packets) can be served instantly afterwards:
+
+    python -m webslit.pcapindex show /captures/eth0.pcap.zst
+    python -m webslit.pcapindex extract /captures/eth0.pcap.zst 1000 2000 > slice.pcap
+
+The index is columnar - packet offsets, timestamps, summary offsets and lengths are stored as flat arrays,
+followed by the one-line (tcpdump) summaries, so a page of summaries is a couple of slices of an mmap.
+"""
+import os
+import sys
+import mmap
+import json
+import fcntl
+import shlex
+import struct
+import logging
+import argparse
+import subprocess
+from array import array
+from threading import Thread, Lock
+from functools import lru_cache
+
+from .compression import open_stream, is_compressed, get_cat_cmd
+from .utils import get_cache_path
+from .scheduler import scheduler, BACKGROUND
+
+
+HEADER_SIZE = 4096
+GLOBAL_HEADER = 24
+RECORD_HEADER = struct.Struct("IIII")
+SKIP_CHUNK = 1024 * 1024
+TCPDUMP = ["tcpdump", "-tttt", "-r", "-"]
+
+_builds = {}  # {(path, size, mtime): the future of its index build}
+_builds_lock = Lock()
+
+MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+class UnsupportedCapture(Exception):
+    pass
+
+
+def read_exactly(f, size):
+    data = f.read(size)
+    while len(data) < size:
+        more = f.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+class PcapIndex():
+
+    def __init__(self, path):
+        self.path = str(path)
+        st = os.stat(self.path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.meta = None
+        self._mm = None
+
+    def __repr__(self):
+        count = self.meta['count'] if self.meta else '?'
+        return f"{self.__class__.__name__}({self.path}, packets={count})"
+
+    @property
+    def cache_path(self):
+        return get_cache_path("pcapindex", self.path, ".idx")
+
+    def load(self):
+        try:
+            with open(self.cache_path, "rb") as f:
+                meta = json.loads(f.read(HEADER_SIZE))
+                if (meta['size'], meta['mtime']) != (self.size, self.mtime):
+                    return False
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, KeyError):
+            return False
+        self.meta = meta
+        count = meta['count']
+        view = memoryview(self._mm)
+        pos = HEADER_SIZE
+        self.offsets = view[pos:pos + 8 * count].cast('Q')
+        pos += 8 * count
+        self.timestamps = view[pos:pos + 8 * count].cast('d')
+        pos += 8 * count
+        self.summary_offsets = view[pos:pos + 8 * (count + 1)].cast('Q')
+        pos += 8 * (count + 1)
+        self.lengths = view[pos:pos + 4 * count].cast('I')
+        pos += 4 * count
+        self.blob = view[pos:]
+        return True
+
+    def build(self, out=None):
+        """
+        Parse the capture and have tcpdump summarize it, in a single pass; summaries are written to `out`
+        as they come, so the first open of a capture is no slower than running tcpdump on it
+        """
+        offsets, timestamps, lengths = array('Q'), array('d'), array('I')
+        summary_offsets = array('Q', [0])
+        blob_path = f"{self.cache_path}.blob"
+
+        stream = open_stream(self.path)
+        header = read_exactly(stream, GLOBAL_HEADER)
+        if header[:4] not in MAGICS:
+            stream.close()
+            raise UnsupportedCapture(f"Not a (classic) pcap file: {self.path}")
+        endian, resolution = MAGICS[header[:4]]
+        record_header = struct.Struct(endian + "IIII")
+        linktype, = struct.unpack(endian + "I", header[20:24])
+
+        tcpdump = subprocess.Popen(TCPDUMP, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def feed():
+            pos = GLOBAL_HEADER
+            try:
+                tcpdump.stdin.write(header)
+                while True:
+                    raw = read_exactly(stream, record_header.size)
+                    if len(raw) < record_header.size:
+                        break
+                    ts_sec, ts_frac, incl_len, orig_len = record_header.unpack(raw)
+                    data = read_exactly(stream, incl_len)
+                    offsets.append(pos)
+                    timestamps.append(ts_sec + ts_frac * resolution)
+                    lengths.append(incl_len)
+                    pos += record_header.size + len(data)
+                    tcpdump.stdin.write(raw)
+                    tcpdump.stdin.write(data)
+            except BrokenPipeError:
+                pass
+            finally:
+                stream.close()
+                tcpdump.stdin.close()
+
+        feeder = Thread(target=feed, name="pcap-feeder", daemon=True)
+        feeder.start()
+
+        with open(blob_path, "wb") as blob:
+            summary = None
+            total = 0
+
+            def add(summary):
+                nonlocal total, out
+                blob.write(summary)
+                total += len(summary)
+                summary_offsets.append(total)
+                if out:
+                    try:
+                        out.write(summary)
+                    except BrokenPipeError:
+                        out = None  # no one's watching, but we'll finish the index for next time
+
+            for line in tcpdump.stdout:
+                if line[:1].isdigit() or summary is None:
+                    if summary is not None:
+                        add(summary)
+                    summary = line
+                else:
+                    # a continuation of the previous packet's summary
+                    summary = summary.rstrip(b"\n") + b" " + line.lstrip()
+            if summary is not None:
+                add(summary)
+
+        feeder.join()
+        tcpdump.wait()
+
+        count = len(offsets)
+        if len(summary_offsets) - 1 != count:
+            logging.warning(f"{self}: {count} packets, but {len(summary_offsets) - 1} summaries")
+            del summary_offsets[count + 1:]
+            while len(summary_offsets) < count + 1:
+                summary_offsets.append(summary_offsets[-1])
+
+        meta = dict(
+            size=self.size, mtime=self.mtime, count=count, linktype=linktype,
+            endian=endian, resolution=resolution, header=header.hex())
+        path = self.cache_path
+        try:
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(json.dumps(meta).encode().ljust(HEADER_SIZE))
+                offsets.tofile(f)
+                timestamps.tofile(f)
+                summary_offsets.tofile(f)
+                lengths.tofile(f)
+                with open(blob_path, "rb") as blob:
+                    while True:
+                        chunk = blob.read(SKIP_CHUNK)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+            os.rename(f"{path}.tmp", path)
+        finally:
+            os.unlink(blob_path)
+        self.load()
+
+    def ensure(self, out=None):
+        """
+        Load the index, building it first if there's none - builds of the same capture (i.e. by a worker's `show` and
+        the server's `/_pcap`) take turns on a lock, and whoever waited loads what the other built
+        """
+        if self.load():
+            return False
+        with open(f"{self.cache_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.load():
+                return False
+            self.build(out=out)
+        return True
+
+    @property
+    def count(self):
+        return self.meta['count']
+
+    def summaries(self, start, stop):
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        data = bytes(self.blob[self.summary_offsets[start]:self.summary_offsets[stop]])
+        return data.decode("utf-8", "replace").splitlines()
+
+    def iter_summaries(self):
+        start = 0
+        while start < self.count:
+            stop = min(start + 10000, self.count)
+            yield bytes(self.blob[self.summary_offsets[start]:self.summary_offsets[stop]])
+            start = stop
+
+    def packets(self, start, stop):
+        """
+        Yield a pcap file (as chunks) holding the packets in the given range
+        """
+        stop = min(stop, self.count)
+        yield bytes.fromhex(self.meta['header'])
+        if start >= stop:
+            return
+        first = self.offsets[start]
+        size = self.offsets[stop - 1] + RECORD_HEADER.size + self.lengths[stop - 1] - first
+        with open_stream(self.path) as f:
+            if is_compressed(self.path):
+                remaining = first
+                while remaining:
+                    chunk = f.read(min(remaining, SKIP_CHUNK))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+            else:
+                f.seek(first)
+            while size > 0:
+                chunk = f.read(min(size, SKIP_CHUNK))
+                if not chunk:
+                    return
+                size -= len(chunk)
+                yield chunk
+
+
+class NotIndexed(Exception):
+    pass
+
+
+@lru_cache(maxsize=16)
+def _get_pcap_index(path, size, mtime):
+    index = PcapIndex(path)
+    if not index.load():
+        raise NotIndexed(path)  # rather than returning None, which would be cached
+    return index
+
+
+def get_pcap_index(path):
+    """
+    A (cached) loaded PcapIndex for the capture - or None while it's being indexed, in the background (a multi-GB
+    capture takes minutes, which shouldn't hold up interactive work). Raises what indexing it raised
+    """
+    st = os.stat(str(path))
+    key = (str(path), st.st_size, st.st_mtime)
+    with _builds_lock:
+        build = _builds.get(key)
+        if build and not build.done():
+            return None
+        _builds.pop(key, None)
+    if build:
+        build.result()  # raises what indexing raised, i.e. UnsupportedCapture
+    try:
+        return _get_pcap_index(*key)
+    except NotIndexed:
+        pass
+    with _builds_lock:
+        if key not in _builds:
+            _builds[key] = scheduler.submit_task(BACKGROUND, PcapIndex(key[0]).ensure)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pcapindex", description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command")
+    show = sub.add_parser("show", help="Print the packet summaries")
+    show.add_argument("path")
+    extract = sub.add_parser("extract", help="Write a pcap file of the given packet range")
+    extract.add_argument("path")
+    extract.add_argument("start", type=int)
+    extract.add_argument("stop", type=int)
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer
+    index = PcapIndex(args.path)
+    try:
+        if args.command == "show":
+            try:
+                if not index.ensure(out=out):
+                    for chunk in index.iter_summaries():
+                        out.write(chunk)
+            except UnsupportedCapture:
+                # i.e. pcapng - leave it all to tcpdump
+                cmd = f"{get_cat_cmd(args.path)} {shlex.quote(args.path)} | {' '.join(TCPDUMP)}"
+                subprocess.run(["bash", "-c", cmd], stdout=out, stderr=subprocess.DEVNULL)
+        else:
+            index.ensure()
+            for chunk in index.packets(args.start, args.stop):
+                out.write(chunk)
+        out.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Warming up a file while the user's cursor rests on it in the navigator, so that opening it doesn't wait on a cold
+page cache (i.e. on network storage): its head and tail are read ahead, and a compressed file's time index is loaded
+if it was built already. A hint supersedes the client's previous one, and what clients read ahead without opening is
+bounded by a budget (--prefetch_budget) - what they do open isn't counted.
+"""
+import os
+import time
+import logging
+
+from tornado.options import options
+
+from .compression import is_compressed
+from .federation import is_local
+from .timeindex import get_index
+from .utils import get_cache_path
+from .scheduler import scheduler, PREFETCH
+from .metrics import Counter
+
+
+MB = 1024 * 1024
+HEAD_BYTES = 2 * MB  # what slit shows first
+TAIL_BYTES = 1 * MB  # what a follow shows first
+CHUNK = 256 * 1024  # reading ahead is cancelled between chunks
+BUDGET_WINDOW = 60  # seconds
+HINT_TTL = 30  # seconds for an open to follow, before the prefetch counts as wasted
+
+PREFETCHES = Counter("prefetches_total", "Prefetch hints, by what came of them", ["outcome"])
+PREFETCH_BYTES = Counter("prefetch_bytes_total", "Bytes read ahead for prefetch hints", ["outcome"])
+
+
+class Prefetch():
+
+    def __init__(self, path):
+        self.path = path
+        self.hinted_at = time.monotonic()
+        self.cancelled = False
+        self.done = False
+        self.bytes = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path}, bytes={self.bytes})"
+
+    def run(self):
+        try:
+            self._warm()
+        except OSError as exc:
+            logging.debug("prefetching %s failed: %s", self.path, exc)
+        finally:
+            self.done = True
+
+    def _warm(self):
+        compressed = is_compressed(self.path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # a decompressor reads from the start, so there's no use for a compressed file's tail
+            ranges = [(0, min(size, HEAD_BYTES))]
+            if not compressed and size > HEAD_BYTES:
+                ranges.append((max(HEAD_BYTES, size - TAIL_BYTES), size))
+            if is_local(self.path):
+                for start, end in ranges:
+                    os.posix_fadvise(f.fileno(), start, end - start, os.POSIX_FADV_WILLNEED)
+                    self.bytes += end - start
+            else:
+                # network filesystems may not read ahead on advice - so we read it ourselves
+                for start, end in ranges:
+                    f.seek(start)
+                    while start < end and not self.cancelled:
+                        data = f.read(min(CHUNK, end - start))
+                        if not data:
+                            break
+                        start += len(data)
+                        self.bytes += len(data)
+        if compressed and not self.cancelled and os.path.exists(get_cache_path("timeindex", self.path, ".idx")):
+            get_index(self.path)  # loads it - building it would mean decompressing the whole file
+
+
+class Prefetcher():
+
+    def __init__(self):
+        self.hints = {}  # {client ip: its last Prefetch}
+        self.spent = {}  # {client ip: (budget window, bytes read ahead in it that weren't opened)}
+
+    def _get_spent(self, client_ip, now):
+        window, spent = self.spent.get(client_ip, (None, 0))
+        return spent if window == int(now // BUDGET_WINDOW) else 0
+
+    def hint(self, client_ip, path):
+        """
+        The client's cursor rests on `path` - returns whether it's being prefetched
+        """
+        if not options.prefetch_budget:
+            return False
+        now = time.monotonic()
+        previous = self.hints.pop(client_ip, None)
+        if previous and previous.path == path and now - previous.hinted_at < HINT_TTL:
+            self.hints[client_ip] = previous
+            return True
+        if previous:
+            # superseded without being opened
+            previous.cancelled = not previous.done
+            outcome = "cancelled" if previous.cancelled else "wasted"
+            PREFETCHES.inc(outcome=outcome)
+            PREFETCH_BYTES.inc(previous.bytes, outcome=outcome)
+            self.spent[client_ip] = (int(now // BUDGET_WINDOW), self._get_spent(client_ip, now) + previous.bytes)
+
+        if self._get_spent(client_ip, now) >= options.prefetch_budget * MB:
+            PREFETCHES.inc(outcome="over_budget")
+            return False
+
+        prefetch = self.hints[client_ip] = Prefetch(path)
+        scheduler.submit_task(PREFETCH, prefetch.run, abandoned=lambda: prefetch.cancelled)
+        return True
+
+    def opened(self, client_ip, paths):
+        prefetch = self.hints.get(client_ip)
+        if prefetch and prefetch.path in paths and time.monotonic() - prefetch.hinted_at < HINT_TTL:
+            del self.hints[client_ip]
+            PREFETCHES.inc(outcome="used")
+            PREFETCH_BYTES.inc(prefetch.bytes, outcome="used")
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,86 @@
+"""
+A statistical profiler for the running server: samples the stacks of all threads (the IOLoop's and the executors')
+every few milliseconds, and reports them in the 'collapsed' format that flamegraph tools take as-is:
+
+    MainThread;[path:/_entry];start (main.py:109);...;scandir (file_handlers.py:480) 17
+"""
+import os
+import sys
+import threading
+from threading import Thread, Lock, Event
+from collections import Counter
+
+
+INTERVAL = 0.005  # seconds between samples
+MAX_SECONDS = 60
+
+_tags = {}  # {thread ident: tag}
+_lock = Lock()
+active = False  # tagging costs nothing while we're not sampling
+
+
+def set_tag(tag):
+    if active:
+        _tags[threading.get_ident()] = tag
+
+
+def clear_tag():
+    if active:
+        _tags.pop(threading.get_ident(), None)
+
+
+class Busy(Exception):
+    pass
+
+
+def format_frame(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class Sampler():
+
+    def __init__(self, interval=INTERVAL, tags=True):
+        self.interval = interval
+        self.tags = tags
+        self.samples = Counter()
+        self.count = 0
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        global active
+        if not _lock.acquire(blocking=False):
+            raise Busy("Already profiling")
+        active = self.tags
+        self._thread.start()
+
+    def stop(self):
+        global active
+        self._stop.set()
+        self._thread.join()
+        active = False
+        _tags.clear()
+        _lock.release()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(format_frame(frame))
+                    frame = frame.f_back
+                tag = _tags.get(ident)
+                if tag:
+                    stack.append(f"[{tag}]")
+                stack.append(names.get(ident, f"thread-{ident:x}"))
+                self.samples[";".join(reversed(stack))] += 1
+            self.count += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
@@ -0,0 +1,117 @@
+"""
+Closes sessions that are taking up memory for no one: those idle for too long (i.e. forgotten in some browser tab),
+and - the idlest first - while all sessions' processes take more than their memory budget, or the host is under
+memory pressure (PSI). The client is told why, before its session closes.
+A session's activity is its client's (input, resizing) - not the output of a followed log.
+"""
+import os
+import time
+import logging
+
+from tornado.options import options
+from easypy.units import MINUTE
+
+from .scrubbers import scrubber
+from .worker import WORKERS
+from .metrics import Counter, Gauge
+
+
+MB = 1024 * 1024
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+PRESSURE_MIN_IDLE = 5 * MINUTE  # under memory pressure, sessions idle at least this long are closed (one per round)
+
+REAPED = Counter("sessions_reaped_total", "Sessions closed by the reaper", ["reason"])
+SESSIONS_RSS = Gauge("sessions_rss_bytes", "Resident memory of all sessions' processes, as of the last reaping round")
+
+
+def get_children():
+    # {pid: [child pids]}, of all processes
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue  # gone already
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])  # the command, in parentheses, may contain anything
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def get_rss(pid, children):
+    # of the process and all its descendants
+    rss = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            pass
+        pids.extend(children.get(pid, ()))
+    return rss
+
+
+def get_memory_pressure():
+    # the share of time (in %) some tasks were stalled on memory, over the last 10 seconds - None if unsupported
+    try:
+        with open("/proc/pressure/memory") as f:
+            for line in f:
+                kind, *fields = line.split()
+                if kind == "some":
+                    return float(dict(f.split("=") for f in fields)["avg10"])
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def format_idle(seconds):
+    return f"{int(seconds // 3600)}h{int(seconds % 3600 // 60):02}m"
+
+
+def choose(workers, usage, now, pressure):
+    """
+    Which workers to close and why: [(worker, kind of reason, reason)]
+    """
+    chosen = []
+    idlest = sorted(workers, key=lambda w: w.last_activity)
+    total = sum(usage.values())
+    budget = options.memory_budget * MB
+    under_pressure = options.memory_pressure and pressure is not None and pressure > options.memory_pressure
+    for worker in idlest:
+        idle = now - worker.last_activity
+        if options.reap_idle and idle > options.reap_idle:
+            kind, reason = "idle", f"idle for {format_idle(idle)}"
+        elif budget and total > budget:
+            kind, reason = "budget", f"over the memory budget ({total // MB}MB of {options.memory_budget}MB)"
+        elif under_pressure and idle > PRESSURE_MIN_IDLE:
+            kind, reason = "pressure", f"memory pressure ({pressure:.1f}%)"
+            under_pressure = False
+        else:
+            continue
+        chosen.append((worker, kind, reason))
+        total -= usage.get(worker.id, 0)
+    return chosen
+
+
+def reap_workers():
+    workers = [w for w in list(WORKERS.values()) if not w.closed]
+    if not workers:
+        SESSIONS_RSS.set(0)
+        return
+
+    children = get_children()
+    usage = {w.id: get_rss(w.pid, children) for w in workers}
+    SESSIONS_RSS.set(sum(usage.values()))
+
+    for worker, kind, reason in choose(workers, usage, time.monotonic(), get_memory_pressure()):
+        logging.warning(f"Reaping worker {worker.id} ({usage[worker.id] // MB}MB): {reason}")
+        REAPED.inc(reason=kind)
+        worker.loop.add_callback(worker.reap, f"closed by webslit: {reason}")
+
+
+def register():
+    scrubber(period=MINUTE)(reap_workers)
@@ -0,0 +1,166 @@
+"""
+A single pool of threads for all blocking work, run by priority class - so that background work (i.e. analyzing logs)
+never delays the listing a user is waiting on:
+
+    interactive     listings, seeks, downloads - whatever a request is waiting for
+    prefetch        warming up files the user is about to open (see prefetch.py) - short, and of no use if late
+    background      indexing and analysis, capped so that it can't take over the pool
+    housekeeping    the scrubbers (see scrubbers.py)
+
+Queued work whose requester went away (see `abandoned`) is dropped rather than run.
+"""
+import time
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Thread, Condition
+
+from tornado.process import cpu_count
+
+from .metrics import Counter, Gauge, Histogram
+
+
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+BACKGROUND = "background"
+HOUSEKEEPING = "housekeeping"
+
+QUEUE_SECONDS = Histogram("scheduler_queue_seconds", "Time tasks spent queued before running", ["cls"])
+CANCELLED = Counter("scheduler_cancelled_total", "Queued tasks dropped, as their requester went away", ["cls"])
+
+
+class Task():
+
+    __slots__ = ("func", "args", "kwargs", "future", "abandoned", "queued_at")
+
+    def __init__(self, func, args, kwargs, abandoned):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.abandoned = abandoned
+        self.queued_at = time.monotonic()
+
+    def run(self):
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except BaseException as exc:
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(result)
+
+
+class SchedulingClass():
+
+    def __init__(self, name, cap):
+        self.name = name
+        self.cap = cap
+        self.queue = deque()
+        self.running = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name}, running={self.running}/{self.cap}, queued={len(self.queue)})"
+
+
+class ClassExecutor(ThreadPoolExecutor):
+    """
+    A scheduling class, as an executor (for `run_on_executor`, `run_in_executor` and the like).
+    A ThreadPoolExecutor in name only - as asyncio insists its default executor is one - its threads are the scheduler's
+    """
+
+    def __init__(self, scheduler, cls, abandoned=None):
+        self.scheduler = scheduler
+        self.cls = cls
+        self.abandoned = abandoned
+
+    def submit(self, func, *args, **kwargs):
+        return self.scheduler.submit_task(self.cls, func, args, kwargs, abandoned=self.abandoned)
+
+    def shutdown(self, wait=True, **kwargs):
+        pass  # the scheduler is shared, and lives as long as the process
+
+
+class Scheduler():
+
+    def __init__(self, max_workers, caps):
+        """
+        `caps` are {class: the most threads it may take} - in order of priority
+        """
+        self.max_workers = max_workers
+        self.classes = OrderedDict((name, SchedulingClass(name, cap)) for name, cap in caps.items())
+        self._cond = Condition()
+        self._threads = []
+        self._idle = 0  # threads waiting for work, not counting those already woken up
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({', '.join(map(repr, self.classes.values()))})"
+
+    def executor(self, cls, abandoned=None):
+        return ClassExecutor(self, cls, abandoned)
+
+    def submit_task(self, cls, func, args=(), kwargs=None, abandoned=None):
+        """
+        Queue `func` in its class; `abandoned`, if given, is asked just before it runs whether it's still wanted
+        """
+        task = Task(func, args, kwargs or {}, abandoned)
+        with self._cond:
+            self.classes[cls].queue.append(task)
+            if not self._wake() and len(self._threads) < self.max_workers:
+                thread = Thread(target=self._work, name=f"scheduler-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        return task.future
+
+    def _wake(self):
+        # call with the lock held - wakes up an idle thread, if there is one; each is counted out as it's woken, so
+        # that a burst of tasks wakes (or starts) a thread for each, rather than them all notifying the same one
+        if not self._idle:
+            return False
+        self._idle -= 1
+        self._cond.notify()
+        return True
+
+    def _next(self):
+        # call with the lock held - the next task to run, in priority order, from classes that are under their caps
+        for cls in self.classes.values():
+            while cls.queue and cls.running < cls.cap:
+                task = cls.queue.popleft()
+                if task.abandoned and task.abandoned():
+                    task.future.cancel()
+                    CANCELLED.inc(cls=cls.name)
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                cls.running += 1
+                QUEUE_SECONDS.observe(time.monotonic() - task.queued_at, cls=cls.name)
+                return cls, task
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                cls, task = self._next()
+                while not task:
+                    self._idle += 1
+                    self._cond.wait()
+                    cls, task = self._next()
+            try:
+                task.run()
+            except Exception:
+                logging.exception(f"Error running {task.func}")
+            finally:
+                with self._cond:
+                    cls.running -= 1
+                    if any(c.queue for c in self.classes.values()):
+                        self._wake()  # another may run, now that this class has room
+
+
+scheduler = Scheduler(
+    max_workers=cpu_count() * 5,
+    caps={INTERACTIVE: cpu_count() * 5, PREFETCH: 2, BACKGROUND: 2, HOUSEKEEPING: 1})
+
+Gauge(
+    "scheduler_queued", "Tasks waiting for a thread", ["cls"],
+    callback=lambda: {(c.name,): len(c.queue) for c in scheduler.classes.values()})
+Gauge(
+    "scheduler_running", "Tasks running", ["cls"],
+    callback=lambda: {(c.name,): c.running for c in scheduler.classes.values()})
@@ -5,7 +5,10 @@ from tornado.util import TimeoutError
 from easypy.decorations import parametrizeable_decorator
 from easypy.units import HOUR, MINUTE
 
+from .scheduler import scheduler, HOUSEKEEPING
+
 SCRUBBERS = []
+housekeeping = scheduler.executor(HOUSEKEEPING)
 
 
 @parametrizeable_decorator
@@ -15,7 +18,7 @@ def scrubber(func=None, period=HOUR):
     def inner():
         loop = tornado.ioloop.IOLoop.current()
         try:
-            yield gen.with_timeout(loop.time() + MINUTE, loop.run_in_executor(None, func))
+            yield gen.with_timeout(loop.time() + MINUTE, loop.run_in_executor(housekeeping, func))
         except TimeoutError:
             logging.warning(f"Timeout error on scrubber: {func}")
 
@@ -0,0 +1,51 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from tornado.options import options
+from tornado.process import cpu_count
+
+from .compression import open_stream
+from .ansi import AnsiStripper
+
+
+CHUNK_SIZE = 1024 * 1024
+
+_pool = None
+
+
+def get_search_pool():
+    global _pool
+    if _pool is None:
+        # 'forkserver' keeps the search processes from inheriting the server's threads and locks
+        _pool = ProcessPoolExecutor(
+            max_workers=options.search_workers or cpu_count(),
+            mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def count_hits(path, needle):
+    """
+    Count the occurrences of `needle` in the (decompressed, decolorized) content of the file at `path`.
+    Runs in a search-pool process, so it only deals in picklable values; returns -1 if the file is unreadable.
+    """
+    hits = 0
+    overlap = len(needle) - 1
+    tail = b""
+    stripper = AnsiStripper()  # so colored log lines match as they look
+    try:
+        with open_stream(path) as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    chunk = stripper.flush()
+                    if not chunk:
+                        break
+                    hits += (tail + chunk).count(needle)
+                    break
+                chunk = tail + stripper.feed(chunk)
+                hits += chunk.count(needle)
+                # too short to hold a whole match, so nothing gets counted twice
+                tail = chunk[-overlap:] if overlap else b""
+    except (OSError, EOFError, ValueError):
+        return path, -1
+    return path, hits
@@ -16,8 +16,20 @@ def print_version(flag):
 
 
 define('files', default='/files', help="Files directory")
-define('siblings', default='', help="Sibling Servers")
+define('siblings', default='', help="Sibling servers (host:port or URLs, separated by comma), whose listings are merged into ours")
+define('sibling_timeout', type=float, default=3.0, help='Seconds to wait for a sibling server\'s listing')
 define('static_types', default='html', help="")
+define('analyze', type=bool, default=False,
+       help='Analyze log files in the background, for volume and severity sparklines (reads each listed log in full)')
+define('docker_url', default='', help='Docker daemon URL, i.e. unix:///var/run/docker.sock (default: from the environment)')
+define('search_workers', type=int, default=0, help='Processes used for searching file contents (0 for cpu count)')
+define('reap_idle', type=int, default=0,
+       help='Close sessions idle (no typing or resizing - a followed log may well be idle) for this many seconds '
+            '(0 for never)')
+define('memory_budget', type=int, default=0,
+       help='MB that all sessions\' processes may take, beyond which the idlest sessions are closed (0 for no limit)')
+define('memory_pressure', type=float, default=0.0,
+       help='Close the idlest sessions while memory pressure (PSI \'some avg10\', in %) is above this (0 to ignore)')
 define('address', default='', help='Listen address')
 define('port', type=int, default=8888,  help='Listen port')
 define('ssladdress', default='', help='SSL listen address')
@@ -42,6 +54,17 @@ separated by comma;
 '*': wildcard policy, matches any domain, allowed in debug mode only.''')
 define('wpintvl', type=int, default=0, help='Websocket ping interval')
 define('maxconn', type=int, default=20, help='Maximum live connections per client')
+define('handover_socket', default='',
+       help='Unix socket for restarting without losing sessions: take over from the server waiting there, if any, '
+            'then wait there for a successor')
+define('startup_profile', type=bool, default=False,
+       help='Report how long each startup phase took, then exit (instead of serving, '
+            'or taking over at --handover_socket)')
+define('prefetch_budget', type=int, default=256,
+       help='MB per minute that each client may have read ahead for files it then did not open (0 to not prefetch)')
+define('log_json', type=bool, default=False, help='Log JSON lines')
+define('log_rate', default='',
+       help='Most records per second logged below WARNING, per module - i.e. worker=20,*=200 (empty for no limit)')
 define('version', type=bool, help='Show version information', callback=print_version)
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,35 @@
+"""
+Timings of the server's startup phases - how long each took, and how many modules it imported - for telling
+what a cold start spends its time on (see --startup_profile):
+
+    python run.py --startup_profile
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+
+started = time.perf_counter()  # i.e. when webslit.main started importing
+phases = []  # [(name, seconds, modules imported)]
+
+
+@contextmanager
+def phase(name):
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases.append((name, time.perf_counter() - start, len(sys.modules) - modules))
+
+
+def elapsed():
+    return time.perf_counter() - started
+
+
+def report():
+    lines = [f"{'phase':30} {'seconds':>8} {'modules':>8}"]
+    for name, seconds, modules in phases:
+        lines.append(f"{name:30} {seconds:8.3f} {modules:8}")
+    lines.append(f"{'total':30} {elapsed():8.3f} {len(sys.modules):8}")
+    return "\n".join(lines)
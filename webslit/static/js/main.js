@@ -6,6 +6,9 @@ var wbs = {};
 var vue_explorer;
 var wbs_connect;
 var schema = 'v1';
+const MAX_RECONNECTS = 8;  // after a server restart (see handover.py)
+const PREFETCH_DELAY = 400;  // ms for the cursor to rest on a file, before warming it up (see prefetch.py)
+const ANALYSIS_POLL = 1000;  // ms between asking for a histogram that's still being analyzed (see analyzer.py)
 
 
 Vue.config.keyCodes = {
@@ -84,6 +87,31 @@ function timeAgo(dateParam) {
 }
 
 
+const SPARKS = '▁▂▃▄▅▆▇█';
+
+
+function format_log_time(ts) {
+  // log timestamps are parsed as UTC (see timestamps.py), so this shows them as they appear in the log
+  return new Date(ts * 1000).toISOString().replace('T', ' ').slice(0, 19);
+}
+
+
+// the log volume over time, as sent along with listed files (see analyzer.py)
+function to_sparkline(sparkline) {
+  var peak = Math.max(...sparkline.lines, 1);
+  return sparkline.lines.map((lines, i) => {
+    var at = sparkline.start + i * sparkline.width;
+    var errors = sparkline.errors[i];
+    return {
+      char: SPARKS[Math.min(SPARKS.length - 1, Math.floor(lines / peak * SPARKS.length))],
+      errors: errors,
+      at: at,
+      title: `${format_log_time(at)}: ${lines} lines` + (errors ? `, ${errors} errors` : ''),
+    };
+  });
+}
+
+
 Vue.component('time-ago', {
   props: ['absolute_time'],
   data: function() {return {tick: 0, timeout_id: null}},
@@ -321,12 +349,14 @@ jQuery(function($){
   window.addEventListener('message', cross_origin_connect, false);
 
 
-  wbs_connect = function(worker_id, encoding, on_reset) {
+  wbs_connect = function(worker_id, encoding, on_reset, ws_base) {
 
-    var ws_url = "ws://" + window.location.host,
+    // the worker may have been spawned on a sibling server, nearer to the file (see federation.py)
+    var ws_url = ws_base || ("ws://" + window.location.host),
         join = (ws_url[ws_url.length-1] === '/' ? '' : '/'),
         url = ws_url + join + '_ws?id=' + worker_id,
-        sock = new window.WebSocket(url),
+        sock,
+        reconnects = 0,
         decoder = window.TextDecoder ? new window.TextDecoder(encoding) : encoding,
         terminal = document.getElementById('terminal'),
         term = new window.Terminal({
@@ -471,31 +501,47 @@ jQuery(function($){
       }
     });
 
-    sock.onopen = function() {
-      term.open(terminal);
-      toggle_fullscreen(term);
-      term.focus();
-    };
-
-    sock.onmessage = function(msg) {
-      read_file_as_text(msg.data, term_write, decoder);
-    };
+    function connect() {
+      sock = new window.WebSocket(url);
 
-    sock.onerror = function(e) {
-      console.error(e);
-    };
+      sock.onopen = function() {
+        if (reconnects) {
+          // back on our worker after a server restart (see handover.py) - changing the size makes slit redraw
+          reconnects = 0;
+          sock.send(JSON.stringify({'resize': [term.cols, term.rows - 1]}));
+          sock.send(JSON.stringify({'resize': [term.cols, term.rows]}));
+          return;
+        }
+        term.open(terminal);
+        toggle_fullscreen(term);
+        term.focus();
+      };
+
+      sock.onmessage = function(msg) {
+        read_file_as_text(msg.data, term_write, decoder);
+      };
+
+      sock.onerror = function(e) {
+        console.error(e);
+      };
+
+      sock.onclose = function(e) {
+        console.log("closed - ", e.reason);
+        if (e.goto) {
+          window.location.href = e.goto;
+        } else if (!wbs.reset) {
+        } else if ((e.reason == 'handover' || reconnects) && reconnects < MAX_RECONNECTS) {
+          reconnects += 1;
+          setTimeout(connect, 250 * reconnects);
+        } else if (e.reason == 'eof') {
+          wbs.reset()
+        } else if (term) {
+          term.expired = true;
+        }
+      };
+    }
 
-    sock.onclose = function(e) {
-      console.log("closed - ", e.reason);
-      if (e.goto) {
-        window.location.href = e.goto;
-      } else if (!wbs.reset) {
-      } else if (e.reason == 'eof') {
-        wbs.reset()
-      } else if (term) {
-        term.expired = true;
-      }
-    };
+    connect();
 
     $(window).resize(function(){
       if (term) {
@@ -534,13 +580,22 @@ jQuery(function($){
       backend: Cookies.get("preferred_port") || window.location.port || "80",
       loading: 0,
       use_regex: false,
+      zip_start: '',
+      zip_end: '',
       // window_position: 0,
       // window_height: 25,
       _by_path: {},
+      _open_args: null,
+      _containers_version: null,
       _scroll_id: null,
-      _filter_id: null
+      _filter_id: null,
+      _prefetch_id: null
     },
     watch: {
+      active: function() {
+        clearTimeout(this.$data._prefetch_id);
+        this.$data._prefetch_id = setTimeout(this.prefetch, PREFETCH_DELAY);
+      },
       requested_filter: function() {
         clearTimeout(this.$data._filter_id);
         this.$data._filter_id = setTimeout(() => {
@@ -671,7 +726,9 @@ jQuery(function($){
         }
         this.previous = this.base;
         this.base = base;
-        fetch('/_entry?path=' + this.base + '&offset=' + offset)
+        var open_args = this.$data._open_args ? '&' + $.param(this.$data._open_args) : '';
+        this.$data._open_args = null;
+        fetch('/_entry?path=' + this.base + '&offset=' + offset + open_args)
         .then(response => {
           if (!response.ok) {
             throw Error(response.statusText);
@@ -716,34 +773,9 @@ jQuery(function($){
             if (e.power_only && !json.has_power) {
               return;
             }
-            e.selected = (e.selectable && by_path[e.path]) ? true : false;
-            e.visible = true;
-            e.static = e.flags.includes("s");
-            e.selectable = e.flags.includes("z");
-            e.is_dir = e.flags.includes("d");
-            e.is_symlink = e.flags.includes("y");
-            e.is_unreachable = e.flags.includes("u");
-            e.is_magic = e.flags.includes("m");
-            if (!e.path) {
-              e.path = e.base.concat(e.name).join('/');
-            }
-            if (!e.keywords) {
-              e.keywords = [e.name.toLowerCase()];
-            } else {
-              e.keywords = e.keywords.map(k => String(k).toLowerCase());
-            }
-            e.base = e.base.join('/');
-            e.static_path = e.flags.includes("l") ? ('/static-files/' + e.path) : null;
-            this.entries.push(e);
-          });
-
-          var active_path = this.active_entry ? this.active_entry.path : null;
-          this.entries.sort(this.compare).forEach((e, i) => {
-            e.index = i;
-            if (e.path == active_path) {
-              this.active = i;
-            }
+            this.entries.push(this.prepare_entry(e));
           });
+          this.sort_entries();
 
           if (json.worker_id) {
             this.loading = 0;
@@ -751,18 +783,24 @@ jQuery(function($){
               if (!abort) {
                 window.location.hash = this.previous;
               }
-            });
+            }, json.ws_url);
           } else {
             if (wbs.reset) {
               wbs.reset(true);
             }
             this.restore_position();
+            if (json.containers_version !== undefined) {
+              this.watch_containers(json.containers_version);
+            }
             if (json.incomplete) {
               this.loading += 1;
               var timeout = 100 * Math.sqrt(this.loading);
               this.$data._refresh_id = setTimeout(() => this.refresh(this.base), timeout);
             } else {
               this.loading = 0;
+              if (json.has_siblings) {
+                this.fetch_siblings(this.base);
+              }
             }
           }
         })
@@ -772,6 +810,77 @@ jQuery(function($){
           this.loading = 0;
         })
       },
+      prepare_entry(e) {
+        e.selected = (e.selectable && this.$data._by_path[e.path]) ? true : false;
+        e.visible = true;
+        e.static = e.flags.includes("s");
+        e.selectable = e.flags.includes("z");
+        e.is_dir = e.flags.includes("d");
+        e.is_symlink = e.flags.includes("y");
+        e.is_unreachable = e.flags.includes("u");
+        e.is_magic = e.flags.includes("m");
+        if (!e.path) {
+          e.path = e.base.concat(e.name).join('/');
+        }
+        if (!e.keywords) {
+          e.keywords = [e.name.toLowerCase()];
+        } else {
+          e.keywords = e.keywords.map(k => String(k).toLowerCase());
+        }
+        e.base = e.base.join('/');
+        e.static_path = e.flags.includes("l") ? ((e.node_url || '') + '/static-files/' + e.path) : null;
+        e.spark = e.sparkline ? to_sparkline(e.sparkline) : null;
+        if (e.node) {
+          // lives on a sibling server - opened there, and not zippable with ours
+          e.path = e.href;
+          e.selected = e.selectable = false;
+        }
+        return e;
+      },
+      sort_entries() {
+        var active_path = this.active_entry ? this.active_entry.path : null;
+        this.entries.sort(this.compare).forEach((e, i) => {
+          e.index = i;
+          if (e.path == active_path) {
+            this.active = i;
+          }
+        });
+      },
+      fetch_siblings(base) {
+        // merge in what the sibling servers have in this directory (see federation.py)
+        fetch('/_siblings?path=' + encodeURIComponent(base))
+        .then(response => response.json())
+        .then(json => {
+          if (this.base != base) {
+            return;
+          }
+          json.nodes.filter(n => n.error).forEach(n => console.warn(`${n.node}: ${n.error}`));
+          this.entries = this.entries.filter(e => !e.node);
+          json.entries.forEach(e => this.entries.push(this.prepare_entry(e)));
+          this.sort_entries();
+          if (json.incomplete) {
+            this.$data._refresh_id = setTimeout(() => this.fetch_siblings(base), 500);
+          }
+        })
+        .catch(error => console.error(error));
+      },
+      watch_containers(version) {
+        // long-poll for containers starting and stopping, while we're looking at them
+        var base = this.base;
+        this.$data._containers_version = version;
+        fetch('/_containers?version=' + version)
+        .then(response => response.json())
+        .then(json => {
+          if (this.base != base || this.$data._containers_version != version) {
+            return;
+          } else if (json.changed) {
+            this.refresh();
+          } else {
+            this.watch_containers(version);
+          }
+        })
+        .catch(error => console.error(error));
+      },
       compare(a, b) {
         return (a.priority - b.priority || b.is_dir - a.is_dir || (a.path < b.path ? -1 : 1));
       },
@@ -805,7 +914,7 @@ jQuery(function($){
         this.save_selection();
         $("#filter").focus();
       },
-      load_files() {
+      load_files(follow) {
         if (! this.all_selected_entries.length) {
           this.error = "Nothing selected! use the '`' (backtick) key to add items to the selection";
         }
@@ -813,6 +922,15 @@ jQuery(function($){
         var data = new FormData();
         data.append("_xsrf", Cookies.get("_xsrf"));
         this.all_selected_entries.forEach(e => {data.append("files[]", e.path)});
+        if (this.zip_start) {
+          data.append("start", this.zip_start);
+        }
+        if (this.zip_end) {
+          data.append("end", this.zip_end);
+        }
+        if (follow) {
+          data.append("follow", "yes");
+        }
 
         fetch('/_ziplog', {
           method: 'post',
@@ -828,6 +946,15 @@ jQuery(function($){
           }
         });
       },
+      search() {
+        var pattern = this.requested_filter.trim();
+        if (!pattern) {
+          this.error = "Nothing to search for! type a pattern into the filter box, then hit Ctrl+Enter";
+          return;
+        }
+        var base = this.base.replace(/__search__\/.*$/, '');
+        window.location.hash = base + '__search__/' + encodeURIComponent(pattern);
+      },
       enter() {
         var active_item = this.active_item();
         if (!active_item) {
@@ -838,6 +965,62 @@ jQuery(function($){
           window.location.href = active_item.href;
         }
       },
+      open_with(args) {
+        var active_item = this.active_item();
+        if (!active_item || !this.active_entry || this.active_entry.is_dir || this.active_entry.is_unreachable) {
+          return;
+        }
+        this.$data._open_args = args;
+        window.location.href = active_item.href;
+      },
+      open_at() {
+        var at = window.prompt("Open at time (e.g. '2020-01-31 14:32:05', or just '14:32:05'):");
+        if (at) {
+          this.open_with({at: at});
+        }
+      },
+      open_at_bucket(p, bucket) {
+        this.set_active(p.index);
+        this.open_with({at: bucket.at});
+      },
+      jump_to_error() {
+        var entry = this.active_entry;
+        if (!entry || entry.is_dir || !entry.selectable) {
+          return;
+        }
+        fetch('/_histogram?path=' + encodeURIComponent(entry.path))
+        .then(response => response.json())
+        .then(json => {
+          if (json.pending) {
+            this.error = `Analyzing ${entry.name}...`;
+            setTimeout(() => {
+              if (this.active_entry && this.active_entry.path == entry.path) {
+                this.jump_to_error();
+              }
+            }, ANALYSIS_POLL);
+            return;
+          }
+          this.error = false;
+          if (json.error) {
+            throw Error(json.error);
+          } else if (!json.jumps.length) {
+            throw Error(`No errors in ${entry.name}`);
+          }
+          var choices = json.jumps.slice(0, 20).map(([offset, ts], i) =>
+            `${i + 1}) ${ts ? format_log_time(ts) : 'byte ' + offset}`);
+          if (json.errors > choices.length) {
+            choices.push(`(showing ${choices.length} of ${json.errors} errors)`);
+          }
+          var choice = window.prompt(`Jump to error in ${entry.name}:\n` + choices.join('\n'), '1');
+          var jump = choice && json.jumps[parseInt(choice) - 1];
+          if (jump) {
+            this.open_with({byte: jump[0]});
+          }
+        })
+        .catch(error => {
+          this.error = error.message;
+        });
+      },
       go_to_parent() {
         var parent = this.breadcrumbs[this.breadcrumbs.length-1];
         if (parent) {
@@ -883,6 +1066,14 @@ jQuery(function($){
         }
         return moved;
       },
+      prefetch() {
+        var e = this.active_entry;
+        if (!e || e.is_dir || e.is_magic || e.is_unreachable || e.static || e.node) {
+          return;
+        }
+        fetch('/_prefetch?path=' + encodeURIComponent(e.path))
+        .catch(error => {console.debug(error)});
+      },
       download(index) {
         var e = this.entries[index];
         var a = document.createElement('a');
@@ -957,6 +1148,10 @@ jQuery(function($){
   $(document).on('keydown', function(e) {
     if (false) {
     } else if (screen.is(":visible")) {
+    } else if ($(e.target).is(".time-window")) {
+        if (e.key == "Enter") {
+          vue_explorer.load_files();
+        }
     } else if (e.key == "x" && e.ctrlKey && e.shiftKey) {
         e.preventDefault();
     } else if (e.key == "PageUp") {
@@ -1013,12 +1208,25 @@ jQuery(function($){
     } else if (e.key == "~") {
         vue_explorer.toggle_selected(true);
         e.preventDefault();
+    } else if (e.key == "a" && e.altKey) {
+        vue_explorer.open_with({attach: 'yes'});
+        e.preventDefault();
+    } else if (e.key == "e" && e.altKey) {
+        vue_explorer.jump_to_error();
+        e.preventDefault();
+    } else if (e.key == "t" && e.altKey) {
+        vue_explorer.open_at();
+        e.preventDefault();
     } else if (e.key == "F1") {
         show_help();
         e.preventDefault();
     } else if (e.key == "Enter") {
       if (e.altKey) {
-        vue_explorer.load_files();
+        vue_explorer.load_files(e.shiftKey);
+      } else if (e.ctrlKey) {
+        vue_explorer.search();
+      } else if (e.shiftKey) {
+        vue_explorer.open_with({follow: 'yes'});
       } else {
         vue_explorer.enter()
       }
@@ -0,0 +1,250 @@
+"""
+Locate the first line at or after a given time in a time-ordered log file:
+
+    python -m webslit.timeindex seek /logs/app.log '2020-01-31 14:32:05'
+    python -m webslit.timeindex cat /logs/app.log.gz --start 14:32:05 --end 14:37:05
+"""
+import os
+import sys
+import json
+import bisect
+import argparse
+from array import array
+from functools import lru_cache
+
+from .compression import open_stream, is_compressed
+from .timestamps import TimestampDetector, resolve_time
+from .utils import get_cache_path
+
+
+STEP = 256 * 1024  # sampling interval for compressed files (in decompressed bytes)
+SCAN_BYTES = 64 * 1024  # where the binary search stops, leaving the rest to a linear scan
+PROBE_LINES = 1000  # how far a probe looks for a timestamped line
+SKIP_CHUNK = 1024 * 1024
+
+
+class TimeIndex():
+    """
+    Plain files are binary-searched directly on disk (O(log n) reads, nothing to build).
+    Compressed files can't be seeked into, so they are sampled once every `step` decompressed bytes,
+    and the samples are cached on disk, keyed by the file's size and mtime.
+    """
+
+    def __init__(self, path, step=STEP):
+        self.path = str(path)
+        st = os.stat(self.path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.step = step
+        self.compressed = is_compressed(self.path)
+        self.timestamps = array('d')
+        self.offsets = array('Q')
+        if self.compressed and not self._load():
+            self._build()
+            self._save()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path}, samples={len(self.offsets)})"
+
+    @property
+    def cache_path(self):
+        return get_cache_path("timeindex", self.path, ".idx")
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "rb") as f:
+                meta = json.loads(f.readline())
+                if (meta['size'], meta['mtime'], meta['step']) != (self.size, self.mtime, self.step):
+                    return False
+                self.timestamps.fromfile(f, meta['count'])
+                self.offsets.fromfile(f, meta['count'])
+        except (OSError, ValueError, KeyError, EOFError):
+            del self.timestamps[:], self.offsets[:]
+            return False
+        return True
+
+    def _save(self):
+        path = self.cache_path
+        try:
+            with open(f"{path}.tmp", "wb") as f:
+                meta = dict(size=self.size, mtime=self.mtime, step=self.step, count=len(self.offsets))
+                f.write(json.dumps(meta).encode() + b"\n")
+                self.timestamps.tofile(f)
+                self.offsets.tofile(f)
+            os.rename(f"{path}.tmp", path)
+        except OSError:
+            pass  # we'll rebuild next time
+
+    def _build(self):
+        detect = TimestampDetector()
+        pos = next_sample = 0
+        with open_stream(self.path) as f:
+            for line in f:
+                if pos >= next_sample:
+                    ts = detect(line)
+                    if ts is not None:
+                        self.timestamps.append(ts)
+                        self.offsets.append(pos)
+                        next_sample = pos + self.step
+                pos += len(line)
+
+    def _probe(self, f, offset, detect):
+        """
+        The first timestamped line that starts after `offset`, as (timestamp, line offset)
+        """
+        f.seek(offset)
+        if offset:
+            f.readline()  # we're probably mid-line
+        pos = f.tell()
+        for _ in range(PROBE_LINES):
+            line = f.readline()
+            if not line:
+                break
+            ts = detect(line)
+            if ts is not None:
+                return ts, pos
+            pos += len(line)
+        return None
+
+    def _skip(self, f, offset):
+        if not self.compressed:
+            f.seek(offset)
+            return
+        while offset:
+            chunk = f.read(min(offset, SKIP_CHUNK))
+            if not chunk:
+                break
+            offset -= len(chunk)
+
+    def first_timestamp(self):
+        if self.compressed:
+            return self.timestamps[0] if self.timestamps else None
+        with open(self.path, "rb") as f:
+            probe = self._probe(f, 0, TimestampDetector())
+        return probe[0] if probe else None
+
+    def resolve(self, when):
+        """
+        Convert a user-given time to a timestamp; a bare time-of-day ('14:32:05') is taken
+        to be on the day the log starts
+        """
+
+        def get_first():
+            first = self.first_timestamp()
+            if first is None:
+                raise ValueError(f"No timestamps in {self.path}")
+            return first
+        return resolve_time(when, get_first)
+
+    def _find_start(self, ts):
+        """
+        An offset from which a linear scan will find the first line at or after `ts`
+        """
+        if self.compressed:
+            idx = bisect.bisect_left(self.timestamps, ts)
+            return self.offsets[idx - 1] if idx else 0
+
+        detect = TimestampDetector()
+        lo, hi = 0, self.size
+        with open(self.path, "rb") as f:
+            while hi - lo > SCAN_BYTES:
+                mid = (lo + hi) // 2
+                probe = self._probe(f, mid, detect)
+                if probe is None or probe[0] >= ts:
+                    hi = mid
+                else:
+                    lo = mid
+        return lo
+
+    def _lines(self, start):
+        with open_stream(self.path) as f:
+            self._skip(f, start)
+            pos = start
+            if start and not self.compressed:
+                pos += len(f.readline())  # compressed samples are at line starts, but here we're mid-line
+            for line in f:
+                yield pos, line
+                pos += len(line)
+
+    def seek(self, ts):
+        """
+        The offset (in decompressed bytes) of the first timestamped line at or after `ts`,
+        or None if there's no such line
+        """
+        detect = TimestampDetector()
+        for pos, line in self._lines(self._find_start(ts)):
+            line_ts = detect(line)
+            if line_ts is not None and line_ts >= ts:
+                return pos
+        return None
+
+    def iter_lines(self, start=None, end=None):
+        """
+        Yield the lines of the file between the two timestamps, stopping at the first line past `end`
+        """
+        detect = TimestampDetector()
+        lines = self._lines(0 if start is None else self._find_start(start))
+        if start is not None:
+            for pos, line in lines:
+                ts = detect(line)
+                if ts is not None and ts >= start:
+                    break
+            else:
+                return
+            if end is not None and ts > end:
+                return
+            yield line
+
+        for pos, line in lines:
+            if end is not None:
+                ts = detect(line)
+                if ts is not None and ts > end:
+                    return
+            yield line
+
+
+@lru_cache(maxsize=128)
+def _get_index(path, size, mtime):
+    return TimeIndex(path)
+
+
+def get_index(path):
+    """
+    A (cached) TimeIndex for the file, rebuilt whenever the file changes
+    """
+    st = os.stat(str(path))
+    return _get_index(str(path), st.st_size, st.st_mtime)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="timeindex", description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command")
+    seek = sub.add_parser("seek", help="Print the offset of the first line at or after the given time")
+    seek.add_argument("path")
+    seek.add_argument("time")
+    cat = sub.add_parser("cat", help="Print the lines within the given time window")
+    cat.add_argument("path")
+    cat.add_argument("--start")
+    cat.add_argument("--end")
+    args = parser.parse_args(argv)
+
+    index = get_index(args.path)
+    if args.command == "seek":
+        offset = index.seek(index.resolve(args.time))
+        print(-1 if offset is None else offset)
+        return 0
+
+    out = sys.stdout.buffer
+    start = index.resolve(args.start) if args.start else None
+    end = index.resolve(args.end) if args.end else None
+    try:
+        for line in index.iter_lines(start, end):
+            out.write(line)
+        out.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
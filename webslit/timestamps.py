@@ -0,0 +1,144 @@
+import re
+import time
+import calendar
+from functools import lru_cache
+
+
+SCAN_WIDTH = 80  # how far into a line we look for its timestamp
+PARSERS = []
+
+time_of_day = re.compile(r"(\d\d?):(\d\d)(?::(\d\d)(?:[.,](\d+))?)?$")
+
+MONTHS = {m: i for i, m in enumerate(b"Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split(), 1)}
+
+
+def parser(pattern):
+    """
+    Register a timestamp parser - a function that converts a match of `pattern` into seconds since the epoch.
+    Parsers are tried in the order of registration.
+    """
+    regex = re.compile(pattern)
+
+    def inner(func):
+        func.regex = regex
+        PARSERS.append(func)
+        return func
+    return inner
+
+
+@lru_cache(maxsize=4096)
+def day_to_epoch(year, month, day):
+    return calendar.timegm((year, month, day, 0, 0, 0))
+
+
+def to_fraction(frac):
+    return float(b"0." + frac) if frac else 0.0
+
+
+def to_offset(tz):
+    if not tz or tz == b"Z":
+        return 0
+    sign = -1 if tz[:1] == b"-" else 1
+    tz = tz[1:].replace(b":", b"")
+    return sign * (int(tz[:2]) * 3600 + int(tz[2:4] or 0) * 60)
+
+
+@parser(rb"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:[.,](\d+))?(Z|[+-]\d\d:?\d\d)?")
+def parse_iso(m):
+    year, month, day, hour, minute, second, frac, tz = m.groups()
+    return (
+        day_to_epoch(int(year), int(month), int(day)) +
+        int(hour) * 3600 + int(minute) * 60 + int(second) +
+        to_fraction(frac) - to_offset(tz))
+
+
+@parser(rb"(\d{4})/(\d\d)/(\d\d)[ -](\d\d):(\d\d):(\d\d)(?:[.,](\d+))?")
+def parse_slashed(m):
+    year, month, day, hour, minute, second, frac = m.groups()
+    return (
+        day_to_epoch(int(year), int(month), int(day)) +
+        int(hour) * 3600 + int(minute) * 60 + int(second) + to_fraction(frac))
+
+
+@parser(rb"\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +(\d\d?) (\d\d):(\d\d):(\d\d)(?:\.(\d+))?")
+def parse_syslog(m):
+    month, day, hour, minute, second, frac = m.groups()
+    # syslog omits the year, so we assume the current one
+    year = time.gmtime().tm_year
+    return (
+        day_to_epoch(year, MONTHS[month], int(day)) +
+        int(hour) * 3600 + int(minute) * 60 + int(second) + to_fraction(frac))
+
+
+@parser(rb"\b(\d\d)(\d\d)(\d\d) (\d\d):(\d\d):(\d\d)(?:\.(\d+))?\b")
+def parse_compact(m):
+    # tornado's default log format, i.e. '200131 14:32:05'
+    year, month, day, hour, minute, second, frac = m.groups()
+    return (
+        day_to_epoch(2000 + int(year), int(month), int(day)) +
+        int(hour) * 3600 + int(minute) * 60 + int(second) + to_fraction(frac))
+
+
+@parser(rb"^\[?(1\d{9})(?:\.(\d+))?\b")
+def parse_epoch(m):
+    seconds, frac = m.groups()
+    return int(seconds) + to_fraction(frac)
+
+
+class TimestampDetector():
+    """
+    Finds the timestamp on a log line.
+    Logs are mostly consistent in their format, so the parser that matched last is tried first.
+    """
+
+    def __init__(self, parsers=None):
+        self.parsers = list(PARSERS if parsers is None else parsers)
+        self.last = None
+
+    def __call__(self, line):
+        last = self.last
+        if last:
+            m = last.regex.search(line, 0, SCAN_WIDTH)
+            if m:
+                return last(m)
+        for p in self.parsers:
+            if p is last:
+                continue
+            m = p.regex.search(line, 0, SCAN_WIDTH)
+            if m:
+                self.last = p
+                return p(m)
+        return None
+
+
+def parse_time(text):
+    """
+    Parse a user-given time (any of the formats we detect in logs) into seconds since the epoch
+    """
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    ts = TimestampDetector()(text.encode("utf-8"))
+    if ts is None:
+        raise ValueError(f"Unrecognized time: {text!r}")
+    return ts
+
+
+def resolve_time(when, reference=None):
+    """
+    Like `parse_time`, but a bare time-of-day ('14:32:05') is taken to be on the day of `reference` -
+    a timestamp, or a function returning one (called only if needed); today, if not given
+    """
+    m = time_of_day.match(when.strip())
+    if not m:
+        return parse_time(when)
+    if callable(reference):
+        reference = reference()
+    hour, minute, second, frac = m.groups()
+    t = time.gmtime(reference)
+    day = day_to_epoch(t.tm_year, t.tm_mon, t.tm_mday)
+    return day + int(hour) * 3600 + int(minute) * 60 + int(second or 0) + float(f"0.{frac or 0}")
@@ -1,6 +1,7 @@
 import os
 import fcntl
 import locale
+import hashlib
 import ipaddress
 import re
 import logging
@@ -17,6 +18,8 @@ except ImportError:
     from urlparse import urlparse
 
 
+CACHE_DIR = os.environ.get("WEBSLIT_CACHE_DIR", os.path.expanduser("~/.cache/webslit"))
+
 numeric = re.compile(r'[0-9]+$')
 allowed = re.compile(r'(?!-)[a-z0-9-]{1,63}(?<!-)$', re.IGNORECASE)
 
@@ -171,6 +174,13 @@ def to_data_size(size):
             return '%.1f %s' % (size / unit, many)
 
 
+def get_cache_path(kind, path, suffix=""):
+    cache_dir = os.path.join(CACHE_DIR, kind)
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = hashlib.sha1(str(path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest + suffix)
+
+
 class NonBlockingReader():
 
     def __init__(self, f, enc='utf-8', block_size=8192):
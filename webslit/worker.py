@@ -13,9 +13,13 @@ import tornado.websocket
 from tornado.ioloop import IOLoop
 from tornado.platform.posix import _set_nonblocking
 
+from . import profiler
+from .metrics import PTY_BYTES, PTY_FRAMES, SPAWN_TO_FIRST_BYTE, WS_WRITE_BUFFER
+
 
 BUF_SIZE = 32 * 1024
 CLIENTS = {}  # {ip: {id: worker}}
+WORKERS = {}  # {id: worker}, connected or not
 
 
 def clear_worker(worker, clients):
@@ -40,6 +44,7 @@ def recycle_worker(worker):
 class Worker(object):
 
     indexer = count()
+    adopted = False  # from the server we took over from (see handover.py) - its process isn't our child
 
     def __init__(self, cwd, argv, loop, files):
         self.files = files
@@ -51,8 +56,10 @@ class Worker(object):
         self.closed = False
         self.encoding = "utf-8"
         self.id = str(next(self.indexer))
+        self.last_activity = time.monotonic()  # of the client (see reaper.py)
 
         logging.info(f">> {' '.join(argv)} ({argv.env})")
+        self.spawned_at = time.monotonic()
         self.pid, self.fd = pty.fork()
         if self.pid == pty.CHILD:
             os.chdir(self.cwd)
@@ -61,19 +68,77 @@ class Worker(object):
         else:
             logging.info(f"<< pid={self.pid}, fd={self.fd}")
             _set_nonblocking(self.fd)
+            WORKERS[self.id] = self
+
+    def get_state(self):
+        # what another process needs for adopting this worker, along with its PTY (see handover.py)
+        return dict(
+            id=self.id, pid=self.pid, cwd=str(self.cwd), files=[str(f) for f in self.files],
+            encoding=self.encoding, src_addr=list(self.src_addr))
+
+    @classmethod
+    def adopt(cls, state, fd, loop):
+        from plumbum import local
+        self = cls.__new__(cls)
+        self.files = [local.path(f) for f in state["files"]]
+        self.loop = loop
+        self.cwd = local.path(state["cwd"])
+        self.data_to_dst = []
+        self.handler = None
+        self.mode = IOLoop.READ
+        self.closed = False
+        self.encoding = state["encoding"]
+        self.id = state["id"]
+        self.pid = state["pid"]
+        self.fd = fd
+        self.src_addr = tuple(state["src_addr"])
+        self.spawned_at = None
+        self.last_activity = time.monotonic()
+        self.adopted = True
+        _set_nonblocking(self.fd)
+        WORKERS[self.id] = self
+        logging.info(f"adopted worker {self.id} (pid={self.pid}, fd={self.fd})")
+        return self
+
+    def detach(self, reason):
+        # handed over to another process (see handover.py) - let go of the PTY, but leave the process be
+        if self.closed:
+            return
+        self.closed = True
+        WORKERS.pop(self.id, None)
+        if self.handler:
+            self.loop.remove_handler(self.fd)
+            self.handler.close(code=1012, reason=reason)  # 'service restart'
+        os.close(self.fd)
 
     @tornado.gen.coroutine
     def __call__(self, fd, events):
-        if events & IOLoop.READ:
-            yield self.on_read()
-        if events & IOLoop.WRITE:
-            self.on_write()
-        if events & IOLoop.ERROR:
-            self.close(reason='error event occurred')
+        profiler.set_tag(f"worker:{self.id}")  # approximately - other callbacks may run while we yield
+        try:
+            if events & IOLoop.READ:
+                yield self.on_read()
+            if events & IOLoop.WRITE:
+                self.on_write()
+            if events & IOLoop.ERROR:
+                self.close(reason='error event occurred')
+        finally:
+            profiler.clear_tag()
 
     def set_handler(self, handler):
         if not self.handler:
             self.handler = handler
+            self.last_activity = time.monotonic()
+
+    def reap(self, reason):
+        # closed by the reaper (see reaper.py) - telling the client why, first
+        if self.closed:
+            return
+        if self.handler:
+            try:
+                self.handler.write_message(f"\r\n\x1b[1;33m[{reason}]\x1b[0m\r\n".encode(), binary=True)
+            except tornado.websocket.WebSocketClosedError:
+                pass
+        self.close(reason=reason)
 
     def update_handler(self, mode):
         if self.mode != mode:
@@ -85,11 +150,11 @@ class Worker(object):
     def resize(self, row, col, xpix=0, ypix=0):
         winsize = struct.pack("HHHH", col, row, xpix, ypix)
         fcntl.ioctl(self.fd, termios.TIOCSWINSZ, winsize)
-        logging.info(f"Resized: {row}/{col}")
+        logging.debug("Resized: %s/%s", row, col)
 
     @tornado.gen.coroutine
     def on_read(self):
-        logging.debug(f'worker {self.id} on read')
+        logging.debug('worker %s on read', self.id)
         sleep, max_sleep = 0.25, 3
         try:
             while True:
@@ -110,23 +175,31 @@ class Worker(object):
             logging.warning(e)
             self.close(reason="eof")
         else:
-            logging.debug(f'{len(data)} from {self.pid}')
+            logging.debug('%s from %s', len(data), self.pid)
             if not data:
                 self.close(reason="no data")
                 return
 
+            PTY_BYTES.inc(len(data), direction="out")
+            PTY_FRAMES.inc(direction="out")
+            if self.spawned_at:
+                SPAWN_TO_FIRST_BYTE.observe(time.monotonic() - self.spawned_at)
+                self.spawned_at = None
+
             try:
-                yield self.handler.write_message(data, binary=True)
+                sending = self.handler.write_message(data, binary=True)
+                WS_WRITE_BUFFER.observe(self.handler.write_buffer_size())
+                yield sending
             except tornado.websocket.WebSocketClosedError:
                 self.close(reason='websocket closed')
 
     def on_write(self):
-        logging.debug(f'worker {self.id} on write')
+        logging.debug('worker %s on write', self.id)
         if not self.data_to_dst:
             return
 
         data = ''.join(self.data_to_dst).encode(self.encoding)
-        logging.debug(f'{len(data)} to {self.pid}')
+        logging.debug('%s to %s', len(data), self.pid)
 
         try:
             sent = os.write(self.fd, data)
@@ -134,6 +207,8 @@ class Worker(object):
             logging.exception(e)
             self.update_handler(IOLoop.WRITE)
         else:
+            PTY_BYTES.inc(sent, direction="in")
+            PTY_FRAMES.inc(direction="in")
             self.data_to_dst = []
             data = data[sent:]
             if data:
@@ -148,7 +223,26 @@ class Worker(object):
         self.closed = True
 
         os.close(self.fd)
+        WORKERS.pop(self.id, None)
 
+        if self.adopted:
+            # not our child to wait for - closing the PTY hung it up, and init reaps it
+            rc = 0
+        else:
+            rc = self._reap()
+
+        logging.info(f'{self.pid} ended (rc={rc})')
+        if rc != 0:
+            reason = f"error/{reason}/{rc}"
+        logging.info(f'Closing worker {self.id} with reason: {reason}')
+        if self.handler:
+            self.loop.remove_handler(self.fd)
+            self.handler.close(reason=reason)
+
+        clear_worker(self, CLIENTS)
+        logging.debug(CLIENTS)
+
+    def _reap(self):
         try:
             ret = os.waitpid(self.pid, os.WNOHANG)
             if ret == (0, 0):
@@ -166,14 +260,4 @@ class Worker(object):
         except ChildProcessError as exc:
             logging.info(f'{self.pid} already gone ({exc})')
             rc = None
-
-        logging.info(f'{self.pid} ended (rc={rc})')
-        if rc != 0:
-            reason = f"error/{reason}/{rc}"
-        logging.info(f'Closing worker {self.id} with reason: {reason}')
-        if self.handler:
-            self.loop.remove_handler(self.fd)
-            self.handler.close(reason=reason)
-
-        clear_worker(self, CLIENTS)
-        logging.debug(CLIENTS)
+        return rc
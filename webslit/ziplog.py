@@ -0,0 +1,277 @@
+"""
+Streaming k-way merge of log files by their timestamps, interleaving their lines into a single output:
+
+    python -m webslit.ziplog -i file:/logs/a.log.gz -i 'cmd:tcpdump -tttt -r /logs/b.pcap' -i docker:3f2a1b9c
+
+Each output line carries the 'NN> ' prefix of the input it came from.
+With --follow, files are tailed and merging goes on as lines are appended to any of them.
+"""
+import os
+import sys
+import time
+import heapq
+import logging
+import argparse
+import subprocess
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Event
+
+from .compression import open_stream, PipeReader
+from .timestamps import TimestampDetector, resolve_time
+from .timeindex import get_index
+from .follow import follow_lines
+from .dockerlogs import open_logs, ReadAhead
+
+
+BATCH_SIZE = 256  # records
+READ_AHEAD = 16  # batches per input
+LAG = 1.0  # seconds; when following, how long an idle input may hold back the others
+EOF = object()
+
+
+def open_source(spec, start=None, end=None, follow=False):
+    kind, _, value = spec.partition(":")
+    if kind == "file":
+        if follow:
+            return follow_lines(value, idle=True)
+        elif start is None and end is None:
+            return open_stream(value)
+        # skip straight to the window instead of decompressing and parsing everything before it
+        return get_index(value).iter_lines(start, end)
+    elif kind == "cmd":
+        return PipeReader(["bash", "-o", "pipefail", "-c", value], stderr=subprocess.STDOUT)
+    elif kind == "docker":
+        # the daemon windows the logs for us
+        return open_logs(value, start, end, follow)
+    else:
+        raise ValueError(f"Unknown input: {spec!r}")
+
+
+class Input():
+
+    def __init__(self, idx, spec, read_ahead=READ_AHEAD, start=None, end=None, follow=False, wakeup=None):
+        self.idx = idx
+        self.spec = spec
+        self.start = start
+        self.end = end
+        self.follow = follow
+        self.prefix = f"{idx:02X}> ".encode()
+        self.stream = None
+        self._closed = False
+        self._wakeup = wakeup
+        self._ready = deque()
+        self._queue = Queue(maxsize=read_ahead)
+        self._thread = Thread(target=self._read, name=f"ziplog-{idx:02X}", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.prefix.decode()}{self.spec})"
+
+    def _put(self, item):
+        self._queue.put(item)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _read(self):
+        batch = []
+        try:
+            self.stream = open_source(self.spec, self.start, self.end, self.follow)
+            for record in self._records(self.stream):
+                if self._closed:
+                    break
+                if record is None:
+                    # caught up with a followed file - let the merge have what we've got
+                    if batch:
+                        self._put(batch)
+                        batch = []
+                    continue
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    self._put(batch)
+                    batch = []
+        except Exception as exc:
+            batch.append((float("-inf"), [f"failure reading {self.spec}: {exc}\n".encode()]))
+        finally:
+            if self.stream is not None:
+                self.stream.close()
+            self._put(batch)
+            self._put(None)
+
+    def _records(self, lines):
+        """
+        Yield (timestamp, lines) records within the time window - a timestamped line along with
+        the lines that follow it and have no timestamp of their own (tracebacks, multi-line messages, etc.)
+        """
+        start = float("-inf") if self.start is None else self.start
+        end = float("inf") if self.end is None else self.end
+        detect = TimestampDetector()
+        ts = float("-inf")
+        record = []
+        for line in lines:
+            if line is None:
+                # an idle followed file, so this record is as complete as it gets for now
+                if record and ts >= start:
+                    yield ts, record
+                    record = []
+                yield None
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            line_ts = detect(line)
+            if line_ts is not None:
+                if record and ts >= start:
+                    yield ts, record
+                if line_ts > end:
+                    return
+                ts, record = line_ts, []
+            record.append(line)
+        if record and ts >= start:
+            yield ts, record
+
+    def __iter__(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            yield from batch
+
+    def poll(self):
+        """
+        The next record if one is available, EOF if there will be no more, or None
+        """
+        while not self._ready:
+            try:
+                batch = self._queue.get_nowait()
+            except Empty:
+                return None
+            if batch is None:
+                self._queue.put(None)  # so we keep returning EOF
+                return EOF
+            self._ready.extend(batch)
+        return self._ready.popleft()
+
+    def close(self):
+        self._closed = True
+        if isinstance(self.stream, (PipeReader, ReadAhead)):
+            self.stream.close()  # unblocks the reader thread; anything else it closes by itself
+
+
+def merge(inputs):
+    """
+    Merge the records of the inputs by timestamp, keeping only the head record of each input in the heap
+    """
+    iters = [iter(i) for i in inputs]
+    heap = []
+    for idx, it in enumerate(iters):
+        rec = next(it, None)
+        if rec is not None:
+            heap.append((rec[0], idx, rec[1]))
+    heapq.heapify(heap)
+
+    while heap:
+        ts, idx, lines = heap[0]
+        yield inputs[idx], lines
+        rec = next(iters[idx], None)
+        if rec is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (rec[0], idx, rec[1]))
+
+
+def merge_live(inputs, wakeup, lag=LAG):
+    """
+    Like `merge`, but for inputs that keep growing: an input that has nothing for us holds back the others
+    for up to `lag` seconds, after which the others go ahead without it.
+    Yields None whenever it's about to wait for more input.
+    """
+    heads = {}
+    live = set(range(len(inputs)))
+    idle_since = {}
+    while live or heads:
+        wakeup.clear()
+        now = time.monotonic()
+        for idx in live.difference(heads):
+            rec = inputs[idx].poll()
+            if rec is EOF:
+                live.discard(idx)
+            elif rec is None:
+                idle_since.setdefault(idx, now)
+            else:
+                heads[idx] = rec
+                idle_since.pop(idx, None)
+
+        waiting = [idx for idx in live if idx not in heads and now - idle_since[idx] < lag]
+        if heads and not waiting:
+            idx = min(heads, key=lambda i: (heads[i][0], i))
+            yield inputs[idx], heads.pop(idx)[1]
+        else:
+            yield None
+            wakeup.wait(lag / 4 if waiting else None)
+
+
+def resolve_window(specs, start, end):
+    """
+    Convert the time window to timestamps; a bare time-of-day is taken to be on the day the first file starts,
+    or today if there are no files
+    """
+    files = [spec.partition(":")[2] for spec in specs if spec.startswith("file:")]
+
+    def resolve(when):
+        if not when:
+            return None
+        elif files:
+            return get_index(files[0]).resolve(when)
+        else:
+            return resolve_time(when)
+
+    return resolve(start), resolve(end)
+
+
+def zip_logs(specs, out, read_ahead=READ_AHEAD, start=None, end=None, follow=False):
+    wakeup = Event() if follow else None
+    inputs = [
+        Input(idx, spec, read_ahead=read_ahead, start=start, end=end, follow=follow, wakeup=wakeup)
+        for idx, spec in enumerate(specs)]
+    records = merge_live(inputs, wakeup) if follow else merge(inputs)
+    try:
+        for item in records:
+            if item is None:
+                out.flush()
+                continue
+            inp, lines = item
+            prefix = inp.prefix
+            out.write(b"".join(prefix + line for line in lines))
+    finally:
+        for inp in inputs:
+            inp.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ziplog", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-i", "--input", action="append", dest="inputs", default=[], metavar="KIND:VALUE",
+                        help="'file:<path>' (decompressed as needed), 'cmd:<shell command>', or 'docker:<container>'")
+    parser.add_argument("--read-ahead", type=int, default=READ_AHEAD, help="Batches of lines buffered per input")
+    parser.add_argument("--start", help="Skip lines before this time")
+    parser.add_argument("--end", help="Stop reading past this time")
+    parser.add_argument("--follow", action="store_true", help="Keep merging as lines are appended to the files")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer
+    try:
+        start, end = resolve_window(args.inputs, args.start, args.end)
+        zip_logs(args.inputs, out, read_ahead=args.read_ahead, start=start, end=end, follow=args.follow)
+        out.flush()
+    except BrokenPipeError:
+        # the pager quit before reading everything - don't fail again when flushing on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        logging.exception("ziplog failed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())